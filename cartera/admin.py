@@ -1,6 +1,9 @@
 from django.contrib import admin
 from .models import (
+    ComprobanteArchivo,
+    ContadorNotificaciones,
     CorreoEnvioLog,
+    CorreoPendiente,
     EventoAuditoria,
     Factura,
     NotificacionProveedor,
@@ -10,6 +13,7 @@ from .models import (
     ProveedorUsuario,
     PuntoVenta,
     PuntoVentaUsuario,
+    SaldoResumen,
 )
 
 
@@ -83,6 +87,15 @@ class CorreoEnvioLogAdmin(admin.ModelAdmin):
     ordering = ("-creado_en", "-id")
 
 
+@admin.register(CorreoPendiente)
+class CorreoPendienteAdmin(admin.ModelAdmin):
+    list_display = ("id", "tipo", "pago", "lote", "estado", "intentos", "proximo_intento", "enviado_en")
+    list_filter = ("tipo", "estado")
+    search_fields = ("pago__factura__numero_factura", "lote__id", "ultimo_error")
+    list_select_related = ("pago", "pago__factura", "lote")
+    ordering = ("-id",)
+
+
 @admin.register(EventoAuditoria)
 class EventoAuditoriaAdmin(admin.ModelAdmin):
     list_display = ("id", "tipo", "factura", "pago", "lote", "usuario", "ip_address", "creado_en")
@@ -107,3 +120,31 @@ class NotificacionProveedorAdmin(admin.ModelAdmin):
     search_fields = ("titulo", "mensaje", "proveedor__nombre", "usuario__username")
     list_select_related = ("proveedor", "usuario", "factura", "pago", "lote")
     ordering = ("-creada_en", "-id")
+
+
+@admin.register(ContadorNotificaciones)
+class ContadorNotificacionesAdmin(admin.ModelAdmin):
+    list_display = ("usuario", "proveedor", "no_leidas", "actualizado_en")
+    search_fields = ("usuario__username", "proveedor__nombre")
+    list_select_related = ("usuario", "proveedor")
+    readonly_fields = ("usuario", "proveedor", "no_leidas", "actualizado_en")
+
+
+@admin.register(SaldoResumen)
+class SaldoResumenAdmin(admin.ModelAdmin):
+    list_display = ("proveedor", "punto_venta", "estado", "facturas", "valor_total", "total_pagado", "actualizado_en")
+    list_filter = ("estado", "punto_venta")
+    search_fields = ("proveedor__nombre", "punto_venta__nombre")
+    list_select_related = ("proveedor", "punto_venta")
+    readonly_fields = ("proveedor", "punto_venta", "estado", "facturas", "valor_total", "total_pagado", "actualizado_en")
+
+
+@admin.register(ComprobanteArchivo)
+class ComprobanteArchivoAdmin(admin.ModelAdmin):
+    list_display = ("archivo", "tipo_contenido", "tamano", "derivados", "creado_en")
+    list_filter = ("tipo_contenido", "derivados")
+    search_fields = ("sha256", "archivo")
+    readonly_fields = (
+        "sha256", "archivo", "tamano", "tipo_contenido", "creado_en",
+        "vista_previa", "miniatura", "derivados_intentos", "derivados_error",
+    )
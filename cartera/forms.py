@@ -12,6 +12,49 @@ MAX_FACTURA = Decimal("10000000")
 ALERTA_FACTURA = Decimal("1000000")
 
 
+def normalizar_numero_factura(numero):
+    numero = (numero or "").strip().upper()
+    if not numero:
+        raise forms.ValidationError("Debes ingresar el número de factura.")
+    return numero
+
+
+def normalizar_valor_factura(valor):
+    if isinstance(valor, Decimal):
+        valor_decimal = valor
+    elif isinstance(valor, str):
+        raw = valor.strip()
+
+        raw = raw.replace(" ", "")
+
+        if "," in raw:
+            raw = raw.replace(".", "").replace(",", ".")
+        elif "." in raw:
+            parts = raw.split(".")
+            if len(parts) > 2:
+                raw = "".join(parts)
+            elif len(parts) == 2 and len(parts[1]) == 2 and len(parts[0]) > 3:
+                raw = ".".join(parts)
+            else:
+                raw = "".join(parts)
+
+        try:
+            valor_decimal = Decimal(raw or "0")
+        except InvalidOperation:
+            raise forms.ValidationError("Valor de factura inválido.")
+    else:
+        valor_decimal = valor
+
+    if valor_decimal is None:
+        raise forms.ValidationError("Debes ingresar el valor de la factura.")
+    if valor_decimal > MAX_FACTURA:
+        raise forms.ValidationError("El valor máximo permitido es 10.000.000.")
+    if valor_decimal <= 0:
+        raise forms.ValidationError("El valor de la factura debe ser mayor que cero.")
+
+    return valor_decimal.quantize(Decimal("0.01"))
+
+
 class ISODateInput(forms.DateInput):
     input_type = "date"
 
@@ -83,62 +126,17 @@ class FacturaForm(forms.ModelForm):
         return pv
 
     def clean_numero_factura(self):
-        numero = (self.cleaned_data.get("numero_factura") or "").strip().upper()
-        if not numero:
-            raise forms.ValidationError("Debes ingresar el número de factura.")
-        return numero
+        return normalizar_numero_factura(self.cleaned_data.get("numero_factura"))
 
     def clean_valor_factura(self):
-        valor = self.cleaned_data.get("valor_factura")
-
-        if isinstance(valor, Decimal):
-            valor_decimal = valor
-        elif isinstance(valor, str):
-            raw = valor.strip()
-
-            raw = raw.replace(" ", "")
-
-            if "," in raw:
-                raw = raw.replace(".", "").replace(",", ".")
-            elif "." in raw:
-                parts = raw.split(".")
-                if len(parts) > 2:
-                    raw = "".join(parts)
-                elif len(parts) == 2 and len(parts[1]) == 2 and len(parts[0]) > 3:
-                    raw = ".".join(parts)
-                else:
-                    raw = "".join(parts)
-
-            try:
-                valor_decimal = Decimal(raw or "0")
-            except InvalidOperation:
-                raise forms.ValidationError("Valor de factura inválido.")
-        else:
-            valor_decimal = valor
-
-        if valor_decimal is None:
-            raise forms.ValidationError("Debes ingresar el valor de la factura.")
-        if valor_decimal > MAX_FACTURA:
-            raise forms.ValidationError("El valor máximo permitido es 10.000.000.")
-        if valor_decimal <= 0:
-            raise forms.ValidationError("El valor de la factura debe ser mayor que cero.")
-
-        return valor_decimal.quantize(Decimal("0.01"))
+        return normalizar_valor_factura(self.cleaned_data.get("valor_factura"))
 
     def clean(self):
         cleaned = super().clean()
-        proveedor = cleaned.get("proveedor")
-        numero = cleaned.get("numero_factura")
         valor = cleaned.get("valor_factura")
         confirmar_valor_alto = self.data.get("confirmar_valor_alto") in {"1", "true", "True", True}
 
-        if proveedor and numero:
-            qs = Factura.objects.filter(proveedor=proveedor, numero_factura__iexact=numero)
-            if self.instance.pk:
-                qs = qs.exclude(pk=self.instance.pk)
-            if qs.exists():
-                self.add_error("numero_factura", "Ya existe una factura con ese proveedor y ese número.")
-
+        # El numero repetido lo detecta la validacion de la restriccion unica de Factura.
         if valor and valor > ALERTA_FACTURA and not confirmar_valor_alto:
             self.add_error("valor_factura", f"Confirma el valor alto de la factura: ${int(valor):,}".replace(",", "."))
 
@@ -313,3 +311,17 @@ class NovedadProveedorForm(forms.Form):
         widget=forms.Textarea(attrs={"rows": 4, "maxlength": 1000}),
         max_length=1000,
     )
+
+
+class FacturaImportForm(forms.Form):
+    archivo = forms.FileField(
+        required=True,
+        widget=forms.ClearableFileInput(attrs={"accept": ".csv,text/csv"}),
+    )
+    confirmar_valores_altos = forms.BooleanField(required=False)
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data.get("archivo")
+        if archivo and not archivo.name.lower().endswith(".csv"):
+            raise forms.ValidationError("El archivo debe ser un CSV.")
+        return archivo
@@ -0,0 +1,145 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.test import RequestFactory
+
+from cartera.models import Factura, Pago, ProveedorUsuario, PuntoVentaUsuario
+from cartera.scoping import scoped_facturas
+from cartera.services.benchmarks import mediana, medir, sembrar_cartera
+from cartera.services.provider_scope import PortalScope, facturas_visibles
+from cartera.views import _annotate_factura_listing, _base_factura_filters
+
+POR_PAGINA = 50
+
+
+class _Revertir(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra una cartera sintetica dentro de una transaccion, mide los listados sin y con los "
+        "indices compuestos de Factura y Pago (planes EXPLAIN y tiempos) y revierte todo al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--facturas", type=int, default=100000)
+        parser.add_argument("--proveedores", type=int, default=200)
+        parser.add_argument("--pdvs", type=int, default=20)
+        parser.add_argument("--repeticiones", type=int, default=5)
+        parser.add_argument("--semilla", type=int, default=1)
+        parser.add_argument("--sin-planes", action="store_true", help="Solo reporta tiempos.")
+        parser.add_argument(
+            "--permitir-produccion",
+            action="store_true",
+            help="Corre aun con APP_ENV=production; quitar y crear indices bloquea las tablas mientras dura.",
+        )
+
+    def handle(self, *args, **options):
+        if settings.APP_ENV == "production" and not options["permitir_produccion"]:
+            raise CommandError("No se corre en produccion sin --permitir-produccion.")
+        try:
+            with transaction.atomic():
+                self._correr(options)
+                raise _Revertir
+        except _Revertir:
+            self.stdout.write("Datos sinteticos e indices temporales revertidos.")
+
+    def _correr(self, options):
+        conteos = sembrar_cartera(
+            facturas=options["facturas"],
+            proveedores=options["proveedores"],
+            pdvs=options["pdvs"],
+            semilla=options["semilla"],
+        )
+        self.stdout.write(
+            f"Sembrado: {conteos['facturas']} facturas, {conteos['pagos']} pagos, "
+            f"{conteos['proveedores']} proveedores, {conteos['pdvs']} PDV ({connection.vendor})."
+        )
+        escenarios = self._escenarios()
+
+        resultados = {}
+        for etapa, indices in (("sin indices", False), ("con indices", True)):
+            self._indices_compuestos(indices)
+            self._analizar()
+            for nombre, qs in escenarios:
+                pagina = qs[: POR_PAGINA + 1]
+                tiempos = medir(lambda: list(pagina.all()), repeticiones=options["repeticiones"])
+                plan = "" if options["sin_planes"] else pagina.explain()
+                resultados.setdefault(nombre, {})[etapa] = (mediana(tiempos), plan)
+
+        for nombre, _qs in escenarios:
+            antes, _ = resultados[nombre]["sin indices"]
+            despues, _ = resultados[nombre]["con indices"]
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{nombre}"))
+            self.stdout.write(f"  sin indices: {antes:.2f} ms  con indices: {despues:.2f} ms")
+            if not options["sin_planes"]:
+                for etapa in ("sin indices", "con indices"):
+                    self.stdout.write(f"  plan {etapa}:")
+                    for linea in resultados[nombre][etapa][1].splitlines():
+                        self.stdout.write(f"    {linea}")
+
+    def _escenarios(self):
+        User = get_user_model()
+        staff = User.objects.create_user("benchmark-staff", is_staff=True)
+        pdv_user = User.objects.create_user("benchmark-pdv")
+        portal_user = User.objects.create_user("benchmark-portal")
+
+        muestra = Factura.objects.order_by("-fecha_factura", "-id").values("proveedor_id", "punto_venta_id", "pk").first()
+        if muestra is None:
+            raise CommandError("No hay facturas para medir; usa --facturas mayor que cero.")
+        PuntoVentaUsuario.objects.create(user=pdv_user, punto_venta_id=muestra["punto_venta_id"])
+        ProveedorUsuario.objects.create(user=portal_user, proveedor_id=muestra["proveedor_id"])
+        alcance = PortalScope(portal_user)
+        fabrica = RequestFactory()
+
+        def listado(usuario, include_estado=None, **params):
+            request = fabrica.get("/", params)
+            request.user = usuario
+            qs = _base_factura_filters(request, scoped_facturas(usuario), include_estado=include_estado)
+            return _annotate_factura_listing(qs)
+
+        factura_con_pagos = Pago.objects.order_by("-fecha_pago", "-id").values_list("factura_id", flat=True).first()
+        return [
+            ("Pendientes (staff)", listado(staff, "pendiente")),
+            ("Pendientes por proveedor (staff)", listado(staff, "pendiente", prov=str(muestra["proveedor_id"]))),
+            ("Pendientes (PDV)", listado(pdv_user, "pendiente")),
+            ("Pagadas sin confirmar (staff)", listado(staff, "pagada", confirmacion="no")),
+            ("Todas (staff)", listado(staff)),
+            ("Todas (PDV)", listado(pdv_user)),
+            (
+                "Portal: facturas pendientes",
+                facturas_visibles(alcance).filter(estado="pendiente").order_by("-fecha_factura", "-id"),
+            ),
+            ("Pagos de una factura", Pago.objects.filter(factura_id=factura_con_pagos).order_by("-fecha_pago", "-id")),
+        ]
+
+    def _indices_compuestos(self, activos):
+        """Quita o crea los indices de Meta; sin ellos se recrean los indices simples de las FK."""
+        editor = connection.schema_editor(atomic=False)
+        simples = [
+            (Factura, models.Index(fields=["proveedor"], name="benchmark_factura_prov")),
+            (Factura, models.Index(fields=["punto_venta"], name="benchmark_factura_pdv")),
+            (Pago, models.Index(fields=["factura"], name="benchmark_pago_factura")),
+        ]
+        compuestos = [(modelo, indice) for modelo in (Factura, Pago) for indice in modelo._meta.indexes]
+        quitar, crear = (simples, compuestos) if activos else (compuestos, simples)
+        with connection.cursor() as cursor:
+            for modelo, indice in quitar:
+                if indice.name in self._indices_existentes(cursor, modelo):
+                    cursor.execute(f"DROP INDEX {connection.ops.quote_name(indice.name)}")
+            for modelo, indice in crear:
+                if indice.name not in self._indices_existentes(cursor, modelo):
+                    cursor.execute(str(indice.create_sql(modelo, editor)))
+
+    def _indices_existentes(self, cursor, modelo):
+        return set(connection.introspection.get_constraints(cursor, modelo._meta.db_table))
+
+    def _analizar(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(f"ANALYZE {Factura._meta.db_table}")
+                cursor.execute(f"ANALYZE {Pago._meta.db_table}")
+            elif connection.vendor == "sqlite":
+                cursor.execute("ANALYZE")
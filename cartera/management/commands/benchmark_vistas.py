@@ -0,0 +1,60 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from cartera.models import EventoAuditoria, Factura, NotificacionProveedor, Pago, PagoLote, Proveedor
+from cartera.services.benchmarks import RUTAS, medir_vistas, rutas_sin_cubrir
+
+
+class Command(BaseCommand):
+    help = (
+        "Visita cada URL de cartera con el cliente de pruebas y reporta en JSON los percentiles de "
+        "latencia y el numero de consultas por vista, para comparar corridas en el tiempo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeticiones", type=int, default=10)
+        parser.add_argument("--vista", action="append", default=[], help="Solo las rutas cuyo nombre contenga este texto (repetible).")
+        parser.add_argument("--salida", help="Archivo JSON de salida; por defecto la salida estandar.")
+        parser.add_argument("--etiqueta", default="", help="Nombre libre de la corrida (rama, commit, maquina).")
+        parser.add_argument("--permitir-produccion", action="store_true")
+
+    def handle(self, *args, **options):
+        if settings.APP_ENV == "production" and not options["permitir_produccion"]:
+            raise CommandError("No se corre contra produccion sin --permitir-produccion.")
+        if options["repeticiones"] < 1:
+            raise CommandError("--repeticiones debe ser mayor que cero.")
+        rutas = [r for r in RUTAS if not options["vista"] or any(v in r.nombre for v in options["vista"])]
+
+        vistas = medir_vistas(rutas, repeticiones=options["repeticiones"])
+        reporte = {
+            "etiqueta": options["etiqueta"],
+            "fecha": timezone.now().isoformat(),
+            "base_de_datos": connection.vendor,
+            "repeticiones": options["repeticiones"],
+            "datos": {
+                "proveedores": Proveedor.objects.count(),
+                "facturas": Factura.objects.count(),
+                "pagos": Pago.objects.count(),
+                "lotes": PagoLote.objects.count(),
+                "eventos": EventoAuditoria.objects.count(),
+                "notificaciones": NotificacionProveedor.objects.count(),
+            },
+            "vistas": vistas,
+            "sin_cubrir": rutas_sin_cubrir(),
+            "sobre_presupuesto": sorted(
+                etiqueta
+                for etiqueta, vista in vistas.items()
+                if vista.get("presupuesto") is not None and vista["consultas"] > vista["presupuesto"]
+            ),
+        }
+        contenido = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if options["salida"]:
+            with open(options["salida"], "w", encoding="utf-8") as fh:
+                fh.write(contenido + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Reporte escrito en {options['salida']}."))
+        else:
+            self.stdout.write(contenido)
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cartera.services.previews import derivados_disponibles, generar_vistas_previas_pendientes
+
+
+class Command(BaseCommand):
+    help = "Genera la vista previa y la miniatura de los comprobantes nuevos, fuera de la peticion que los subio."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limite", type=int, default=20, help="Comprobantes reservados por vuelta.")
+        parser.add_argument(
+            "--continuo",
+            action="store_true",
+            help="Sigue esperando comprobantes nuevos en lugar de terminar cuando no quedan pendientes.",
+        )
+        parser.add_argument("--intervalo", type=float, default=10, help="Segundos de espera entre revisiones en modo continuo.")
+
+    def handle(self, *args, **options):
+        if not derivados_disponibles():
+            raise CommandError("Pillow no esta instalado: instala requirements.txt para generar vistas previas.")
+        totales = {"listos": 0, "sin_vista_previa": 0, "reintentos": 0, "fallidos": 0}
+        while True:
+            resultado = generar_vistas_previas_pendientes(limite=options["limite"])
+            for clave, valor in resultado.items():
+                totales[clave] += valor
+            if any(resultado.values()):
+                self.stdout.write(" ".join(f"{clave}={valor}" for clave, valor in resultado.items()))
+                continue
+            if not options["continuo"]:
+                break
+            time.sleep(options["intervalo"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Vistas previas: {totales['listos']} lista(s), {totales['sin_vista_previa']} sin vista previa, "
+                f"{totales['reintentos']} reintento(s) programado(s), {totales['fallidos']} fallido(s)."
+            )
+        )
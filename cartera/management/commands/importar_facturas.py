@@ -0,0 +1,77 @@
+import sys
+import time
+
+from django import forms
+from django.contrib.auth import get_user_model
+from django.core.exceptions import PermissionDenied
+from django.core.management.base import BaseCommand, CommandError
+
+from cartera.services.imports import IMPORT_CHUNK_SIZE, escribir_reporte_errores, importar_facturas
+
+
+class Command(BaseCommand):
+    help = "Importa facturas pendientes desde un CSV por bloques y escribe un reporte de errores por fila."
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", help="Ruta del CSV, o '-' para leer de la entrada estandar.")
+        parser.add_argument("--usuario", help="Usuario que registra las facturas; si es de un PDV, se usa su punto de venta.")
+        parser.add_argument("--bloque", type=int, default=IMPORT_CHUNK_SIZE, help="Filas por bloque (una transaccion por bloque).")
+        parser.add_argument("--delimitador", default=",", help="Separador de columnas del CSV.")
+        parser.add_argument("--encoding", default="utf-8-sig", help="Codificacion del archivo.")
+        parser.add_argument(
+            "--reporte",
+            help="Ruta del CSV de errores; por defecto <archivo>.errores.csv (o la salida estandar si se lee de '-').",
+        )
+        parser.add_argument(
+            "--confirmar-valores-altos",
+            action="store_true",
+            help="Acepta valores por encima del umbral de alerta sin marcarlos como error.",
+        )
+
+    def handle(self, *args, **options):
+        usuario = None
+        if options["usuario"]:
+            try:
+                usuario = get_user_model().objects.get(username=options["usuario"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No existe el usuario {options['usuario']}.")
+
+        archivo = options["archivo"]
+        inicio = time.monotonic()
+        try:
+            if archivo == "-":
+                resultado = self._importar(sys.stdin, usuario, options)
+            else:
+                with open(archivo, encoding=options["encoding"], newline="") as fh:
+                    resultado = self._importar(fh, usuario, options)
+        except (forms.ValidationError, PermissionDenied) as exc:
+            raise CommandError(" ".join(getattr(exc, "messages", [str(exc)])))
+        except OSError as exc:
+            raise CommandError(f"No se pudo leer {archivo}: {exc}")
+        duracion = time.monotonic() - inicio
+
+        if resultado.errores:
+            reporte = options["reporte"] or (None if archivo == "-" else f"{archivo}.errores.csv")
+            if reporte:
+                with open(reporte, "w", encoding="utf-8", newline="") as fh:
+                    escribir_reporte_errores(resultado.errores, fh)
+                self.stdout.write(f"Reporte de errores: {reporte}")
+            else:
+                escribir_reporte_errores(resultado.errores, self.stdout)
+
+        velocidad = resultado.procesadas / duracion if duracion else resultado.procesadas
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Importacion terminada: {resultado.creadas} factura(s) creada(s), {len(resultado.errores)} error(es), "
+                f"{duracion:.2f}s ({velocidad:.0f} filas/s)."
+            )
+        )
+
+    def _importar(self, fh, usuario, options):
+        return importar_facturas(
+            fh,
+            usuario=usuario,
+            chunk_size=options["bloque"],
+            confirmar_valores_altos=options["confirmar_valores_altos"],
+            delimitador=options["delimitador"],
+        )
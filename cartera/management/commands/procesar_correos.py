@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cartera.services.email_outbox import procesar_correos_pendientes
+
+
+class Command(BaseCommand):
+    help = "Envia los correos de recibo en cola, reutilizando una conexion SMTP por lote."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limite", type=int, default=50, help="Correos por lote (una conexion SMTP por lote).")
+        parser.add_argument(
+            "--continuo",
+            action="store_true",
+            help="Sigue esperando correos nuevos en lugar de terminar cuando la cola queda vacia.",
+        )
+        parser.add_argument("--intervalo", type=float, default=10, help="Segundos de espera entre revisiones en modo continuo.")
+
+    def handle(self, *args, **options):
+        totales = {"enviados": 0, "reintentos": 0, "fallidos": 0}
+        while True:
+            resultado = procesar_correos_pendientes(limite=options["limite"])
+            for clave, valor in resultado.items():
+                totales[clave] += valor
+            if any(resultado.values()):
+                self.stdout.write(
+                    f"enviados={resultado['enviados']} reintentos={resultado['reintentos']} fallidos={resultado['fallidos']}"
+                )
+                continue
+            if not options["continuo"]:
+                break
+            time.sleep(options["intervalo"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Cola procesada: {totales['enviados']} enviado(s), {totales['reintentos']} reintento(s) programado(s), "
+                f"{totales['fallidos']} fallido(s)."
+            )
+        )
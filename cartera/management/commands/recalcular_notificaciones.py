@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cartera.services.provider_notifications import diferencias_contadores, reconstruir_contadores
+
+
+class Command(BaseCommand):
+    help = "Verifica los contadores de notificaciones no leidas del portal contra las notificaciones y los reconstruye."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Solo reporta diferencias; termina con error si los contadores no cuadran.",
+        )
+
+    def handle(self, *args, **options):
+        diferencias = diferencias_contadores()
+        for (usuario_id, proveedor_id), guardado, esperado in diferencias:
+            self.stdout.write(f"usuario={usuario_id} proveedor={proveedor_id}: guardado={guardado} esperado={esperado}")
+
+        if options["check"]:
+            if diferencias:
+                raise CommandError(f"Los contadores de notificaciones tienen {len(diferencias)} diferencia(s).")
+            self.stdout.write(self.style.SUCCESS("Los contadores de notificaciones cuadran con las notificaciones."))
+            return
+
+        filas = reconstruir_contadores()
+        self.stdout.write(
+            self.style.SUCCESS(f"Contadores reconstruidos: {filas} fila(s), {len(diferencias)} diferencia(s) corregida(s).")
+        )
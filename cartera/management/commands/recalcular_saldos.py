@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cartera.services.balances import diferencias_saldos, reconstruir_saldos
+
+
+class Command(BaseCommand):
+    help = "Verifica el resumen de saldos por proveedor/PDV/estado contra las facturas y lo reconstruye."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Solo reporta diferencias; termina con error si el resumen no cuadra.",
+        )
+
+    def handle(self, *args, **options):
+        diferencias = diferencias_saldos()
+        for (proveedor_id, punto_venta_id, estado), guardado, esperado in diferencias:
+            self.stdout.write(
+                f"proveedor={proveedor_id} pdv={punto_venta_id} estado={estado}: "
+                f"guardado={guardado} esperado={esperado}"
+            )
+
+        if options["check"]:
+            if diferencias:
+                raise CommandError(f"El resumen de saldos tiene {len(diferencias)} diferencia(s).")
+            self.stdout.write(self.style.SUCCESS("El resumen de saldos cuadra con las facturas."))
+            return
+
+        filas = reconstruir_saldos()
+        self.stdout.write(
+            self.style.SUCCESS(f"Resumen reconstruido: {filas} fila(s), {len(diferencias)} diferencia(s) corregida(s).")
+        )
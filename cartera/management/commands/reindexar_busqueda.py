@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from cartera.models import Factura
+from cartera.services.search import motor_busqueda, reconstruir_indice_busqueda
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula el texto de busqueda de las facturas y recrea su indice (trigramas en PostgreSQL, "
+        "FTS5 en SQLite). Sirve despues de cambios hechos fuera del ORM o de migraciones que rehacen la tabla."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Solo cuenta facturas con texto desactualizado; termina con error si hay alguna.",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            desactualizadas = Factura.objects.actualizar_texto_busqueda(guardar=False)
+            if desactualizadas:
+                raise CommandError(f"{desactualizadas} factura(s) con texto de busqueda desactualizado.")
+            self.stdout.write(self.style.SUCCESS(f"Texto de busqueda al dia (motor: {motor_busqueda()})."))
+            return
+
+        with transaction.atomic():
+            cambiadas = Factura.objects.actualizar_texto_busqueda()
+            reconstruir_indice_busqueda()
+        self.stdout.write(
+            self.style.SUCCESS(f"Indice de busqueda recreado (motor: {motor_busqueda()}); {cambiadas} factura(s) corregida(s).")
+        )
@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from cartera.services.benchmarks import SEED_BATCH_SIZE, sembrar_cartera
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera una cartera sintetica con inserciones masivas: proveedores, PDV, usuarios, facturas, "
+        "pagos sueltos y en lotes, confirmaciones, eventos de auditoria y notificaciones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--facturas", type=int, default=10000)
+        parser.add_argument("--proveedores", type=int, default=100)
+        parser.add_argument("--pdvs", type=int, default=10)
+        parser.add_argument("--usuarios-portal", type=int, default=2, help="Usuarios del portal por proveedor.")
+        parser.add_argument("--semilla", type=int, default=1, help="Misma semilla, mismos datos; tambien prefija nombres.")
+        parser.add_argument("--dias", type=int, default=3 * 365, help="Antiguedad maxima de las facturas.")
+        parser.add_argument("--pagadas", type=float, default=0.6, help="Proporcion de facturas pagadas.")
+        parser.add_argument("--en-lote", type=float, default=0.3, help="Proporcion de pagos agrupados en lotes.")
+        parser.add_argument("--confirmadas", type=float, default=0.5, help="Proporcion de pagos confirmados.")
+        parser.add_argument("--password", help="Clave de los usuarios creados; sin ella quedan sin clave utilizable.")
+        parser.add_argument("--bloque", type=int, default=SEED_BATCH_SIZE)
+        parser.add_argument("--permitir-produccion", action="store_true")
+
+    def handle(self, *args, **options):
+        if settings.APP_ENV == "production" and not options["permitir_produccion"]:
+            raise CommandError("No se siembran datos sinteticos en produccion sin --permitir-produccion.")
+        inicio = time.monotonic()
+        try:
+            with transaction.atomic():
+                conteos = sembrar_cartera(
+                    facturas=options["facturas"],
+                    proveedores=options["proveedores"],
+                    pdvs=options["pdvs"],
+                    semilla=options["semilla"],
+                    dias=options["dias"],
+                    proporcion_pagadas=options["pagadas"],
+                    proporcion_en_lote=options["en_lote"],
+                    proporcion_confirmadas=options["confirmadas"],
+                    usuarios_portal=options["usuarios_portal"],
+                    password=options["password"],
+                    batch_size=options["bloque"],
+                )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        resumen = ", ".join(f"{valor} {nombre}" for nombre, valor in sorted(conteos.items()))
+        self.stdout.write(self.style.SUCCESS(f"Cartera sintetica creada en {time.monotonic() - inicio:.1f}s: {resumen}."))
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def poblar_saldos(apps, schema_editor):
+    Factura = apps.get_model('cartera', 'Factura')
+    SaldoResumen = apps.get_model('cartera', 'SaldoResumen')
+    rows = (
+        Factura.objects.order_by()
+        .values('proveedor_id', 'punto_venta_id', 'estado')
+        .annotate(facturas=Count('id'), valor_total=Sum('valor_factura'), total_pagado=Sum('total_pagado'))
+    )
+    SaldoResumen.objects.bulk_create(
+        SaldoResumen(
+            proveedor_id=r['proveedor_id'],
+            punto_venta_id=r['punto_venta_id'],
+            estado=r['estado'],
+            facturas=r['facturas'],
+            valor_total=r['valor_total'] or 0,
+            total_pagado=r['total_pagado'] or 0,
+        )
+        for r in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cartera', '0009_alter_eventoauditoria_tipo_notificacionproveedor_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoResumen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('pagada', 'Pagada')], max_length=10)),
+                ('facturas', models.IntegerField(default=0)),
+                ('valor_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('total_pagado', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('proveedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_resumen', to='cartera.proveedor')),
+                ('punto_venta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_resumen', to='cartera.puntoventa')),
+            ],
+            options={
+                'verbose_name': 'Resumen de saldo',
+                'verbose_name_plural': 'Resumen de saldos',
+                'ordering': ['proveedor__nombre', 'punto_venta__nombre', 'estado'],
+                'indexes': [models.Index(fields=['estado', 'punto_venta'], name='cartera_sal_estado_564839_idx')],
+                'constraints': [models.UniqueConstraint(fields=('proveedor', 'punto_venta', 'estado'), name='unique_saldo_resumen')],
+            },
+        ),
+        migrations.RunPython(poblar_saldos, migrations.RunPython.noop),
+    ]
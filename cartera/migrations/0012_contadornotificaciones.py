@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def poblar_contadores(apps, schema_editor):
+    NotificacionProveedor = apps.get_model('cartera', 'NotificacionProveedor')
+    ContadorNotificaciones = apps.get_model('cartera', 'ContadorNotificaciones')
+    rows = (
+        NotificacionProveedor.objects.filter(leida=False)
+        .order_by()
+        .values('usuario_id', 'proveedor_id')
+        .annotate(no_leidas=Count('id'))
+    )
+    ContadorNotificaciones.objects.bulk_create(
+        ContadorNotificaciones(usuario_id=r['usuario_id'], proveedor_id=r['proveedor_id'], no_leidas=r['no_leidas'])
+        for r in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cartera', '0011_correopendiente'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorNotificaciones',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('no_leidas', models.IntegerField(default=0)),
+                ('actualizado_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('proveedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contadores_notificaciones', to='cartera.proveedor')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contadores_notificaciones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Contador de notificaciones',
+                'verbose_name_plural': 'Contadores de notificaciones',
+                'ordering': ['usuario_id', 'proveedor_id'],
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'proveedor'), name='unique_contador_notificaciones')],
+            },
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
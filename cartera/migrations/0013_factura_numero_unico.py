@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:11
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Upper
+
+
+def verificar_colisiones(apps, schema_editor):
+    """Aborta si hay facturas del mismo proveedor cuyo numero solo difiere en mayusculas."""
+    Factura = apps.get_model('cartera', 'Factura')
+    colisiones = list(
+        Factura.objects.order_by()
+        .values('proveedor_id', numero=Upper('numero_factura'))
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .order_by('proveedor_id', 'numero')
+    )
+    if not colisiones:
+        return
+    detalle = []
+    for colision in colisiones[:50]:
+        ids = list(
+            Factura.objects.annotate(numero=Upper('numero_factura'))
+            .filter(proveedor_id=colision['proveedor_id'], numero=colision['numero'])
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        detalle.append(f"proveedor {colision['proveedor_id']}, numero {colision['numero']}: facturas {ids}")
+    if len(colisiones) > len(detalle):
+        detalle.append(f"... y {len(colisiones) - len(detalle)} mas")
+    raise RuntimeError(
+        f"Hay {len(colisiones)} numero(s) de factura repetidos por proveedor (sin distinguir mayusculas). "
+        "Corrige o elimina los duplicados antes de migrar:\n" + "\n".join(detalle)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cartera', '0012_contadornotificaciones'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(verificar_colisiones, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='factura',
+            constraint=models.UniqueConstraint(models.F('proveedor'), django.db.models.functions.text.Upper('numero_factura'), name='unique_factura_proveedor_numero', violation_error_code='factura_duplicada', violation_error_message='Ya existe una factura con ese proveedor y ese número.'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cartera', '0013_factura_numero_unico'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['-fecha_factura', '-id'], name='factura_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['estado', '-fecha_factura', '-id'], name='factura_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['punto_venta', '-fecha_factura', '-id'], name='factura_pdv_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['proveedor', '-fecha_factura', '-id'], name='factura_prov_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['punto_venta', '-fecha_factura', '-id'], name='factura_pdv_pend_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['proveedor', '-fecha_factura', '-id'], name='factura_prov_pend_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['factura', '-fecha_pago', '-id'], name='pago_factura_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['-fecha_pago', '-id'], name='pago_fecha_idx'),
+        ),
+        # Los indices de las FK se eliminan despues de crear los compuestos que los reemplazan.
+        migrations.AlterField(
+            model_name='factura',
+            name='proveedor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='cartera.proveedor'),
+        ),
+        migrations.AlterField(
+            model_name='factura',
+            name='punto_venta',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='cartera.puntoventa'),
+        ),
+        migrations.AlterField(
+            model_name='pago',
+            name='factura',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='pagos', to='cartera.factura'),
+        ),
+    ]
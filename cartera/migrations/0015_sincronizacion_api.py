@@ -0,0 +1,45 @@
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copiar_creado_en(apps, schema_editor):
+    Pago = apps.get_model("cartera", "Pago")
+    Pago.objects.filter(actualizado_en__isnull=True).update(actualizado_en=F("creado_en"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cartera', '0014_indices_listados'),
+    ]
+
+    operations = [
+        # Los pagos existentes toman su fecha de creacion como ultima modificacion.
+        migrations.AddField(
+            model_name='pago',
+            name='actualizado_en',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(copiar_creado_en, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='pago',
+            name='actualizado_en',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['creado_en', 'id'], name='factura_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['actualizado_en', 'id'], name='factura_actualizado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['creado_en', 'id'], name='pago_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['actualizado_en', 'id'], name='pago_actualizado_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+from cartera.models import BUSQUEDA_BATCH_SIZE, texto_busqueda
+from cartera.services.search import crear_indice_busqueda, eliminar_indice_busqueda
+
+
+def llenar_texto_busqueda(apps, schema_editor):
+    Factura = apps.get_model("cartera", "Factura")
+    filas = Factura.objects.order_by("pk").values_list(
+        "pk", "numero_factura", "proveedor__nombre", "proveedor__nit", "punto_venta__nombre"
+    )
+    ultimo = 0
+    while True:
+        tramo = list(filas.filter(pk__gt=ultimo)[:BUSQUEDA_BATCH_SIZE])
+        if not tramo:
+            return
+        ultimo = tramo[-1][0]
+        Factura.objects.bulk_update(
+            [Factura(pk=pk, texto_busqueda=texto_busqueda(*partes)) for pk, *partes in tramo],
+            ["texto_busqueda"],
+        )
+
+
+def crear_indice(apps, schema_editor):
+    crear_indice_busqueda(schema_editor)
+
+
+def eliminar_indice(apps, schema_editor):
+    eliminar_indice_busqueda(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cartera', '0015_sincronizacion_api'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='factura',
+            name='texto_busqueda',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.RunPython(llenar_texto_busqueda, migrations.RunPython.noop),
+        # Trigramas GIN en PostgreSQL, tabla FTS5 con triggers en SQLite (ver cartera/services/search.py).
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
@@ -0,0 +1,33 @@
+import cartera.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cartera', '0016_busqueda_facturas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComprobanteArchivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('archivo', models.FileField(max_length=255, unique=True, upload_to='')),
+                ('tamano', models.PositiveBigIntegerField()),
+                ('tipo_contenido', models.CharField(max_length=50)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='pago',
+            name='comprobante',
+            field=cartera.models.ComprobanteField(blank=True, null=True, upload_to='comprobantes/'),
+        ),
+        migrations.AlterField(
+            model_name='pagolote',
+            name='comprobante',
+            field=cartera.models.ComprobanteField(upload_to='comprobantes/'),
+        ),
+    ]
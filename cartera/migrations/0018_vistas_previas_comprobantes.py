@@ -0,0 +1,46 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cartera', '0017_comprobantes_por_contenido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comprobantearchivo',
+            name='derivados',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('listo', 'Listo'), ('no_aplica', 'Sin vista previa'), ('fallido', 'Fallido')], default='pendiente', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='comprobantearchivo',
+            name='derivados_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='comprobantearchivo',
+            name='derivados_intentos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comprobantearchivo',
+            name='derivados_proximo_intento',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='comprobantearchivo',
+            name='miniatura',
+            field=models.FileField(blank=True, max_length=255, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='comprobantearchivo',
+            name='vista_previa',
+            field=models.FileField(blank=True, max_length=255, upload_to=''),
+        ),
+        migrations.AddIndex(
+            model_name='comprobantearchivo',
+            index=models.Index(fields=['derivados', 'derivados_proximo_intento'], name='comprobante_derivados_idx'),
+        ),
+    ]
@@ -1,16 +1,75 @@
+import hashlib
+import os
+import unicodedata
+from collections import Counter, defaultdict
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ValidationError
-from django.db import models
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.core.files import File
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F
+from django.db.models.fields.files import FieldFile
+from django.db.models.functions import Upper
+from django.utils import timezone
 
-from .validators import validate_comprobante_file
+from .validators import COMPROBANTE_CABECERA_BYTES, tipo_real_comprobante, validate_comprobante_file
 
 User = get_user_model()
 
 PAGO_LOTE_MONOPROVEEDOR_ERROR = "Un lote solo puede contener pagos del mismo proveedor."
+FACTURA_DUPLICADA_ERROR = "Ya existe una factura con ese proveedor y ese número."
+FACTURA_NUMERO_UNICO = "unique_factura_proveedor_numero"
+BUSQUEDA_BATCH_SIZE = 2000
+COMPROBANTE_EXTENSIONES = {
+    "application/pdf": ".pdf",
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/heic": ".heic",
+    "image/heif": ".heif",
+}
+
+
+def normalizar_busqueda(texto):
+    """Minusculas, sin tildes y con espacios simples: la forma en que se guarda y se consulta el texto de busqueda."""
+    descompuesto = unicodedata.normalize("NFKD", str(texto or ""))
+    return " ".join("".join(c for c in descompuesto if not unicodedata.combining(c)).lower().split())
+
+
+def texto_busqueda(numero_factura, proveedor_nombre="", proveedor_nit="", punto_venta_nombre=""):
+    partes = (numero_factura, proveedor_nombre, proveedor_nit, punto_venta_nombre)
+    return " ".join(filter(None, (normalizar_busqueda(parte) for parte in partes)))
+
+
+class _RenombreActualizaBusqueda:
+    """Al cambiar los campos de BUSQUEDA_CAMPOS se recalcula el texto de busqueda de sus facturas."""
+
+    BUSQUEDA_CAMPOS = ()
+    FACTURA_RELACION = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._busqueda_original = instancia._valores_busqueda()
+        return instancia
+
+    def _valores_busqueda(self):
+        return tuple(self.__dict__.get(campo) for campo in self.BUSQUEDA_CAMPOS)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        original = getattr(self, "_busqueda_original", None)
+        actual = self._valores_busqueda()
+        if original is not None and original != actual:
+            Factura.objects.filter(**{self.FACTURA_RELACION: self}).actualizar_texto_busqueda()
+        self._busqueda_original = actual
+
 
+class PuntoVenta(_RenombreActualizaBusqueda, models.Model):
+    BUSQUEDA_CAMPOS = ("nombre",)
+    FACTURA_RELACION = "punto_venta"
 
-class PuntoVenta(models.Model):
     nombre = models.CharField(max_length=100)
     ciudad = models.CharField(max_length=100, blank=True)
     usuario = models.OneToOneField(
@@ -25,7 +84,10 @@ class PuntoVenta(models.Model):
         return self.nombre
 
 
-class Proveedor(models.Model):
+class Proveedor(_RenombreActualizaBusqueda, models.Model):
+    BUSQUEDA_CAMPOS = ("nombre", "nit")
+    FACTURA_RELACION = "proveedor"
+
     nombre = models.CharField(max_length=150)
     nit = models.CharField(max_length=50, blank=True)
     email = models.EmailField(blank=True)
@@ -61,14 +123,66 @@ class ProveedorUsuario(models.Model):
         return f"{self.user} - {self.proveedor}"
 
 
+class FacturaQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        _completar_texto_busqueda(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def actualizar_texto_busqueda(self, batch_size=BUSQUEDA_BATCH_SIZE, guardar=True):
+        """
+        Recalcula el texto de busqueda de las facturas del queryset por tramos de pk; devuelve cuantas
+        cambiaron (o, con guardar=False, cuantas estan desactualizadas sin tocarlas).
+        """
+        cambiadas = 0
+        ultimo = 0
+        qs = self.order_by("pk").select_related("proveedor", "punto_venta").only(
+            "id", "numero_factura", "texto_busqueda", "proveedor__nombre", "proveedor__nit", "punto_venta__nombre"
+        )
+        while True:
+            tramo = list(qs.filter(pk__gt=ultimo)[:batch_size])
+            if not tramo:
+                return cambiadas
+            ultimo = tramo[-1].pk
+            distintas = []
+            for factura in tramo:
+                texto = factura.calcular_texto_busqueda()
+                if texto != factura.texto_busqueda:
+                    factura.texto_busqueda = texto
+                    distintas.append(factura)
+            if distintas and guardar:
+                self.model.objects.bulk_update(distintas, ["texto_busqueda"])
+            cambiadas += len(distintas)
+
+
+def _completar_texto_busqueda(facturas):
+    """Texto de busqueda de facturas nuevas; los proveedores y PDV que no vienen cargados se leen de una vez."""
+    faltantes = {
+        campo: {
+            getattr(f, f"{campo}_id") for f in facturas if not Factura._meta.get_field(campo).is_cached(f) and getattr(f, f"{campo}_id")
+        }
+        for campo in ("proveedor", "punto_venta")
+    }
+    leidos = {
+        "proveedor": Proveedor.objects.in_bulk(faltantes["proveedor"]),
+        "punto_venta": PuntoVenta.objects.in_bulk(faltantes["punto_venta"]),
+    }
+    for factura in facturas:
+        for campo, objetos in leidos.items():
+            if getattr(factura, f"{campo}_id") in objetos:
+                setattr(factura, campo, objetos[getattr(factura, f"{campo}_id")])
+        factura.texto_busqueda = factura.calcular_texto_busqueda()
+
+
 class Factura(models.Model):
     ESTADOS = [
         ("pendiente", "Pendiente"),
         ("pagada", "Pagada"),
     ]
 
-    proveedor = models.ForeignKey(Proveedor, on_delete=models.PROTECT)
-    punto_venta = models.ForeignKey(PuntoVenta, on_delete=models.PROTECT)
+    # Sin indice propio: los indices compuestos de Meta empiezan por estas columnas.
+    proveedor = models.ForeignKey(Proveedor, on_delete=models.PROTECT, db_index=False)
+    punto_venta = models.ForeignKey(PuntoVenta, on_delete=models.PROTECT, db_index=False)
     numero_factura = models.CharField(max_length=50)
     fecha_factura = models.DateField()
     valor_factura = models.DecimalField(max_digits=14, decimal_places=2)
@@ -81,17 +195,178 @@ class Factura(models.Model):
     confirmado_pago = models.BooleanField(default=False)
     confirmado_fecha = models.DateTimeField(null=True, blank=True)
     confirmado_por_email = models.EmailField(null=True, blank=True)
+    # Numero, proveedor, NIT y PDV normalizados; los indices de busqueda (trigramas o FTS5) se crean en 0016.
+    texto_busqueda = models.TextField(default="", editable=False)
+
+    objects = FacturaQuerySet.as_manager()
+
+    BUSQUEDA_CAMPOS = {"numero_factura", "proveedor", "proveedor_id", "punto_venta", "punto_venta_id"}
 
     class Meta:
         ordering = ["-fecha_factura", "-id"]
+        # Los listados filtran por PDV, proveedor o estado y siempre ordenan por (-fecha_factura, -id).
+        indexes = [
+            models.Index(fields=["-fecha_factura", "-id"], name="factura_fecha_idx"),
+            models.Index(fields=["estado", "-fecha_factura", "-id"], name="factura_estado_fecha_idx"),
+            models.Index(fields=["punto_venta", "-fecha_factura", "-id"], name="factura_pdv_fecha_idx"),
+            models.Index(fields=["proveedor", "-fecha_factura", "-id"], name="factura_prov_fecha_idx"),
+            models.Index(
+                fields=["punto_venta", "-fecha_factura", "-id"],
+                condition=models.Q(estado="pendiente"),
+                name="factura_pdv_pend_idx",
+            ),
+            models.Index(
+                fields=["proveedor", "-fecha_factura", "-id"],
+                condition=models.Q(estado="pendiente"),
+                name="factura_prov_pend_idx",
+            ),
+            # Recorridos de la API por cursor: completo por creacion, incremental por modificacion.
+            models.Index(fields=["creado_en", "id"], name="factura_creado_idx"),
+            models.Index(fields=["actualizado_en", "id"], name="factura_actualizado_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                models.F("proveedor"),
+                Upper("numero_factura"),
+                name=FACTURA_NUMERO_UNICO,
+                violation_error_code="factura_duplicada",
+                violation_error_message=FACTURA_DUPLICADA_ERROR,
+            ),
+        ]
 
     def __str__(self):
         return f"{self.numero_factura} - {self.proveedor}"
 
+    def validate_constraints(self, exclude=None):
+        # El numero unico por proveedor se reporta sobre numero_factura, no como error general.
+        try:
+            super().validate_constraints(exclude=exclude)
+        except ValidationError as exc:
+            errores = exc.update_error_dict({})
+            generales = errores.pop(NON_FIELD_ERRORS, [])
+            for error in generales:
+                campo = "numero_factura" if error.code == "factura_duplicada" else NON_FIELD_ERRORS
+                errores.setdefault(campo, []).append(error)
+            raise ValidationError(errores)
+
     @property
     def saldo(self):
         return (self.valor_factura or 0) - (self.total_pagado or 0)
 
+    def calcular_texto_busqueda(self):
+        proveedor = self.proveedor if self.proveedor_id else None
+        punto_venta = self.punto_venta if self.punto_venta_id else None
+        return texto_busqueda(
+            self.numero_factura,
+            getattr(proveedor, "nombre", ""),
+            getattr(proveedor, "nit", ""),
+            getattr(punto_venta, "nombre", ""),
+        )
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or self.BUSQUEDA_CAMPOS.intersection(update_fields):
+            self.texto_busqueda = self.calcular_texto_busqueda()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "texto_busqueda"}
+        super().save(*args, **kwargs)
+
+
+class ComprobanteArchivoQuerySet(models.QuerySet):
+    def guardar(self, contenido, nombre=""):
+        """
+        Guarda el contenido bajo comprobantes/<sha256[:2]>/<sha256>.<ext> y devuelve su ComprobanteArchivo;
+        si ya existe uno con el mismo SHA-256 lo devuelve sin volver a escribir en el storage.
+        """
+        if not hasattr(contenido, "chunks"):
+            contenido = File(contenido, name=nombre)
+        sha = hashlib.sha256()
+        cabecera = b""
+        tamano = 0
+        for bloque in contenido.chunks():
+            if not cabecera:
+                cabecera = bytes(bloque[:COMPROBANTE_CABECERA_BYTES])
+            sha.update(bloque)
+            tamano += len(bloque)
+        contenido.seek(0)
+        digest = sha.hexdigest()
+        existente = self.filter(sha256=digest).first()
+        if existente:
+            return existente
+
+        tipo = tipo_real_comprobante(cabecera) or "application/octet-stream"
+        extension = COMPROBANTE_EXTENSIONES.get(tipo) or os.path.splitext(nombre or "")[1].lower()
+        storage = self.model._meta.get_field("archivo").storage
+        guardado = storage.save(f"comprobantes/{digest[:2]}/{digest}{extension}", contenido)
+        try:
+            with transaction.atomic(using=self.db):
+                return self.create(sha256=digest, archivo=guardado, tamano=tamano, tipo_contenido=tipo)
+        except IntegrityError:
+            # Otra solicitud guardo el mismo contenido al tiempo; se usa la suya y se descarta la copia.
+            storage.delete(guardado)
+            return self.get(sha256=digest)
+
+
+class ComprobanteArchivo(models.Model):
+    """
+    Un archivo por contenido: los pagos y lotes que suben el mismo comprobante guardan el mismo nombre,
+    asi que el archivo no se borra al borrar un pago. La vista previa y la miniatura las genera el
+    comando generar_vistas_previas y quedan junto al original.
+    """
+
+    DERIVADOS_PENDIENTE = "pendiente"
+    DERIVADOS_PROCESANDO = "procesando"
+    DERIVADOS_LISTO = "listo"
+    DERIVADOS_NO_APLICA = "no_aplica"
+    DERIVADOS_FALLIDO = "fallido"
+
+    DERIVADOS_CHOICES = [
+        (DERIVADOS_PENDIENTE, "Pendiente"),
+        (DERIVADOS_PROCESANDO, "Procesando"),
+        (DERIVADOS_LISTO, "Listo"),
+        (DERIVADOS_NO_APLICA, "Sin vista previa"),
+        (DERIVADOS_FALLIDO, "Fallido"),
+    ]
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    archivo = models.FileField(max_length=255, unique=True)
+    tamano = models.PositiveBigIntegerField()
+    tipo_contenido = models.CharField(max_length=50)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    vista_previa = models.FileField(max_length=255, blank=True)
+    miniatura = models.FileField(max_length=255, blank=True)
+    derivados = models.CharField(max_length=20, choices=DERIVADOS_CHOICES, default=DERIVADOS_PENDIENTE)
+    derivados_intentos = models.PositiveIntegerField(default=0)
+    derivados_proximo_intento = models.DateTimeField(default=timezone.now)
+    derivados_error = models.TextField(blank=True)
+
+    objects = ComprobanteArchivoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["derivados", "derivados_proximo_intento"], name="comprobante_derivados_idx"),
+        ]
+
+    def __str__(self):
+        return self.archivo.name
+
+
+class ComprobanteFieldFile(FieldFile):
+    def save(self, name, content, save=True):
+        self.name = ComprobanteArchivo.objects.guardar(content, name).archivo.name
+        setattr(self.instance, self.field.attname, self.name)
+        self._committed = True
+        if save:
+            self.instance.save()
+
+    save.alters_data = True
+
+
+class ComprobanteField(models.FileField):
+    """FileField de comprobantes: los archivos nuevos se guardan por contenido y se reutilizan si ya existian."""
+
+    attr_class = ComprobanteFieldFile
+
 
 class PagoLote(models.Model):
     """PagoLote es siempre monoproveedor; proveedor es la fuente de verdad."""
@@ -99,7 +374,7 @@ class PagoLote(models.Model):
     proveedor = models.ForeignKey(Proveedor, on_delete=models.PROTECT, related_name="lotes")
     fecha_pago = models.DateField()
     pagado_por = models.CharField(max_length=150)
-    comprobante = models.FileField(upload_to="comprobantes/")
+    comprobante = ComprobanteField(upload_to="comprobantes/")
     notas = models.TextField(blank=True)
     creado_en = models.DateTimeField(auto_now_add=True)
 
@@ -118,17 +393,25 @@ class PagoLote(models.Model):
 
 
 class Pago(models.Model):
-    factura = models.ForeignKey(Factura, on_delete=models.CASCADE, related_name="pagos")
+    # Cubierto por pago_factura_fecha_idx.
+    factura = models.ForeignKey(Factura, on_delete=models.CASCADE, related_name="pagos", db_index=False)
     fecha_pago = models.DateField()
     valor_pagado = models.DecimalField(max_digits=14, decimal_places=2)
     pagado_por = models.CharField(max_length=150, blank=True)
-    comprobante = models.FileField(upload_to="comprobantes/", blank=True, null=True)
+    comprobante = ComprobanteField(upload_to="comprobantes/", blank=True, null=True)
     notas = models.TextField(blank=True)
     creado_en = models.DateTimeField(auto_now_add=True)
+    actualizado_en = models.DateTimeField(auto_now=True)
     lote = models.ForeignKey("PagoLote", null=True, blank=True, on_delete=models.SET_NULL, related_name="pagos")
 
     class Meta:
         ordering = ["-fecha_pago", "-id"]
+        indexes = [
+            models.Index(fields=["factura", "-fecha_pago", "-id"], name="pago_factura_fecha_idx"),
+            models.Index(fields=["-fecha_pago", "-id"], name="pago_fecha_idx"),
+            models.Index(fields=["creado_en", "id"], name="pago_creado_idx"),
+            models.Index(fields=["actualizado_en", "id"], name="pago_actualizado_idx"),
+        ]
 
     def __str__(self):
         return f"Pago {self.valor_pagado} - {self.factura}"
@@ -183,6 +466,52 @@ class CorreoEnvioLog(models.Model):
         return f"{self.get_tipo_display()} - {base} - {'OK' if self.exito else 'ERROR'}"
 
 
+class CorreoPendiente(models.Model):
+    """Correo de recibo por enviar; lo drena el comando procesar_correos."""
+
+    ESTADO_PENDIENTE = "pendiente"
+    ESTADO_ENVIANDO = "enviando"
+    ESTADO_ENVIADO = "enviado"
+    ESTADO_FALLIDO = "fallido"
+
+    ESTADO_CHOICES = [
+        (ESTADO_PENDIENTE, "Pendiente"),
+        (ESTADO_ENVIANDO, "Enviando"),
+        (ESTADO_ENVIADO, "Enviado"),
+        (ESTADO_FALLIDO, "Fallido"),
+    ]
+
+    tipo = models.CharField(max_length=20, choices=CorreoEnvioLog.TIPO_CHOICES)
+    pago = models.ForeignKey(Pago, null=True, blank=True, on_delete=models.CASCADE, related_name="correos_pendientes")
+    lote = models.ForeignKey(PagoLote, null=True, blank=True, on_delete=models.CASCADE, related_name="correos_pendientes")
+    base_url = models.CharField(max_length=255, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default=ESTADO_PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    solicitado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="correos_pendientes_cartera",
+    )
+    creado_en = models.DateTimeField(auto_now_add=True)
+    enviado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "Correo pendiente"
+        verbose_name_plural = "Correos pendientes"
+        indexes = [
+            models.Index(fields=["estado", "proximo_intento"]),
+        ]
+
+    def __str__(self):
+        base = f"Pago #{self.pago_id}" if self.pago_id else f"Lote #{self.lote_id}"
+        return f"{self.get_tipo_display()} - {base} - {self.get_estado_display()}"
+
+
 class EventoAuditoria(models.Model):
     TIPO_FACTURA_CREADA = "factura_creada"
     TIPO_FACTURA_EDITADA = "factura_editada"
@@ -245,6 +574,30 @@ class EventoAuditoria(models.Model):
         return f"{self.tipo} #{self.pk}"
 
 
+class NotificacionProveedorQuerySet(models.QuerySet):
+    """bulk_create y delete ajustan ContadorNotificaciones como save() y delete() de cada notificacion."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        ContadorNotificaciones.objects.aplicar(
+            Counter((notif.usuario_id, notif.proveedor_id) for notif in objs if not notif.leida)
+        )
+        return objs
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            no_leidas = {
+                (fila["usuario_id"], fila["proveedor_id"]): -fila["total"]
+                for fila in self.filter(leida=False).order_by().values("usuario_id", "proveedor_id").annotate(total=Count("pk"))
+            }
+            resultado = super().delete()
+            ContadorNotificaciones.objects.aplicar(no_leidas)
+        return resultado
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class NotificacionProveedor(models.Model):
     TIPO_PAGO_REGISTRADO = "pago_registrado"
     TIPO_LOTE_REGISTRADO = "lote_registrado"
@@ -276,6 +629,10 @@ class NotificacionProveedor(models.Model):
     url_destino = models.CharField(max_length=255, blank=True)
     creada_en = models.DateTimeField(auto_now_add=True)
 
+    objects = NotificacionProveedorQuerySet.as_manager()
+
+    CONTADOR_CAMPOS = ("usuario_id", "proveedor_id", "leida")
+
     class Meta:
         ordering = ["-creada_en", "-id"]
         verbose_name = "Notificacion de proveedor"
@@ -287,3 +644,134 @@ class NotificacionProveedor(models.Model):
 
     def __str__(self):
         return f"{self.titulo} - {self.usuario}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._contador_original = instancia._valores_contador()
+        return instancia
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._contador_original = self._valores_contador()
+
+    def _valores_contador(self):
+        valores = tuple(self.__dict__.get(campo) for campo in self.CONTADOR_CAMPOS)
+        return None if None in valores else valores
+
+    def save(self, *args, **kwargs):
+        nueva = self._state.adding
+        original = None if nueva else getattr(self, "_contador_original", None)
+        super().save(*args, **kwargs)
+        actual = self._valores_contador()
+        update_fields = kwargs.get("update_fields")
+        if original is not None and update_fields is not None:
+            guardados = {self._meta.get_field(campo).attname for campo in update_fields}
+            actual = tuple(
+                valor if campo in guardados else anterior
+                for campo, valor, anterior in zip(self.CONTADOR_CAMPOS, actual, original)
+            )
+        if nueva or original is not None:
+            cambios = Counter()
+            if original is not None and not original[2]:
+                cambios[original[:2]] -= 1
+            if not actual[2]:
+                cambios[actual[:2]] += 1
+            ContadorNotificaciones.objects.aplicar(cambios)
+        self._contador_original = actual
+
+    def delete(self, *args, **kwargs):
+        original = getattr(self, "_contador_original", None) or self._valores_contador()
+        resultado = super().delete(*args, **kwargs)
+        if original is not None and not original[2]:
+            ContadorNotificaciones.objects.aplicar({original[:2]: -1})
+        self._contador_original = None
+        return resultado
+
+    def marcar_leida(self):
+        """Marca la notificacion como leida con un UPDATE condicionado; devuelve False si ya lo estaba."""
+        marcada = bool(NotificacionProveedor.objects.filter(pk=self.pk, leida=False).update(leida=True))
+        if marcada:
+            ContadorNotificaciones.objects.aplicar({(self.usuario_id, self.proveedor_id): -1})
+        self.leida = True
+        self._contador_original = self._valores_contador()
+        return marcada
+
+
+class ContadorNotificacionesQuerySet(models.QuerySet):
+    def ajustar(self, proveedor_id, usuario_ids, delta):
+        """Suma delta a las no leidas de cada usuario con el proveedor; una sola actualizacion en el caso comun."""
+        usuario_ids = set(usuario_ids)
+        if not usuario_ids or not delta:
+            return
+        cambios = {"no_leidas": F("no_leidas") + delta, "actualizado_en": timezone.now()}
+        qs = self.filter(proveedor_id=proveedor_id, usuario_id__in=usuario_ids)
+        if qs.update(**cambios) == len(usuario_ids):
+            return
+        faltantes = usuario_ids - set(qs.values_list("usuario_id", flat=True))
+        self.bulk_create(
+            [self.model(usuario_id=usuario_id, proveedor_id=proveedor_id) for usuario_id in faltantes],
+            ignore_conflicts=True,
+        )
+        self.filter(proveedor_id=proveedor_id, usuario_id__in=faltantes).update(**cambios)
+
+    def aplicar(self, cambios):
+        """Aplica {(usuario_id, proveedor_id): delta} con una actualizacion por proveedor y delta."""
+        grupos = defaultdict(set)
+        for (usuario_id, proveedor_id), delta in cambios.items():
+            if delta:
+                grupos[(proveedor_id, delta)].add(usuario_id)
+        for (proveedor_id, delta), usuario_ids in sorted(grupos.items()):
+            self.ajustar(proveedor_id, usuario_ids, delta)
+
+
+class ContadorNotificaciones(models.Model):
+    """No leidas por usuario y proveedor; lo mantienen save(), delete() y el manager de NotificacionProveedor."""
+
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="contadores_notificaciones")
+    proveedor = models.ForeignKey(Proveedor, on_delete=models.CASCADE, related_name="contadores_notificaciones")
+    no_leidas = models.IntegerField(default=0)
+    actualizado_en = models.DateTimeField(default=timezone.now)
+
+    objects = ContadorNotificacionesQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["usuario_id", "proveedor_id"]
+        verbose_name = "Contador de notificaciones"
+        verbose_name_plural = "Contadores de notificaciones"
+        constraints = [
+            models.UniqueConstraint(fields=["usuario", "proveedor"], name="unique_contador_notificaciones"),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario} - {self.proveedor}: {self.no_leidas}"
+
+
+class SaldoResumen(models.Model):
+    """Acumulado de facturas por proveedor, punto de venta y estado; lo mantiene services.balances."""
+
+    proveedor = models.ForeignKey(Proveedor, on_delete=models.CASCADE, related_name="saldos_resumen")
+    punto_venta = models.ForeignKey(PuntoVenta, on_delete=models.CASCADE, related_name="saldos_resumen")
+    estado = models.CharField(max_length=10, choices=Factura.ESTADOS)
+    facturas = models.IntegerField(default=0)
+    valor_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    total_pagado = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["proveedor__nombre", "punto_venta__nombre", "estado"]
+        verbose_name = "Resumen de saldo"
+        verbose_name_plural = "Resumen de saldos"
+        constraints = [
+            models.UniqueConstraint(fields=["proveedor", "punto_venta", "estado"], name="unique_saldo_resumen"),
+        ]
+        indexes = [
+            models.Index(fields=["estado", "punto_venta"]),
+        ]
+
+    def __str__(self):
+        return f"{self.proveedor_id}/{self.punto_venta_id}/{self.estado}: {self.facturas}"
+
+    @property
+    def saldo(self):
+        return (self.valor_total or 0) - (self.total_pagado or 0)
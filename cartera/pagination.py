@@ -0,0 +1,291 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+CURSOR_PARAM = "cursor"
+KEYSET_COUNT_LIMIT = 1000
+API_MAX_PAGE_SIZE = 1000
+
+
+class CursorInvalido(ValueError):
+    """El cursor no se puede decodificar o no corresponde al ordenamiento del listado."""
+
+
+def _json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(direction, values=None):
+    payload = {"d": direction}
+    if values is not None:
+        payload["k"] = [_json_value(v) for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError, UnicodeEncodeError):
+        return None
+    if not isinstance(payload, dict) or payload.get("d") not in {"next", "prev"}:
+        return None
+    values = payload.get("k")
+    if values is not None and not isinstance(values, list):
+        return None
+    return payload["d"], values
+
+
+def approximate_count(queryset, limit=KEYSET_COUNT_LIMIT):
+    """
+    Devuelve (conteo, es_exacto). En PostgreSQL usa la estimacion del planner;
+    en otros motores cuenta como maximo `limit` filas.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"]), False
+    total = queryset.order_by().values("pk")[: limit + 1].count()
+    if total > limit:
+        return limit, False
+    return total, True
+
+
+class KeysetPage:
+    def __init__(self, paginator, object_list, *, has_next, has_previous):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self._count = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return encode_cursor("next", self.paginator.key_for(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return encode_cursor("prev", self.paginator.key_for(self.object_list[0]))
+
+    @property
+    def last_cursor(self):
+        return encode_cursor("prev") if self._has_next else None
+
+    def _approximate(self):
+        if self._count is None:
+            self._count = approximate_count(self.paginator.queryset)
+        return self._count
+
+    @property
+    def approximate_count(self):
+        if not self.paginator.with_count:
+            return None
+        return self._approximate()[0]
+
+    @property
+    def count_is_exact(self):
+        if not self.paginator.with_count:
+            return False
+        return self._approximate()[1]
+
+
+class KeysetPaginator:
+    """
+    Paginacion por llave (seek) sobre un ordenamiento estable que termina en `id`; admite
+    anotaciones del queryset (como la relevancia de una busqueda) como parte de la llave.
+    Cada pagina filtra a partir de la ultima fila vista, sin OFFSET ni COUNT(*).
+    """
+
+    def __init__(self, queryset, per_page, ordering=("-fecha_factura", "-id"), *, with_count=False):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.with_count = with_count
+        self.fields = [item.lstrip("-") for item in self.ordering]
+        self.descending = [item.startswith("-") for item in self.ordering]
+
+    def key_for(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def _parse_key(self, values):
+        if values is None:
+            return None
+        if len(values) != len(self.fields):
+            raise CursorInvalido("La llave del cursor no coincide con el ordenamiento.")
+        opts = self.queryset.model._meta
+        anotaciones = self.queryset.query.annotations
+        try:
+            return [
+                (anotaciones[field].output_field if field in anotaciones else opts.get_field(field)).to_python(raw)
+                for field, raw in zip(self.fields, values)
+            ]
+        except (ValidationError, TypeError, ValueError) as exc:
+            raise CursorInvalido("La llave del cursor no es valida.") from exc
+
+    def _leer_cursor(self, token):
+        if not token:
+            return "next", None
+        cursor = decode_cursor(token)
+        if cursor is None:
+            raise CursorInvalido("El cursor no se puede decodificar.")
+        direction, values = cursor
+        return direction, self._parse_key(values)
+
+    def _seek_filter(self, key, *, backwards):
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            descending = self.descending[index] != backwards
+            step = Q(**{f"{field}__{'lt' if descending else 'gt'}": key[index]})
+            for prev_field, prev_value in zip(self.fields[:index], key[:index]):
+                step &= Q(**{prev_field: prev_value})
+            condition |= step
+        return condition
+
+    def _reversed_ordering(self):
+        return [field if desc else f"-{field}" for field, desc in zip(self.fields, self.descending)]
+
+    def page(self, token=None, *, estricto=False):
+        """
+        Pagina a partir del cursor. Un cursor invalido muestra la primera pagina en los listados HTML;
+        con estricto=True (la API) se levanta CursorInvalido para no perder la posicion del cliente.
+        """
+        try:
+            direction, key = self._leer_cursor(token)
+        except CursorInvalido:
+            if estricto:
+                raise
+            direction, key = "next", None
+        backwards = direction == "prev"
+
+        qs = self.queryset.order_by(*(self._reversed_ordering() if backwards else self.ordering))
+        if key is not None:
+            qs = qs.filter(self._seek_filter(key, backwards=backwards))
+        rows = list(qs[: self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+
+        if backwards:
+            rows.reverse()
+            return KeysetPage(self, rows, has_next=key is not None, has_previous=has_more)
+        return KeysetPage(self, rows, has_next=has_more, has_previous=key is not None)
+
+
+def keyset_paginate(request, queryset, per_page, ordering=("-fecha_factura", "-id"), *, with_count=False):
+    paginator = KeysetPaginator(queryset, per_page, ordering, with_count=with_count)
+    return paginator.page(request.GET.get(CURSOR_PARAM))
+
+
+class KeysetPaginationMixin:
+    """Sustituye el Paginator de los ListView por paginacion por llave."""
+
+    keyset_ordering = ("-id",)
+
+    def paginate_queryset(self, queryset, page_size):
+        page = keyset_paginate(self.request, queryset, page_size, self.keyset_ordering)
+        return page.paginator, page, page.object_list, page.has_other_pages()
+
+
+def orden_con_desempate(ordering):
+    """Agrega `id` al final del ordenamiento (en el sentido del primer campo) para que la llave sea unica."""
+    ordering = [str(item) for item in ordering if str(item).lstrip("-") != "pk"]
+    if not ordering:
+        return ("id",)
+    if not any(item.lstrip("-") == "id" for item in ordering):
+        ordering.append("-id" if ordering[0].startswith("-") else "id")
+    return tuple(ordering)
+
+
+class ApiCursorPagination(BasePagination):
+    """
+    Paginacion por llave para la API: `?cursor=` opaco, sin COUNT ni OFFSET. La llave es el orden
+    que ya trae el queryset (el de la vista o el de `?ordering=`) con `id` como desempate.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = API_MAX_PAGE_SIZE
+    cursor_query_param = CURSOR_PARAM
+    invalid_cursor_message = "Cursor inválido."
+
+    def get_page_size(self, request):
+        try:
+            solicitado = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(solicitado, self.max_page_size) if solicitado > 0 else self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        paginator = KeysetPaginator(queryset, self.get_page_size(request), orden_con_desempate(ordering))
+        try:
+            self.page = paginator.page(request.query_params.get(self.cursor_query_param), estricto=True)
+        except CursorInvalido:
+            raise NotFound(self.invalid_cursor_message)
+        return list(self.page.object_list)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self._link(self.page.next_cursor),
+                "previous": self._link(self.page.previous_cursor),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
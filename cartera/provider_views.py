@@ -3,18 +3,27 @@ from urllib.parse import urlparse
 
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.db.models import Count, F, Q, Sum
+from django.db.models import F, Q, Sum
 from django.shortcuts import redirect, render
 from django.urls import reverse
 from django.utils.dateparse import parse_date
+from django.utils.functional import SimpleLazyObject
 from django.views.generic import DetailView, ListView, TemplateView, View
 
 from .forms import NovedadProveedorForm
 from .models import EventoAuditoria, Pago, PagoLote
+from .pagination import KeysetPaginationMixin, keyset_paginate
 from .services.audit import registrar_evento
+from .services.balances import saldos_visibles
 from .services.payments import confirmar_factura, confirmar_lote
-from .services.provider_notifications import marcar_notificacion_leida, notificar_confirmacion, notificar_novedad
+from .services.previews import vistas_previas
+from .services.provider_notifications import (
+    marcar_notificacion_leida,
+    marcar_todas_leidas,
+    notificar_confirmacion,
+    notificar_novedad,
+    resumen_notificaciones,
+)
 from .services.provider_scope import (
     facturas_visibles,
     get_factura_for_user,
@@ -24,23 +33,16 @@ from .services.provider_scope import (
     lotes_visibles,
     notificaciones_visibles,
     pagos_visibles,
-    proveedor_links,
-    proveedores_activos,
+    portal_scope,
     require_can_confirm,
     require_portal_access,
     validate_comprobante_access,
 )
+from .services.search import buscar_facturas
 
 
-def _paginate(request, qs, per_page=25):
-    paginator = Paginator(qs, per_page)
-    page = request.GET.get("page")
-    try:
-        return paginator.page(page)
-    except PageNotAnInteger:
-        return paginator.page(1)
-    except EmptyPage:
-        return paginator.page(paginator.num_pages)
+def _paginate(request, qs, ordering, per_page=25):
+    return keyset_paginate(request, qs, per_page, ordering)
 
 
 def _parse_date(raw, fallback=None):
@@ -61,12 +63,14 @@ def _safe_portal_url(target):
 
 class PortalProveedorMixin(LoginRequiredMixin):
     proveedores = None
+    alcance = None
 
     def dispatch(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return self.handle_no_permission()
-        require_portal_access(request.user)
-        self.proveedores = list(proveedores_activos(request.user))
+        self.alcance = portal_scope(request)
+        require_portal_access(self.alcance)
+        self.proveedores = self.alcance.proveedores
         return super().dispatch(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
@@ -74,11 +78,11 @@ class PortalProveedorMixin(LoginRequiredMixin):
             ctx = super().get_context_data(**kwargs)
         except AttributeError:
             ctx = {}
-        notifs = notificaciones_visibles(self.request.user)
+        resumen = resumen_notificaciones(self.alcance)
         ctx.update({
             "portal_proveedores": self.proveedores,
-            "portal_unread_count": notifs.filter(leida=False).count(),
-            "portal_latest_notifications": notifs[:5],
+            "portal_unread_count": resumen.no_leidas,
+            "portal_latest_notifications": SimpleLazyObject(resumen.ultimas),
         })
         return ctx
 
@@ -88,33 +92,37 @@ class PortalProveedorDashboardView(PortalProveedorMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        facturas = facturas_visibles(self.request.user)
-        pagos = pagos_visibles(self.request.user)
-        lotes = lotes_visibles(self.request.user)
-        pendientes = facturas.filter(estado="pendiente")
+        pagos = pagos_visibles(self.alcance)
+        lotes = lotes_visibles(self.alcance)
+        saldos = saldos_visibles(proveedor_ids=[p.id for p in self.proveedores])
+        pendientes = saldos.filter(estado="pendiente").aggregate(
+            facturas=Sum("facturas"),
+            total=Sum(F("valor_total") - F("total_pagado")),
+        )
         ctx.update({
-            "total_pendiente": pendientes.aggregate(total=Sum(F("valor_factura") - F("total_pagado")))["total"] or Decimal("0"),
+            "total_pendiente": pendientes["total"] or Decimal("0"),
             "total_pagado": pagos.aggregate(total=Sum("valor_pagado"))["total"] or Decimal("0"),
-            "facturas_pendientes": pendientes.count(),
+            "facturas_pendientes": pendientes["facturas"] or 0,
             "pagos_por_confirmar": pagos.filter(factura__confirmado_pago=False).count(),
             "lotes_por_confirmar": lotes.filter(pagos__factura__confirmado_pago=False).distinct().count(),
             "pagos_recientes": pagos.order_by("-fecha_pago", "-id")[:6],
-            "resumen_pdv": facturas.values("punto_venta__nombre").annotate(
-                facturas=Count("id"),
-                total=Sum(F("valor_factura") - F("total_pagado")),
+            "resumen_pdv": saldos.values("punto_venta__nombre").annotate(
+                facturas=Sum("facturas"),
+                total=Sum(F("valor_total") - F("total_pagado")),
             ).order_by("punto_venta__nombre"),
-            "notificaciones": notificaciones_visibles(self.request.user)[:6],
+            "notificaciones": notificaciones_visibles(self.alcance)[:6],
         })
         return ctx
 
 
-class PortalFacturaListView(PortalProveedorMixin, ListView):
+class PortalFacturaListView(PortalProveedorMixin, KeysetPaginationMixin, ListView):
     template_name = "cartera/portal_proveedor/facturas.html"
     context_object_name = "facturas"
     paginate_by = 25
+    keyset_ordering = ("-fecha_factura", "-id")
 
     def get_queryset(self):
-        qs = facturas_visibles(self.request.user)
+        qs = facturas_visibles(self.alcance)
         q = (self.request.GET.get("q") or "").strip()
         pdv = (self.request.GET.get("pdv") or "").strip()
         estado = (self.request.GET.get("estado") or "").strip()
@@ -122,8 +130,6 @@ class PortalFacturaListView(PortalProveedorMixin, ListView):
         desde = _parse_date(self.request.GET.get("desde"))
         hasta = _parse_date(self.request.GET.get("hasta"))
 
-        if q:
-            qs = qs.filter(Q(numero_factura__icontains=q) | Q(punto_venta__nombre__icontains=q))
         if pdv:
             qs = qs.filter(punto_venta__nombre__icontains=pdv)
         if estado in {"pendiente", "pagada"}:
@@ -136,7 +142,10 @@ class PortalFacturaListView(PortalProveedorMixin, ListView):
             qs = qs.filter(fecha_factura__gte=desde)
         if hasta:
             qs = qs.filter(fecha_factura__lte=hasta)
-        return qs.order_by("-fecha_factura", "-id")
+        if q:
+            qs = buscar_facturas(qs, q, ordenar=True)
+            self.keyset_ordering = ("-relevancia", "-fecha_factura", "-id")
+        return qs.order_by(*self.keyset_ordering)
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
@@ -149,12 +158,12 @@ class PortalFacturaDetailView(PortalProveedorMixin, DetailView):
     context_object_name = "factura"
 
     def get_object(self, queryset=None):
-        return get_factura_for_user(self.request.user, self.kwargs["pk"])
+        return get_factura_for_user(self.alcance, self.kwargs["pk"])
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         factura = self.object
-        pagos = pagos_visibles(self.request.user).filter(factura=factura).order_by("-fecha_pago", "-id")
+        pagos = pagos_visibles(self.alcance).filter(factura=factura).order_by("-fecha_pago", "-id")
         ctx.update({
             "pagos": pagos,
             "eventos": EventoAuditoria.objects.filter(
@@ -167,13 +176,14 @@ class PortalFacturaDetailView(PortalProveedorMixin, DetailView):
         return ctx
 
 
-class PortalPagoListView(PortalProveedorMixin, ListView):
+class PortalPagoListView(PortalProveedorMixin, KeysetPaginationMixin, ListView):
     template_name = "cartera/portal_proveedor/pagos.html"
     context_object_name = "pagos"
     paginate_by = 25
+    keyset_ordering = ("-fecha_pago", "-id")
 
     def get_queryset(self):
-        qs = pagos_visibles(self.request.user)
+        qs = pagos_visibles(self.alcance)
         estado = (self.request.GET.get("confirmacion") or "").strip()
         if estado == "confirmados":
             qs = qs.filter(factura__confirmado_pago=True)
@@ -187,7 +197,7 @@ class PortalPagoListView(PortalProveedorMixin, ListView):
         lotes_pendientes = []
         if estado == "sin_confirmar":
             lotes_pendientes = list(
-                lotes_visibles(self.request.user)
+                lotes_visibles(self.alcance)
                 .filter(pagos__factura__confirmado_pago=False)
                 .distinct()
                 .order_by("-fecha_pago", "-id")
@@ -202,9 +212,9 @@ class PortalPagoListView(PortalProveedorMixin, ListView):
 
 class PortalPagoConfirmView(PortalProveedorMixin, View):
     def post(self, request, pk):
-        pago = get_pago_for_user(request.user, pk)
+        pago = get_pago_for_user(self.alcance, pk)
         proveedor = pago.factura.proveedor
-        require_can_confirm(request.user, proveedor)
+        require_can_confirm(self.alcance, proveedor)
         if pago.factura.confirmado_pago:
             messages.info(request, "Este pago ya estaba confirmado.")
             return redirect("portal_proveedor_factura_detail", pk=pago.factura_id)
@@ -223,7 +233,7 @@ class PortalPagoConfirmView(PortalProveedorMixin, View):
         return redirect("portal_proveedor_factura_detail", pk=pago.factura_id)
 
     def get(self, request, pk):
-        pago = get_pago_for_user(request.user, pk)
+        pago = get_pago_for_user(self.alcance, pk)
         messages.info(request, "Usa el boton de confirmacion para registrar la recepcion.")
         return redirect("portal_proveedor_factura_detail", pk=pago.factura_id)
 
@@ -233,7 +243,7 @@ class PortalLoteDetailView(PortalProveedorMixin, DetailView):
     context_object_name = "lote"
 
     def get_object(self, queryset=None):
-        return get_lote_for_user(self.request.user, self.kwargs["pk"])
+        return get_lote_for_user(self.alcance, self.kwargs["pk"])
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
@@ -251,9 +261,9 @@ class PortalLoteDetailView(PortalProveedorMixin, DetailView):
 
 class PortalLoteConfirmView(PortalProveedorMixin, View):
     def post(self, request, pk):
-        lote = get_lote_for_user(request.user, pk)
+        lote = get_lote_for_user(self.alcance, pk)
         proveedor = lote.proveedor
-        require_can_confirm(request.user, proveedor)
+        require_can_confirm(self.alcance, proveedor)
         pagos = lote.pagos.select_related("factura")
         if pagos.exists() and not pagos.filter(factura__confirmado_pago=False).exists():
             messages.info(request, "Este lote ya estaba confirmado.")
@@ -272,7 +282,7 @@ class PortalLoteConfirmView(PortalProveedorMixin, View):
         return redirect("portal_proveedor_lote_detail", pk=lote.pk)
 
     def get(self, request, pk):
-        get_lote_for_user(request.user, pk)
+        get_lote_for_user(self.alcance, pk)
         messages.info(request, "Usa el boton de confirmacion para registrar la recepcion del lote.")
         return redirect("portal_proveedor_lote_detail", pk=pk)
 
@@ -288,7 +298,7 @@ class PortalNovedadListView(PortalProveedorMixin, TemplateView):
             | Q(pago__factura__proveedor_id__in=ids)
             | Q(lote__proveedor_id__in=ids)
         )
-        ctx["page_obj"] = _paginate(self.request, qs.order_by("-creado_en", "-id"))
+        ctx["page_obj"] = _paginate(self.request, qs, ("-creado_en", "-id"))
         ctx["novedades"] = ctx["page_obj"].object_list
         return ctx
 
@@ -379,28 +389,29 @@ class PortalPagoNovedadView(PortalNovedadBaseView):
     target_type = "pago"
 
     def get_target(self):
-        return get_pago_for_user(self.request.user, self.kwargs["pk"])
+        return get_pago_for_user(self.alcance, self.kwargs["pk"])
 
 
 class PortalLoteNovedadView(PortalNovedadBaseView):
     target_type = "lote"
 
     def get_target(self):
-        return get_lote_for_user(self.request.user, self.kwargs["pk"])
+        return get_lote_for_user(self.alcance, self.kwargs["pk"])
 
 
-class PortalNotificacionListView(PortalProveedorMixin, ListView):
+class PortalNotificacionListView(PortalProveedorMixin, KeysetPaginationMixin, ListView):
     template_name = "cartera/portal_proveedor/notificaciones.html"
     context_object_name = "notificaciones"
     paginate_by = 25
+    keyset_ordering = ("-creada_en", "-id")
 
     def get_queryset(self):
-        return notificaciones_visibles(self.request.user).order_by("-creada_en", "-id")
+        return notificaciones_visibles(self.alcance).order_by("-creada_en", "-id")
 
 
 class PortalNotificacionLeerView(PortalProveedorMixin, View):
     def post(self, request, pk):
-        notif = get_notificacion_for_user(request.user, pk)
+        notif = get_notificacion_for_user(self.alcance, pk)
         marcar_notificacion_leida(notif, request=request)
         target = _safe_portal_url(notif.url_destino)
         if target:
@@ -408,17 +419,36 @@ class PortalNotificacionLeerView(PortalProveedorMixin, View):
         return redirect("portal_proveedor_notificaciones")
 
     def get(self, request, pk):
-        notif = get_notificacion_for_user(request.user, pk)
+        notif = get_notificacion_for_user(self.alcance, pk)
         target = _safe_portal_url(notif.url_destino)
         if target:
             return redirect(target)
         return redirect("portal_proveedor_notificaciones")
 
 
+class PortalNotificacionLeerTodasView(PortalProveedorMixin, View):
+    def post(self, request):
+        marcadas = marcar_todas_leidas(self.alcance, request=request)
+        if marcadas:
+            messages.success(request, f"{marcadas} notificación(es) marcada(s) como leída(s).")
+        else:
+            messages.info(request, "No tienes notificaciones sin leer.")
+        return redirect("portal_proveedor_notificaciones")
+
+    def get(self, request):
+        return redirect("portal_proveedor_notificaciones")
+
+
 class PortalComprobanteView(PortalProveedorMixin, View):
     def get(self, request, pago_id):
-        pago = get_pago_for_user(request.user, pago_id)
-        validate_comprobante_access(request.user, pago)
+        pago = get_pago_for_user(self.alcance, pago_id)
+        validate_comprobante_access(self.alcance, pago)
+        # Por defecto la vista previa liviana si ya existe; ?original=1 entrega el archivo subido.
+        original = bool(request.GET.get("original"))
+        archivo = pago.comprobante
+        if not original:
+            derivado = vistas_previas([archivo.name]).get(archivo.name)
+            archivo = derivado.vista_previa if derivado else archivo
         registrar_evento(
             EventoAuditoria.TIPO_COMPROBANTE_VISUALIZADO,
             factura=pago.factura,
@@ -430,6 +460,7 @@ class PortalComprobanteView(PortalProveedorMixin, View):
                 "origen": "portal_proveedor",
                 "proveedor_id": pago.factura.proveedor_id,
                 "filename": pago.comprobante.name,
+                "original": original,
             },
         )
-        return redirect(pago.comprobante.url)
+        return redirect(archivo.url)
@@ -1,17 +1,194 @@
 from decimal import Decimal
 
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Upper
 from django.utils import timezone
 from rest_framework import serializers
 
-from .models import Factura, Pago, Proveedor, PuntoVenta
+from .models import FACTURA_DUPLICADA_ERROR, Factura, Pago, Proveedor, PuntoVenta
 from .scoping import get_user_pdv, is_global_user, resolve_allowed_pdv
-from .services.invoices import guardar_factura_desde_form
-from .services.payments import crear_pago
+from .services.invoices import guardar_factura_desde_form, guardar_facturas_lote
+from .services.payments import actualizar_pagos, crear_pago, crear_pagos
 from .validators import validate_comprobante_file
 
 
 MAX_FACTURA_API = Decimal("10000000")
 
+# Columnas que lee cada campo de FacturaSerializer y PagoSerializer. Los listados de la API cargan
+# solo las de los campos pedidos; fecha_pago sale de una subconsulta anotada.
+FACTURA_API_COLUMNAS = {
+    "id": (),
+    "proveedor": ("proveedor",),
+    "proveedor_nombre": ("proveedor__nombre",),
+    "punto_venta": ("punto_venta",),
+    "punto_venta_nombre": ("punto_venta__nombre",),
+    "numero_factura": ("numero_factura",),
+    "fecha_factura": ("fecha_factura",),
+    "valor_factura": ("valor_factura",),
+    "total_pagado": ("total_pagado",),
+    "saldo": ("valor_factura", "total_pagado"),
+    "estado": ("estado",),
+    "fecha_pago": (),
+    "creado_en": ("creado_en",),
+    "actualizado_en": ("actualizado_en",),
+    "creado_por": ("creado_por",),
+    "confirmado_pago": ("confirmado_pago",),
+    "confirmado_fecha": ("confirmado_fecha",),
+    "confirmado_por_email": ("confirmado_por_email",),
+}
+PAGO_API_COLUMNAS = {
+    "id": (),
+    "factura": ("factura",),
+    "factura_numero": ("factura__numero_factura",),
+    "proveedor_nombre": ("factura__proveedor__nombre",),
+    "proveedor_email": ("factura__proveedor__email",),
+    "punto_venta": ("factura__punto_venta",),
+    "punto_venta_nombre": ("factura__punto_venta__nombre",),
+    "fecha_pago": ("fecha_pago",),
+    "valor_pagado": ("valor_pagado",),
+    "pagado_por": ("pagado_por",),
+    "comprobante": ("comprobante",),
+    "notas": ("notas",),
+    "lote": ("lote",),
+    "creado_en": ("creado_en",),
+    "actualizado_en": ("actualizado_en",),
+}
+CAMPOS_PARAM = "fields"
+
+
+def campos_solicitados(request, disponibles):
+    """
+    Campos pedidos con `?fields=a,b` en una lectura, en el orden de `disponibles`; None si no se pidio
+    ninguno. Un campo que no existe es un error de validacion.
+    """
+    if request is None or request.method not in ("GET", "HEAD", "OPTIONS"):
+        return None
+    pedidos = {campo.strip() for campo in request.query_params.get(CAMPOS_PARAM, "").split(",") if campo.strip()}
+    if not pedidos:
+        return None
+    desconocidos = sorted(pedidos.difference(disponibles))
+    if desconocidos:
+        raise serializers.ValidationError({CAMPOS_PARAM: [f"Campos desconocidos: {', '.join(desconocidos)}."]})
+    return [campo for campo in disponibles if campo in pedidos]
+
+
+def _optimizar(queryset, mapa, campos, extra):
+    columnas = {columna for campo in (campos or mapa) for columna in mapa[campo]}
+    columnas.update(extra)
+    relaciones = sorted({columna.rsplit("__", 1)[0] for columna in columnas if "__" in columna})
+    queryset = queryset.select_related(None)
+    if relaciones:
+        # select_related() sin argumentos seguiria todas las FK.
+        queryset = queryset.select_related(*relaciones)
+    return queryset.only("id", *sorted(columnas))
+
+
+def facturas_para_api(queryset, campos=None, extra=()):
+    """
+    Limita las columnas y los joins a los campos que va a serializar FacturaSerializer (todos, o los
+    de `campos`) mas las columnas de `extra`, y anota la fecha del ultimo pago si se pidio.
+    """
+    queryset = _optimizar(queryset, FACTURA_API_COLUMNAS, campos, extra)
+    if campos is None or "fecha_pago" in campos:
+        ultimo_pago = Pago.objects.filter(factura=OuterRef("pk")).order_by("-fecha_pago", "-id").values("fecha_pago")[:1]
+        queryset = queryset.annotate(fecha_ultimo_pago=Subquery(ultimo_pago))
+    return queryset
+
+
+def pagos_para_api(queryset, campos=None, extra=()):
+    """Como facturas_para_api para PagoSerializer: factura, proveedor y PDV en la misma consulta si se piden."""
+    return _optimizar(queryset, PAGO_API_COLUMNAS, campos, extra)
+
+
+class CamposSolicitadosMixin:
+    """En lecturas con `?fields=` el serializer conserva solo esos campos."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        campos = campos_solicitados(self.context.get("request"), list(self.fields))
+        if campos is not None:
+            for nombre in set(self.fields) - set(campos):
+                self.fields.pop(nombre)
+
+
+def _llaves(items, campo):
+    llaves = set()
+    for item in items:
+        valor = item.get(campo) if isinstance(item, dict) else None
+        if isinstance(valor, int) and not isinstance(valor, bool):
+            llaves.add(valor)
+        elif isinstance(valor, str) and valor.strip().isdigit():
+            llaves.add(int(valor))
+    return llaves
+
+
+class ContextoMasivo:
+    """
+    Lo que cada item de una carga masiva consultaria por separado (objetos relacionados, numeros de
+    factura registrados, facturas con pago, nombres de PDV), leido una vez para todo el lote. Lo que
+    se acepta en el lote se anota aqui para rechazar repetidos entre items.
+    """
+
+    def __init__(self, *, relacionados=None, numeros=None, con_pago=(), pdvs=None):
+        self.relacionados = relacionados or {}
+        self.numeros = dict(numeros or {})
+        self.con_pago = set(con_pago)
+        self.pdvs = pdvs
+
+    @classmethod
+    def para_facturas(cls, items, instancias):
+        proveedores = Proveedor.objects.in_bulk(_llaves(items, "proveedor"))
+        numeros = {
+            str(item.get("numero_factura") or "").strip().upper() for item in items if isinstance(item, dict)
+        } | {factura.numero_factura.upper() for factura in instancias.values()}
+        numeros.discard("")
+        registrados = {}
+        if numeros:
+            registrados = {
+                (proveedor_id, numero): pk
+                for pk, proveedor_id, numero in Factura.objects.annotate(numero_normalizado=Upper("numero_factura"))
+                .filter(
+                    proveedor_id__in=set(proveedores) | {f.proveedor_id for f in instancias.values()},
+                    numero_normalizado__in=numeros,
+                )
+                .values_list("pk", "proveedor_id", "numero_normalizado")
+            }
+        con_pago = Pago.objects.filter(factura_id__in=list(instancias)).values_list("factura_id", flat=True) if instancias else ()
+        return cls(
+            relacionados={Proveedor: proveedores, PuntoVenta: PuntoVenta.objects.in_bulk(_llaves(items, "punto_venta"))},
+            numeros=registrados,
+            con_pago=con_pago,
+        )
+
+    @classmethod
+    def para_pagos(cls, items, instancias):
+        facturas = Factura.objects.select_related("proveedor", "punto_venta").in_bulk(_llaves(items, "factura"))
+        return cls(
+            relacionados={Factura: facturas},
+            con_pago=Pago.objects.filter(factura_id__in=list(facturas)).values_list("factura_id", flat=True) if facturas else (),
+            pdvs={nombre.lower() for nombre in PuntoVenta.objects.values_list("nombre", flat=True)},
+        )
+
+
+class RelacionPorLlave(serializers.PrimaryKeyRelatedField):
+    """En una carga masiva toma el objeto ya leido por ContextoMasivo en lugar de consultarlo."""
+
+    def to_internal_value(self, data):
+        masivo = self.context.get("masivo")
+        leidos = masivo.relacionados.get(self.get_queryset().model) if masivo else None
+        if leidos is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            objeto = leidos.get(int(data))
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if objeto is None:
+            self.fail("does_not_exist", pk_value=data)
+        return objeto
+
 
 class PuntoVentaSerializer(serializers.ModelSerializer):
     class Meta:
@@ -27,12 +204,13 @@ class ProveedorSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "creado_en"]
 
 
-class FacturaSerializer(serializers.ModelSerializer):
+class FacturaSerializer(CamposSolicitadosMixin, serializers.ModelSerializer):
+    serializer_related_field = RelacionPorLlave
     proveedor_nombre = serializers.CharField(source="proveedor.nombre", read_only=True)
     punto_venta_nombre = serializers.CharField(source="punto_venta.nombre", read_only=True)
     saldo = serializers.SerializerMethodField()
     fecha_pago = serializers.SerializerMethodField()
-    punto_venta = serializers.PrimaryKeyRelatedField(queryset=PuntoVenta.objects.all(), required=False)
+    punto_venta = RelacionPorLlave(queryset=PuntoVenta.objects.all(), required=False)
 
     class Meta:
         model = Factura
@@ -75,8 +253,13 @@ class FacturaSerializer(serializers.ModelSerializer):
         return obj.saldo
 
     def get_fecha_pago(self, obj):
-        pago = obj.pagos.order_by("-fecha_pago", "-id").first()
-        return pago.fecha_pago.isoformat() if pago and pago.fecha_pago else None
+        # Los listados traen la fecha anotada (facturas_para_api); una factura suelta la consulta.
+        if hasattr(obj, "fecha_ultimo_pago"):
+            fecha = obj.fecha_ultimo_pago
+        else:
+            pago = obj.pagos.order_by("-fecha_pago", "-id").first()
+            fecha = pago.fecha_pago if pago else None
+        return fecha.isoformat() if fecha else None
 
     def _user(self):
         request = self.context.get("request")
@@ -110,49 +293,95 @@ class FacturaSerializer(serializers.ModelSerializer):
         elif not requested_pdv and not self.instance:
             raise serializers.ValidationError({"punto_venta": "Debes seleccionar un Punto de Venta."})
 
+        masivo = self.context.get("masivo")
         proveedor = attrs.get("proveedor", getattr(self.instance, "proveedor", None))
         numero = attrs.get("numero_factura", getattr(self.instance, "numero_factura", None))
-        if proveedor and numero:
-            qs = Factura.objects.filter(proveedor=proveedor, numero_factura__iexact=numero)
-            if self.instance:
-                qs = qs.exclude(pk=self.instance.pk)
-            if qs.exists():
-                raise serializers.ValidationError({"numero_factura": "Ya existe una factura con ese proveedor y ese número."})
-
-        if self.instance and (self.instance.pagos.exists() or self.instance.confirmado_pago):
-            protected = {"proveedor", "punto_venta", "numero_factura", "fecha_factura", "valor_factura", "estado"}
-            if protected.intersection(attrs):
-                raise serializers.ValidationError("Esta factura ya tiene pago o confirmación y no se puede editar por API.")
-
+        llave = (proveedor.pk, numero.upper()) if proveedor and numero else None
+        if llave and masivo:
+            registrada = masivo.numeros.get(llave)
+            if registrada is not None and registrada != getattr(self.instance, "pk", None):
+                mensaje = FACTURA_DUPLICADA_ERROR if isinstance(registrada, int) else "Factura repetida en la solicitud."
+                raise serializers.ValidationError({"numero_factura": [mensaje]})
+        elif llave:
+            candidata = Factura(pk=getattr(self.instance, "pk", None), proveedor=proveedor, numero_factura=numero)
+            candidata._state.adding = self.instance is None
+            try:
+                candidata.validate_constraints()
+            except DjangoValidationError as exc:
+                raise serializers.ValidationError(exc.message_dict)
+
+        if self.instance:
+            con_pago = self.instance.pk in masivo.con_pago if masivo else self.instance.pagos.exists()
+            if con_pago or self.instance.confirmado_pago:
+                protected = {"proveedor", "punto_venta", "numero_factura", "fecha_factura", "valor_factura", "estado"}
+                if protected.intersection(attrs):
+                    raise serializers.ValidationError("Esta factura ya tiene pago o confirmación y no se puede editar por API.")
+
+        if llave and masivo:
+            # Los siguientes items del lote no pueden reutilizar este numero.
+            masivo.numeros[llave] = getattr(self.instance, "pk", None) or "solicitud"
         return attrs
 
     def create(self, validated_data):
         request = self.context.get("request")
         user = getattr(request, "user", None)
         factura = Factura(**validated_data)
-        return guardar_factura_desde_form(
-            factura,
-            created=True,
-            usuario=user,
-            request=request,
-            auto_payment_note="Pago auto-generado al crear la factura como PAGADA via API.",
-        )
+        try:
+            return guardar_factura_desde_form(
+                factura,
+                created=True,
+                usuario=user,
+                request=request,
+                auto_payment_note="Pago auto-generado al crear la factura como PAGADA via API.",
+            )
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.message_dict)
 
     def update(self, instance, validated_data):
         request = self.context.get("request")
         user = getattr(request, "user", None)
         for field, value in validated_data.items():
             setattr(instance, field, value)
-        return guardar_factura_desde_form(
-            instance,
-            created=False,
-            usuario=user,
-            request=request,
-            auto_payment_note="Pago auto-generado al marcar la factura como PAGADA via API.",
-        )
-
-
-class PagoSerializer(serializers.ModelSerializer):
+        try:
+            return guardar_factura_desde_form(
+                instance,
+                created=False,
+                usuario=user,
+                request=request,
+                auto_payment_note="Pago auto-generado al marcar la factura como PAGADA via API.",
+            )
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.message_dict)
+
+    @classmethod
+    def guardar_masivo(cls, validados, *, request):
+        """Guarda juntos los serializers validos de una carga masiva: todos nuevos o todos existentes."""
+        user = getattr(request, "user", None)
+        creadas = validados[0].instance is None
+        facturas = []
+        for serializer in validados:
+            factura = serializer.instance or Factura()
+            for field, value in serializer.validated_data.items():
+                setattr(factura, field, value)
+            facturas.append(factura)
+        try:
+            return guardar_facturas_lote(
+                facturas,
+                created=creadas,
+                usuario=user,
+                request=request,
+                auto_payment_note=(
+                    "Pago auto-generado al crear la factura como PAGADA via API."
+                    if creadas
+                    else "Pago auto-generado al marcar la factura como PAGADA via API."
+                ),
+            )
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.message_dict)
+
+
+class PagoSerializer(CamposSolicitadosMixin, serializers.ModelSerializer):
+    serializer_related_field = RelacionPorLlave
     proveedor_email = serializers.SerializerMethodField()
     proveedor_nombre = serializers.CharField(source="factura.proveedor.nombre", read_only=True)
     factura_numero = serializers.CharField(source="factura.numero_factura", read_only=True)
@@ -176,6 +405,7 @@ class PagoSerializer(serializers.ModelSerializer):
             "notas",
             "lote",
             "creado_en",
+            "actualizado_en",
         ]
         read_only_fields = [
             "id",
@@ -187,6 +417,7 @@ class PagoSerializer(serializers.ModelSerializer):
             "valor_pagado",
             "lote",
             "creado_en",
+            "actualizado_en",
         ]
 
     def get_proveedor_email(self, obj):
@@ -218,7 +449,12 @@ class PagoSerializer(serializers.ModelSerializer):
                 return seleccionado
             if seleccionado.startswith("PDV - "):
                 nombre = seleccionado.split("PDV - ", 1)[-1]
-                if PuntoVenta.objects.filter(nombre__iexact=nombre).exists():
+                masivo = self.context.get("masivo")
+                if masivo and masivo.pdvs is not None:
+                    existe = nombre.lower() in masivo.pdvs
+                else:
+                    existe = PuntoVenta.objects.filter(nombre__iexact=nombre).exists()
+                if existe:
                     return seleccionado
             raise serializers.ValidationError("Selección inválida de 'Pagado por'.")
 
@@ -232,10 +468,16 @@ class PagoSerializer(serializers.ModelSerializer):
         factura = attrs.get("factura", getattr(self.instance, "factura", None))
         if self.instance and "factura" in attrs and attrs["factura"] != self.instance.factura:
             raise serializers.ValidationError("No se puede cambiar la factura asociada a un pago existente.")
-        if not self.instance and factura and factura.pagos.exists():
-            raise serializers.ValidationError("Esta factura ya tiene un pago registrado.")
+        masivo = self.context.get("masivo")
+        if not self.instance and factura:
+            con_pago = factura.pk in masivo.con_pago if masivo else factura.pagos.exists()
+            if con_pago:
+                raise serializers.ValidationError("Esta factura ya tiene un pago registrado.")
         if factura and factura.confirmado_pago:
             raise serializers.ValidationError("Esta factura ya fue confirmada y no admite cambios de pago por API.")
+        if masivo and not self.instance and factura:
+            # Un solo pago por factura tambien dentro del lote.
+            masivo.con_pago.add(factura.pk)
         return attrs
 
     def create(self, validated_data):
@@ -252,3 +494,32 @@ class PagoSerializer(serializers.ModelSerializer):
             usuario=user,
             request=request,
         )
+
+    @classmethod
+    def guardar_masivo(cls, validados, *, request):
+        """Como FacturaSerializer.guardar_masivo: pagos nuevos con crear_pagos, existentes con actualizar_pagos."""
+        user = getattr(request, "user", None)
+        if validados[0].instance is not None:
+            pagos = []
+            campos = set()
+            for serializer in validados:
+                for field, value in serializer.validated_data.items():
+                    setattr(serializer.instance, field, value)
+                campos.update(serializer.validated_data)
+                pagos.append(serializer.instance)
+            return actualizar_pagos(pagos, sorted(campos))
+        return crear_pagos(
+            [
+                Pago(
+                    factura=datos["factura"],
+                    fecha_pago=datos.get("fecha_pago") or timezone.localdate(),
+                    valor_pagado=datos["factura"].valor_factura,
+                    pagado_por=datos.get("pagado_por", ""),
+                    comprobante=datos.get("comprobante"),
+                    notas=datos.get("notas", ""),
+                )
+                for datos in (serializer.validated_data for serializer in validados)
+            ],
+            usuario=user,
+            request=request,
+        )
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import time
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, DateField, DurationField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from cartera.models import Factura, Pago
+
+
+def month_bounds(today: date):
+    first = date(today.year, today.month, 1)
+    last = date(today.year, today.month, monthrange(today.year, today.month)[1])
+    return first, last
+
+
+def previous_month_bounds(today: date):
+    y = today.year if today.month > 1 else today.year - 1
+    m = today.month - 1 if today.month > 1 else 12
+    return date(y, m, 1), date(y, m, monthrange(y, m)[1])
+
+
+def safe_div(num, den):
+    try:
+        if not den or den == 0:
+            return Decimal("0")
+        return (Decimal(num) / Decimal(den)) * Decimal("100")
+    except (InvalidOperation, ZeroDivisionError, TypeError):
+        return Decimal("0")
+
+
+def rango_por_defecto(rango, today: date):
+    if rango == "mes_anterior":
+        return previous_month_bounds(today)
+    if rango == "ult_30":
+        return today - timedelta(days=29), today
+    if rango == "este_anio":
+        return date(today.year, 1, 1), today
+    if rango == "anio_pasado":
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+    return month_bounds(today)
+
+
+def _dias(delta):
+    if delta is None:
+        return None
+    if isinstance(delta, timedelta):
+        return delta.total_seconds() / 86400
+    return float(delta)
+
+
+def _scope_filter(*, pv_scope=None, pdv=None, prov=None, prefix=""):
+    condition = Q()
+    if pv_scope:
+        condition &= Q(**{f"{prefix}punto_venta": pv_scope})
+    elif pdv and str(pdv).isdigit():
+        condition &= Q(**{f"{prefix}punto_venta_id": int(pdv)})
+    if prov and str(prov).isdigit():
+        condition &= Q(**{f"{prefix}proveedor_id": int(prov)})
+    return condition
+
+
+def calcular_analitica(*, d1, d2, rango, pv_scope=None, pdv=None, prov=None, today=None, hoy=None, now=None):
+    """
+    Calcula KPIs y series de la analitica con un numero fijo de consultas agregadas:
+    una sobre facturas (periodo, mes anterior, ultimos 7 dias y pendientes), una sobre
+    pagos del periodo y cuatro agrupaciones para graficas y tablas.
+    """
+    today = today or date.today()
+    hoy = hoy or timezone.localdate()
+    now = now or timezone.now()
+
+    alcance = _scope_filter(pv_scope=pv_scope, pdv=pdv, prov=prov)
+    facturas = Factura.objects.filter(alcance).order_by()
+    en_periodo = Q(fecha_factura__range=[d1, d2])
+    pendiente = Q(estado="pendiente")
+    edad = ExpressionWrapper(Value(hoy, output_field=DateField()) - F("fecha_factura"), output_field=DurationField())
+
+    agregados = {
+        "total_compras": Sum("valor_factura", filter=en_periodo),
+        "total_facturas": Count("id", filter=en_periodo),
+        "fact_confirmadas": Count("id", filter=en_periodo & Q(confirmado_pago=True)),
+        "nuevas_7d": Count("id", filter=Q(creado_en__gte=now - timedelta(days=7))),
+        "valor_pendiente": Sum(F("valor_factura") - F("total_pagado"), filter=pendiente),
+        "num_pendientes": Count("id", filter=pendiente),
+        "edad_pendientes": Avg(edad, filter=pendiente),
+    }
+    if rango == "mes_actual":
+        prev_d1, prev_d2 = previous_month_bounds(today)
+        agregados["prev_total"] = Sum("valor_factura", filter=Q(fecha_factura__range=[prev_d1, prev_d2]))
+    fact = facturas.aggregate(**agregados)
+
+    dias_pago = ExpressionWrapper(F("fecha_pago") - F("factura__fecha_factura"), output_field=DurationField())
+    pagos = Pago.objects.filter(
+        _scope_filter(pv_scope=pv_scope, pdv=pdv, prov=prov, prefix="factura__"),
+        factura__fecha_factura__range=[d1, d2],
+    ).order_by()
+    pag = pagos.aggregate(
+        pagado=Sum("valor_pagado"),
+        total_pagos=Count("id"),
+        pagos_contado=Count("id", filter=Q(notas__icontains="auto-generado")),
+        pagos_con_comp=Count("id", filter=~(Q(comprobante__isnull=True) | Q(comprobante__exact=""))),
+        fact_con_pago=Count("factura_id", distinct=True),
+        dias_prom=Avg(dias_pago),
+    )
+
+    periodo = facturas.filter(en_periodo)
+    top_prov = [
+        {"id": r["proveedor__id"], "nombre": r["proveedor__nombre"], "total": r["total"]}
+        for r in periodo.values("proveedor__id", "proveedor__nombre").annotate(total=Sum("valor_factura")).order_by("-total")[:10]
+    ]
+    por_pdv = [
+        {"id": r["punto_venta__id"], "nombre": r["punto_venta__nombre"], "total": r["total"]}
+        for r in periodo.values("punto_venta__id", "punto_venta__nombre").annotate(total=Sum("valor_factura")).order_by("-total")
+    ]
+    by_month = []
+    for r in periodo.annotate(m=TruncMonth("fecha_factura")).values("m").annotate(total=Sum("valor_factura")).order_by("m"):
+        m = r["m"]
+        if isinstance(m, datetime):
+            m = m.date()
+        by_month.append({"m": m.isoformat(), "total": r["total"]})
+    top_facturas = list(
+        periodo.order_by("-valor_factura").values(
+            "id", "numero_factura", "fecha_factura", "proveedor__nombre", "punto_venta__nombre", "valor_factura"
+        )[:12]
+    )
+
+    total_compras = fact["total_compras"] or Decimal("0")
+    pagado = pag["pagado"] or Decimal("0")
+    total_pagos = pag["total_pagos"] or 0
+    valor_pendiente = fact["valor_pendiente"] or Decimal("0")
+    num_pendientes = fact["num_pendientes"] or 0
+    dias_prom = _dias(pag["dias_prom"])
+    dias_prom = round(dias_prom, 1) if dias_prom is not None else 0.0
+    if num_pendientes:
+        antig_prom_pend = round(_dias(fact["edad_pendientes"]) or 0.0, 1)
+        ticket_prom_pend = valor_pendiente / num_pendientes
+    else:
+        antig_prom_pend = 0.0
+        ticket_prom_pend = 0.0
+
+    top_total = sum((r["total"] or 0) for r in top_prov[:3]) or Decimal("0")
+    share_top1 = safe_div(top_prov[0]["total"] if top_prov else 0, total_compras)
+    share_top3 = safe_div(top_total, total_compras)
+    if rango == "mes_actual":
+        prev_total = fact["prev_total"] or Decimal("0")
+        delta_mes_ant = safe_div(total_compras - prev_total, prev_total)
+        delta_monto = total_compras - prev_total
+    else:
+        delta_mes_ant = None
+        delta_monto = Decimal("0")
+
+    return {
+        "kpi_total": round(total_compras, 0),
+        "kpi_facturas": fact["total_facturas"] or 0,
+        "kpi_pagado": round(pagado, 0),
+        "kpi_dias": round(dias_prom, 1),
+        "kpi_valor_pendiente": round(valor_pendiente, 0),
+        "kpi_num_pendientes": num_pendientes,
+        "kpi_pct_pagado": round(safe_div(pagado, total_compras), 1),
+        "kpi_pct_contado": round(safe_div(pag["pagos_contado"], total_pagos), 1),
+        "kpi_tasa_conf": round(safe_div(fact["fact_confirmadas"] or 0, pag["fact_con_pago"] or 0), 1),
+        "kpi_cob_comp": round(safe_div(pag["pagos_con_comp"], total_pagos), 1),
+        "kpi_share_top1": round(share_top1, 1),
+        "kpi_share_top3": round(share_top3, 1),
+        "kpi_delta_mes_ant": round(delta_mes_ant, 1) if delta_mes_ant is not None else None,
+        "kpi_delta_monto": round(delta_monto, 0),
+        "kpi_nuevas_7d": fact["nuevas_7d"] or 0,
+        "kpi_antig_pend": antig_prom_pend,
+        "kpi_ticket_pend": round(ticket_prom_pend, 0),
+        "top_prov": top_prov,
+        "por_pdv": por_pdv,
+        "by_month": by_month,
+        "top_facturas": top_facturas,
+    }
+
+
+ANALYTICS_CACHE_VERSION_KEY = "cartera:analitica:version"
+
+
+def _version_analitica():
+    version = cache.get(ANALYTICS_CACHE_VERSION_KEY)
+    if version is None:
+        # Si la llave se perdio (expulsion o reinicio) se arranca en un valor nuevo
+        # para no reutilizar entradas calculadas con versiones anteriores.
+        version = time.time_ns()
+        if not cache.add(ANALYTICS_CACHE_VERSION_KEY, version, timeout=None):
+            version = cache.get(ANALYTICS_CACHE_VERSION_KEY, version)
+    return version
+
+
+def _subir_version_analitica():
+    try:
+        cache.incr(ANALYTICS_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(ANALYTICS_CACHE_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidar_analitica():
+    """Invalida la analitica cacheada cuando la transaccion en curso confirme sus cambios."""
+    transaction.on_commit(_subir_version_analitica)
+
+
+def _llave_analitica(*, d1, d2, rango, pv_scope, pdv, prov, today, hoy):
+    if pv_scope:
+        alcance = f"pv:{pv_scope.pk}"
+    elif pdv and str(pdv).isdigit():
+        alcance = f"pdv:{int(pdv)}"
+    else:
+        alcance = "global"
+    filtros = {
+        "d1": d1.isoformat(),
+        "d2": d2.isoformat(),
+        "mes_actual": rango == "mes_actual",
+        "alcance": alcance,
+        "prov": int(prov) if prov and str(prov).isdigit() else None,
+        "today": today.isoformat(),
+        "hoy": hoy.isoformat(),
+    }
+    digest = hashlib.sha256(json.dumps(filtros, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"cartera:analitica:{_version_analitica()}:{digest}"
+
+
+def obtener_analitica(*, d1, d2, rango, pv_scope=None, pdv=None, prov=None, today=None):
+    """calcular_analitica con cache por filtros normalizados y alcance de PDV del usuario."""
+    today = today or date.today()
+    hoy = timezone.localdate()
+    llave = _llave_analitica(d1=d1, d2=d2, rango=rango, pv_scope=pv_scope, pdv=pdv, prov=prov, today=today, hoy=hoy)
+    resultado = cache.get(llave)
+    if resultado is None:
+        resultado = calcular_analitica(d1=d1, d2=d2, rango=rango, pv_scope=pv_scope, pdv=pdv, prov=prov, today=today, hoy=hoy)
+        cache.set(llave, resultado, timeout=settings.ANALYTICS_CACHE_TIMEOUT)
+    return resultado
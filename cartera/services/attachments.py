@@ -0,0 +1,108 @@
+import base64
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+from email.mime.base import MIMEBase
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+# Multiplo de 57 bytes: cada bloque se codifica en lineas base64 completas de 76 caracteres.
+BLOQUE_BYTES = 57 * 1024
+_PREFIJO_TEMPORAL = ".descarga-"
+
+
+def _ruta_cache(nombre):
+    directorio = settings.COMPROBANTE_CACHE_DIR
+    os.makedirs(directorio, exist_ok=True)
+    extension = os.path.splitext(nombre)[1].lower()
+    return os.path.join(directorio, hashlib.sha256(nombre.encode("utf-8")).hexdigest() + extension)
+
+
+def _recortar(directorio, limite):
+    """Borra los archivos usados hace mas tiempo hasta dejar la cache bajo el limite."""
+    entradas = []
+    for entrada in os.scandir(directorio):
+        if not entrada.is_file() or entrada.name.startswith(_PREFIJO_TEMPORAL):
+            continue
+        try:
+            stat = entrada.stat()
+        except FileNotFoundError:
+            continue
+        entradas.append((stat.st_mtime, stat.st_size, entrada.path))
+    total = sum(tamano for _mtime, tamano, _ruta in entradas)
+    for _mtime, tamano, ruta in sorted(entradas):
+        if total <= limite:
+            break
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+        total -= tamano
+
+
+def _descargar(fieldfile, ruta):
+    directorio = os.path.dirname(ruta)
+    fd, temporal = tempfile.mkstemp(dir=directorio, prefix=_PREFIJO_TEMPORAL)
+    destino = os.fdopen(fd, "w+b")
+    try:
+        with fieldfile.storage.open(fieldfile.name, "rb") as origen:
+            for bloque in origen.chunks(BLOQUE_BYTES):
+                destino.write(bloque)
+        destino.flush()
+        destino.seek(0)
+    except BaseException:
+        destino.close()
+        os.remove(temporal)
+        raise
+    limite = settings.COMPROBANTE_CACHE_MAX_BYTES
+    if os.path.getsize(temporal) <= limite:
+        # El descriptor abierto sigue valido aunque otro worker recorte la cache despues.
+        os.replace(temporal, ruta)
+        _recortar(directorio, limite)
+    else:
+        os.remove(temporal)
+    return destino
+
+
+@contextmanager
+def abrir_comprobante(fieldfile):
+    """
+    Abre el comprobante para leerlo por bloques. En FileSystemStorage es el archivo mismo; en otro
+    storage se descarga por bloques a una cache en disco (COMPROBANTE_CACHE_DIR, la menos usada sale
+    primero al pasar COMPROBANTE_CACHE_MAX_BYTES), asi un reenvio del mismo nombre no vuelve a S3.
+    """
+    if isinstance(fieldfile.storage, FileSystemStorage):
+        with open(fieldfile.path, "rb") as fh:
+            yield fh
+        return
+    ruta = _ruta_cache(fieldfile.name)
+    try:
+        fh = open(ruta, "rb")
+    except FileNotFoundError:
+        fh = _descargar(fieldfile, ruta)
+    else:
+        try:
+            os.utime(ruta)
+        except FileNotFoundError:
+            pass
+    with fh:
+        yield fh
+
+
+def adjunto_mime(fh, filename, mimetype):
+    """Parte MIME codificada en base64 por bloques, sin tener el archivo completo en memoria sin codificar."""
+    principal, _, secundario = mimetype.partition("/")
+    parte = MIMEBase(principal, secundario or "octet-stream")
+    lineas = []
+    while bloque := fh.read(BLOQUE_BYTES):
+        lineas.append(base64.encodebytes(bloque).decode("ascii"))
+    parte.set_payload("".join(lineas))
+    parte["Content-Transfer-Encoding"] = "base64"
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        filename = ("utf-8", "", filename)
+    parte.add_header("Content-Disposition", "attachment", filename=filename)
+    return parte
@@ -1,9 +1,11 @@
+import weakref
 from datetime import date, datetime
 from decimal import Decimal
 
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, connections, models, transaction
 
-from cartera.models import EventoAuditoria
+from cartera.models import EventoAuditoria, Factura, Pago, PagoLote
 
 
 def _request_user(request):
@@ -44,7 +46,7 @@ def _json_safe(value):
     return str(value)
 
 
-def registrar_evento(
+def construir_evento(
     tipo,
     *,
     factura=None,
@@ -57,7 +59,7 @@ def registrar_evento(
     user_agent="",
 ):
     actor = usuario or _request_user(request)
-    return EventoAuditoria.objects.create(
+    return EventoAuditoria(
         tipo=tipo,
         factura=factura,
         pago=pago,
@@ -67,3 +69,107 @@ def registrar_evento(
         ip_address=ip_address or _client_ip(request),
         user_agent=user_agent or _user_agent(request),
     )
+
+
+class _Marcador:
+    """
+    Callback on_commit de un grupo de eventos. Si su savepoint se revierte, Django lo descarta y,
+    sin otra referencia fuerte, el marcador deja de existir: el buffer solo guarda weakrefs.
+    """
+
+    def __init__(self, buffer, eventos):
+        self.buffer = buffer
+        self.eventos = eventos
+
+    def __call__(self):
+        self.buffer.escribir()
+
+
+class _BufferAuditoria:
+    """Eventos de la transaccion en curso; se escriben con un solo bulk_create despues del commit."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.marcadores = []
+        self.escrito = False
+
+    def vigentes(self):
+        return [marcador for ref in self.marcadores if (marcador := ref()) is not None]
+
+    def agregar(self, eventos):
+        marcador = _Marcador(self, eventos)
+        self.marcadores.append(weakref.ref(marcador))
+        transaction.on_commit(marcador, using=self.connection.alias)
+
+    def escribir(self):
+        # Corre con el primer marcador despues del commit: los que siguen vivos son justo los grupos
+        # cuyos savepoints se confirmaron, asi que todo se escribe de una vez y los demas no hacen nada.
+        if self.escrito:
+            return
+        self.escrito = True
+        if getattr(self.connection, "_cartera_auditoria", None) is self:
+            self.connection._cartera_auditoria = None
+        eventos = [evento for marcador in self.vigentes() for evento in marcador.eventos]
+        if eventos:
+            _insertar(eventos, using=self.connection.alias)
+
+
+def _insertar(eventos, *, using):
+    for evento in eventos:
+        for campo in ("factura", "pago", "lote"):
+            relacionado = EventoAuditoria._meta.get_field(campo).get_cached_value(evento, default=None)
+            if relacionado is not None and relacionado.pk is None:
+                setattr(evento, campo, None)
+    try:
+        with transaction.atomic(using=using):
+            EventoAuditoria.objects.using(using).bulk_create(eventos)
+    except IntegrityError:
+        # Una factura, pago o lote referenciado se elimino en la misma transaccion:
+        # se deja la referencia en NULL, como hace on_delete=SET_NULL con escritura inmediata.
+        for campo, modelo in (("factura_id", Factura), ("pago_id", Pago), ("lote_id", PagoLote)):
+            ids = {getattr(evento, campo) for evento in eventos if getattr(evento, campo)}
+            existentes = set(modelo.objects.using(using).filter(pk__in=ids).values_list("pk", flat=True))
+            for evento in eventos:
+                if getattr(evento, campo) and getattr(evento, campo) not in existentes:
+                    setattr(evento, campo, None)
+        EventoAuditoria.objects.using(using).bulk_create(eventos)
+
+
+def _buffer_actual(using=None):
+    if not settings.AUDITORIA_DIFERIDA:
+        return None
+    connection = connections[using or EventoAuditoria.objects.db]
+    if not connection.in_atomic_block:
+        return None
+    buffer = getattr(connection, "_cartera_auditoria", None)
+    if buffer is None or buffer.escrito or not buffer.vigentes():
+        # Sin marcadores pendientes la transaccion anterior termino (o se revirtio): buffer nuevo.
+        buffer = _BufferAuditoria(connection)
+        connection._cartera_auditoria = buffer
+    return buffer
+
+
+def registrar_evento(tipo, **kwargs):
+    """
+    Registra un evento de auditoria. Dentro de una transaccion se acumula y se escribe
+    junto con los demas eventos al confirmar; fuera de ella se escribe de inmediato.
+    """
+    evento = construir_evento(tipo, **kwargs)
+    buffer = _buffer_actual()
+    if buffer is None:
+        evento.save(force_insert=True)
+    else:
+        buffer.agregar([evento])
+    return evento
+
+
+def registrar_eventos(eventos):
+    """Como registrar_evento para varios eventos construidos con construir_evento, en el orden recibido."""
+    eventos = list(eventos)
+    if not eventos:
+        return eventos
+    buffer = _buffer_actual()
+    if buffer is None:
+        return EventoAuditoria.objects.bulk_create(eventos)
+    buffer.agregar(eventos)
+    return eventos
@@ -0,0 +1,147 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from cartera.models import Factura, SaldoResumen
+
+SNAPSHOT_FIELDS = ("proveedor_id", "punto_venta_id", "estado", "valor_factura", "total_pagado")
+
+
+def _decimal(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value or 0))
+
+
+def snapshot_factura(factura_or_pk):
+    """Lee (y bloquea) la contribucion actual de una factura al resumen, o None si no existe."""
+    pk = getattr(factura_or_pk, "pk", factura_or_pk)
+    if not pk:
+        return None
+    return Factura.objects.select_for_update().filter(pk=pk).values(*SNAPSHOT_FIELDS).first()
+
+
+def _contribucion(factura):
+    if factura is None:
+        return None
+    if isinstance(factura, dict):
+        return factura
+    return {field: getattr(factura, field) for field in SNAPSHOT_FIELDS}
+
+
+def _aplicar(proveedor_id, punto_venta_id, estado, *, facturas, valor, pagado):
+    if not facturas and not valor and not pagado:
+        return
+    filtro = {"proveedor_id": proveedor_id, "punto_venta_id": punto_venta_id, "estado": estado}
+    cambios = {
+        "facturas": F("facturas") + facturas,
+        "valor_total": F("valor_total") + valor,
+        "total_pagado": F("total_pagado") + pagado,
+        "actualizado_en": timezone.now(),
+    }
+    if SaldoResumen.objects.filter(**filtro).update(**cambios):
+        return
+    try:
+        with transaction.atomic():
+            SaldoResumen.objects.create(**filtro, facturas=facturas, valor_total=valor, total_pagado=pagado)
+    except IntegrityError:
+        SaldoResumen.objects.filter(**filtro).update(**cambios)
+
+
+def snapshot_facturas(pks):
+    """Version por lotes de snapshot_factura: {pk: snapshot} en una sola consulta."""
+    rows = Factura.objects.select_for_update().filter(pk__in=list(pks)).order_by("pk").values("pk", *SNAPSHOT_FIELDS)
+    return {row.pop("pk"): row for row in rows}
+
+
+def aplicar_cambio_saldo(antes, despues):
+    """
+    Mueve la contribucion de una factura en el resumen: `antes` y `despues` son
+    snapshots (o instancias de Factura); None significa que no existia / fue eliminada.
+    """
+    aplicar_cambios_saldo([(antes, despues)])
+
+
+def aplicar_cambios_saldo(cambios):
+    """Aplica varios pares (antes, despues) acumulando una sola actualizacion por fila del resumen."""
+    deltas = {}
+
+    def acumular(contribucion, signo):
+        llave = (contribucion["proveedor_id"], contribucion["punto_venta_id"], contribucion["estado"])
+        actual = deltas.setdefault(llave, [0, Decimal("0"), Decimal("0")])
+        actual[0] += signo
+        actual[1] += signo * _decimal(contribucion["valor_factura"])
+        actual[2] += signo * _decimal(contribucion["total_pagado"])
+
+    for antes, despues in cambios:
+        antes = _contribucion(antes)
+        despues = _contribucion(despues)
+        if antes == despues:
+            continue
+        if antes:
+            acumular(antes, -1)
+        if despues:
+            acumular(despues, 1)
+
+    for (proveedor_id, punto_venta_id, estado), (facturas, valor, pagado) in sorted(deltas.items(), key=str):
+        _aplicar(proveedor_id, punto_venta_id, estado, facturas=facturas, valor=valor, pagado=pagado)
+
+
+def calcular_saldos_desde_facturas():
+    rows = (
+        Factura.objects.order_by()
+        .values("proveedor_id", "punto_venta_id", "estado")
+        .annotate(facturas=Count("id"), valor_total=Sum("valor_factura"), total_pagado=Sum("total_pagado"))
+    )
+    return {
+        (r["proveedor_id"], r["punto_venta_id"], r["estado"]): (
+            r["facturas"],
+            _decimal(r["valor_total"]),
+            _decimal(r["total_pagado"]),
+        )
+        for r in rows
+    }
+
+
+def diferencias_saldos():
+    """Compara el resumen guardado con el recalculado; devuelve una lista de (llave, guardado, esperado)."""
+    esperado = calcular_saldos_desde_facturas()
+    guardado = {
+        (r.proveedor_id, r.punto_venta_id, r.estado): (r.facturas, _decimal(r.valor_total), _decimal(r.total_pagado))
+        for r in SaldoResumen.objects.all()
+    }
+    vacio = (0, Decimal("0"), Decimal("0"))
+    diferencias = []
+    for llave in sorted(set(esperado) | set(guardado), key=str):
+        actual = guardado.get(llave, vacio)
+        correcto = esperado.get(llave, vacio)
+        if actual != correcto:
+            diferencias.append((llave, actual, correcto))
+    return diferencias
+
+
+@transaction.atomic
+def reconstruir_saldos():
+    esperado = calcular_saldos_desde_facturas()
+    SaldoResumen.objects.all().delete()
+    SaldoResumen.objects.bulk_create(
+        SaldoResumen(
+            proveedor_id=proveedor_id,
+            punto_venta_id=punto_venta_id,
+            estado=estado,
+            facturas=facturas,
+            valor_total=valor,
+            total_pagado=pagado,
+        )
+        for (proveedor_id, punto_venta_id, estado), (facturas, valor, pagado) in esperado.items()
+    )
+    return len(esperado)
+
+
+def saldos_visibles(*, punto_venta=None, proveedor_ids=None):
+    qs = SaldoResumen.objects.filter(facturas__gt=0)
+    if punto_venta is not None:
+        qs = qs.filter(punto_venta=punto_venta)
+    if proveedor_ids is not None:
+        qs = qs.filter(proveedor_id__in=proveedor_ids)
+    return qs
@@ -0,0 +1,687 @@
+import json
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, time as dtime, timedelta
+from decimal import Decimal
+from typing import Callable
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections, models, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cartera.models import (
+    EventoAuditoria,
+    Factura,
+    NotificacionProveedor,
+    Pago,
+    PagoLote,
+    Proveedor,
+    ProveedorUsuario,
+    PuntoVenta,
+    PuntoVentaUsuario,
+)
+
+from cartera.utils import firmar_token, firmar_token_lote
+
+from .analytics import invalidar_analitica
+from .audit import construir_evento
+from .balances import reconstruir_saldos
+
+SEED_BATCH_SIZE = 5000
+PREFIJO_SINTETICO = "SYN"
+COMPROBANTE_SINTETICO = "comprobantes/sintetico.pdf"
+MAX_PAGOS_POR_LOTE = 8
+SENTENCIAS_SAVEPOINT = ("SAVEPOINT", "ROLLBACK TO SAVEPOINT", "RELEASE SAVEPOINT")
+
+
+def _lotes(total, tamano):
+    for inicio in range(0, total, tamano):
+        yield range(inicio, min(total, inicio + tamano))
+
+
+def _momento(fecha, rnd):
+    return timezone.make_aware(datetime.combine(fecha, dtime(rnd.randrange(7, 19), rnd.randrange(60))))
+
+
+class _Sembrador:
+    """Estado compartido entre bloques: catalogos, usuarios y contadores de lo creado."""
+
+    def __init__(self, *, semilla, dias, proporcion_pagadas, proporcion_en_lote, proporcion_confirmadas, batch_size):
+        self.rnd = random.Random(semilla)
+        self.hoy = timezone.localdate()
+        self.etiqueta = f"{PREFIJO_SINTETICO}{semilla}"
+        self.dias = dias
+        self.proporcion_pagadas = proporcion_pagadas
+        self.proporcion_en_lote = proporcion_en_lote
+        self.proporcion_confirmadas = proporcion_confirmadas
+        self.batch_size = batch_size
+        self.devuelve_pks = connections[Factura.objects.db].features.can_return_rows_from_bulk_insert
+        self.conteos = Counter()
+
+    def catalogos(self, proveedores, pdvs):
+        Proveedor.objects.bulk_create(
+            Proveedor(
+                nombre=f"Proveedor {self.etiqueta}-{i:05d}",
+                nit=f"{self.etiqueta}-{i:05d}",
+                email=f"proveedor{i}@{self.etiqueta.lower()}.test",
+            )
+            for i in range(proveedores)
+        )
+        PuntoVenta.objects.bulk_create(
+            PuntoVenta(nombre=f"PDV {self.etiqueta}-{i:04d}", ciudad="Sintetica") for i in range(pdvs)
+        )
+        # Se releen siempre: son pocos y asi no depende de que el backend devuelva llaves.
+        self.proveedores = list(Proveedor.objects.filter(nit__startswith=f"{self.etiqueta}-").order_by("pk"))
+        self.pdv_nombres = dict(
+            PuntoVenta.objects.filter(nombre__startswith=f"PDV {self.etiqueta}-").order_by("pk").values_list("pk", "nombre")
+        )
+        self.pdv_ids = list(self.pdv_nombres)
+        self.proveedor_ids = [p.pk for p in self.proveedores]
+        # Unos pocos proveedores concentran la mayoria de facturas, como en la cartera real.
+        self.pesos = [1 / (i + 1) for i in range(len(self.proveedor_ids))]
+        self.conteos.update(proveedores=len(self.proveedor_ids), pdvs=len(self.pdv_ids))
+
+    def usuarios(self, *, usuarios_portal, password):
+        User = get_user_model()
+        clave = make_password(password)
+        prefijo = self.etiqueta.lower()
+        nuevos = [User(username=f"{prefijo}-staff", is_staff=True, password=clave)]
+        nuevos += [User(username=f"{prefijo}-pdv-{i:04d}", password=clave) for i in range(len(self.pdv_ids))]
+        nuevos += [
+            User(username=f"{prefijo}-portal-{i:05d}-{j}", password=clave)
+            for i in range(len(self.proveedor_ids))
+            for j in range(usuarios_portal)
+        ]
+        User.objects.bulk_create(nuevos, batch_size=self.batch_size)
+        por_nombre = dict(User.objects.filter(username__startswith=f"{prefijo}-").values_list("username", "pk"))
+
+        pdv_usuarios = [(por_nombre[f"{prefijo}-pdv-{i:04d}"], pdv_id) for i, pdv_id in enumerate(self.pdv_ids)]
+        PuntoVentaUsuario.objects.bulk_create(
+            PuntoVentaUsuario(user_id=user_id, punto_venta_id=pdv_id) for user_id, pdv_id in pdv_usuarios
+        )
+        for user_id, pdv_id in pdv_usuarios:
+            PuntoVenta.objects.filter(pk=pdv_id).update(usuario_id=user_id)
+
+        self.portal = defaultdict(list)
+        links = []
+        for i, proveedor_id in enumerate(self.proveedor_ids):
+            for j in range(usuarios_portal):
+                user_id = por_nombre[f"{prefijo}-portal-{i:05d}-{j}"]
+                # El primer usuario de cada proveedor confirma pagos; el resto solo consulta.
+                links.append(ProveedorUsuario(user_id=user_id, proveedor_id=proveedor_id, puede_confirmar_pagos=j == 0))
+                self.portal[proveedor_id].append(user_id)
+        ProveedorUsuario.objects.bulk_create(links, batch_size=self.batch_size)
+        self.staff_id = por_nombre[f"{prefijo}-staff"]
+        self.conteos.update(usuarios=len(nuevos))
+
+    def bloque(self, indices):
+        rnd = self.rnd
+        facturas = []
+        for i in indices:
+            fecha = self.hoy - timedelta(days=rnd.randrange(self.dias))
+            valor = Decimal(rnd.randrange(20, 5000) * 1000)
+            pagada = rnd.random() < self.proporcion_pagadas
+            facturas.append(
+                Factura(
+                    proveedor_id=rnd.choices(self.proveedor_ids, self.pesos)[0],
+                    punto_venta_id=rnd.choice(self.pdv_ids),
+                    numero_factura=f"{self.etiqueta}-{i:08d}",
+                    fecha_factura=fecha,
+                    valor_factura=valor,
+                    total_pagado=valor if pagada else Decimal("0"),
+                    estado="pagada" if pagada else "pendiente",
+                )
+            )
+        pagadas = [f for f in facturas if f.estado == "pagada"]
+
+        # Parte de los pagos se agrupa en lotes monoproveedor; cada lote se confirma completo o no se confirma.
+        sueltas, por_proveedor = [], defaultdict(list)
+        for factura in pagadas:
+            if rnd.random() < self.proporcion_en_lote:
+                por_proveedor[factura.proveedor_id].append(factura)
+            else:
+                sueltas.append(factura)
+        grupos = []
+        for proveedor_id, grupo in por_proveedor.items():
+            for inicio in range(0, len(grupo), MAX_PAGOS_POR_LOTE):
+                grupos.append((proveedor_id, grupo[inicio:inicio + MAX_PAGOS_POR_LOTE]))
+
+        lotes = [
+            PagoLote(
+                proveedor_id=proveedor_id,
+                fecha_pago=min(self.hoy, max(f.fecha_factura for f in grupo) + timedelta(days=rnd.randrange(30))),
+                pagado_por="OFICINA",
+                comprobante=COMPROBANTE_SINTETICO,
+                notas=f"{self.etiqueta}-lote-{indices.start}-{n}",
+            )
+            for n, (proveedor_id, grupo) in enumerate(grupos)
+        ]
+        lotes = PagoLote.objects.bulk_create(lotes)
+        if not self.devuelve_pks:
+            pks = dict(
+                PagoLote.objects.filter(notas__startswith=f"{self.etiqueta}-lote-{indices.start}-").values_list("notas", "pk")
+            )
+            for lote in lotes:
+                lote.pk = pks[lote.notas]
+
+        fecha_pago = {}
+        lote_de = {}
+        for lote, (_proveedor_id, grupo) in zip(lotes, grupos):
+            confirmado = rnd.random() < self.proporcion_confirmadas
+            for factura in grupo:
+                fecha_pago[factura.numero_factura] = lote.fecha_pago
+                lote_de[factura.numero_factura] = lote
+                self._confirmar(factura, lote.fecha_pago, confirmado)
+        for factura in sueltas:
+            fecha = min(self.hoy, factura.fecha_factura + timedelta(days=rnd.randrange(60)))
+            fecha_pago[factura.numero_factura] = fecha
+            self._confirmar(factura, fecha, rnd.random() < self.proporcion_confirmadas)
+
+        facturas = Factura.objects.bulk_create(facturas)
+        if not self.devuelve_pks:
+            pks = dict(
+                Factura.objects.filter(numero_factura__in=[f.numero_factura for f in facturas]).values_list("numero_factura", "pk")
+            )
+            for factura in facturas:
+                factura.pk = pks[factura.numero_factura]
+
+        # Uno de cada diez pagos sueltos queda sin comprobante, como los que se adjuntan despues.
+        sin_comprobante = {factura.numero_factura for factura in sueltas[::10]}
+        pagos = Pago.objects.bulk_create(
+            Pago(
+                factura=factura,
+                fecha_pago=fecha_pago[factura.numero_factura],
+                valor_pagado=factura.valor_factura,
+                pagado_por="OFICINA" if factura.numero_factura in lote_de else f"PDV - {self.pdv_nombres[factura.punto_venta_id]}",
+                comprobante="" if factura.numero_factura in sin_comprobante else COMPROBANTE_SINTETICO,
+                lote=lote_de.get(factura.numero_factura),
+            )
+            for factura in pagadas
+        )
+        if not self.devuelve_pks:
+            pks = dict(Pago.objects.filter(factura__in=pagadas).values_list("factura_id", "pk"))
+            for pago in pagos:
+                pago.pk = pks[pago.factura_id]
+
+        self._eventos(facturas, pagos, lotes, grupos)
+        self._notificaciones(pagos, lotes, grupos)
+        self.conteos.update(facturas=len(facturas), pagos=len(pagos), lotes=len(lotes))
+
+    def _confirmar(self, factura, fecha, confirmado):
+        if confirmado:
+            factura.confirmado_pago = True
+            factura.confirmado_fecha = _momento(min(self.hoy, fecha + timedelta(days=self.rnd.randrange(5))), self.rnd)
+            factura.confirmado_por_email = f"confirmaciones@{self.etiqueta.lower()}.test"
+
+    def _eventos(self, facturas, pagos, lotes, grupos):
+        eventos = [
+            construir_evento(
+                EventoAuditoria.TIPO_FACTURA_CREADA,
+                factura=factura,
+                metadata={
+                    "numero_factura": factura.numero_factura,
+                    "estado": factura.estado,
+                    "valor_factura": factura.valor_factura,
+                    "punto_venta_id": factura.punto_venta_id,
+                    "proveedor_id": factura.proveedor_id,
+                    "origen": "sintetico",
+                },
+            )
+            for factura in facturas
+        ]
+        eventos += [
+            construir_evento(
+                EventoAuditoria.TIPO_PAGO_CREADO,
+                factura=pago.factura,
+                pago=pago,
+                lote=pago.lote,
+                metadata={"valor_pagado": pago.valor_pagado, "origen": "sintetico"},
+            )
+            for pago in pagos
+        ]
+        confirmados_en_lote = {factura.pk for _pid, grupo in grupos for factura in grupo}
+        eventos += [
+            construir_evento(
+                EventoAuditoria.TIPO_CONFIRMACION_LOTE_PORTAL,
+                lote=lote,
+                metadata={"proveedor_id": lote.proveedor_id, "pagos": len(grupo), "origen": "sintetico"},
+            )
+            for lote, (_pid, grupo) in zip(lotes, grupos)
+            if grupo[0].confirmado_pago
+        ]
+        eventos += [
+            construir_evento(
+                EventoAuditoria.TIPO_CONFIRMACION_PAGO_PORTAL,
+                factura=pago.factura,
+                pago=pago,
+                metadata={"proveedor_id": pago.factura.proveedor_id, "origen": "sintetico"},
+            )
+            for pago in pagos
+            if pago.factura.confirmado_pago and pago.factura.pk not in confirmados_en_lote
+        ]
+        for evento in eventos:
+            evento.usuario_id = self.staff_id
+        EventoAuditoria.objects.bulk_create(eventos, batch_size=self.batch_size)
+        self.conteos.update(eventos=len(eventos))
+
+    def _notificaciones(self, pagos, lotes, grupos):
+        rnd = self.rnd
+        nuevas = []
+
+        def notificar(proveedor_id, **campos):
+            for usuario_id in self.portal.get(proveedor_id, ()):
+                leida = rnd.random() < 0.7
+                nuevas.append(NotificacionProveedor(usuario_id=usuario_id, proveedor_id=proveedor_id, leida=leida, **campos))
+
+        for lote, (proveedor_id, grupo) in zip(lotes, grupos):
+            notificar(
+                proveedor_id,
+                lote=lote,
+                tipo=NotificacionProveedor.TIPO_LOTE_REGISTRADO,
+                titulo=f"Lote de pagos registrado ({len(grupo)} facturas)",
+                url_destino=f"/portal-proveedor/lotes/{lote.pk}/",
+            )
+        for pago in pagos:
+            if pago.lote_id is None:
+                notificar(
+                    pago.factura.proveedor_id,
+                    factura=pago.factura,
+                    pago=pago,
+                    tipo=NotificacionProveedor.TIPO_PAGO_REGISTRADO,
+                    titulo=f"Pago registrado para la factura {pago.factura.numero_factura}",
+                    url_destino=f"/portal-proveedor/facturas/{pago.factura_id}/",
+                )
+        NotificacionProveedor.objects.bulk_create(nuevas, batch_size=self.batch_size)
+        self.conteos.update(notificaciones=len(nuevas))
+
+
+def sembrar_cartera(
+    *,
+    facturas,
+    proveedores,
+    pdvs,
+    semilla=1,
+    dias=3 * 365,
+    proporcion_pagadas=0.6,
+    proporcion_en_lote=0.3,
+    proporcion_confirmadas=0.5,
+    usuarios_portal=2,
+    password=None,
+    batch_size=SEED_BATCH_SIZE,
+):
+    """
+    Crea una cartera sintetica estable para una semilla: proveedores, PDV con su usuario, usuarios
+    del portal, facturas, pagos sueltos y en lotes, confirmaciones, eventos de auditoria y
+    notificaciones con sus contadores. Deja el resumen de saldos cuadrado y devuelve los conteos.
+    Sin `password` los usuarios quedan con clave inutilizable.
+    """
+    if facturas and not (proveedores and pdvs):
+        raise ValueError("Se necesita al menos un proveedor y un PDV para sembrar facturas.")
+    if Proveedor.objects.filter(nit__startswith=f"{PREFIJO_SINTETICO}{semilla}-").exists():
+        raise ValueError(f"Ya hay datos sinteticos con la semilla {semilla}; usa otra semilla.")
+
+    sembrador = _Sembrador(
+        semilla=semilla,
+        dias=dias,
+        proporcion_pagadas=proporcion_pagadas,
+        proporcion_en_lote=proporcion_en_lote,
+        proporcion_confirmadas=proporcion_confirmadas,
+        batch_size=batch_size,
+    )
+    sembrador.catalogos(proveedores, pdvs)
+    sembrador.usuarios(usuarios_portal=usuarios_portal, password=password)
+    for indices in _lotes(facturas, batch_size):
+        sembrador.bloque(indices)
+
+    reconstruir_saldos()
+    invalidar_analitica()
+    return dict(sembrador.conteos)
+
+
+def medir(funcion, *, repeticiones=5):
+    """Ejecuta `funcion` varias veces y devuelve los tiempos en milisegundos."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def mediana(tiempos):
+    return statistics.median(tiempos) if tiempos else 0.0
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) con interpolacion lineal entre las muestras ordenadas."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicion = (len(ordenados) - 1) * p / 100
+    base = int(posicion)
+    siguiente = min(base + 1, len(ordenados) - 1)
+    return ordenados[base] + (ordenados[siguiente] - ordenados[base]) * (posicion - base)
+
+
+class Muestra:
+    """
+    Usuarios y objetos con los que se arman las URLs a medir. Se eligen de los datos existentes:
+    el proveedor con mas facturas, su usuario de portal y el PDV de su factura mas reciente.
+    """
+
+    def __init__(self):
+        User = get_user_model()
+        self.staff = User.objects.filter(is_staff=True, is_active=True).order_by("pk").first()
+        self.proveedor = (
+            Proveedor.objects.filter(usuarios_portal__activo=True)
+            .annotate(total=models.Count("factura", distinct=True))
+            .order_by("-total", "pk")
+            .first()
+        )
+        self.proveedor_libre = Proveedor.objects.filter(factura__isnull=True, lotes__isnull=True).order_by("-pk").first()
+        self.portal = self.pdv_user = self.factura = self.pendiente = self.pago = self.pago_libre = None
+        self.pago_sin_comprobante = self.lote = self.notificacion = None
+        self.pendientes = []
+        if self.proveedor is None:
+            return
+        link = (
+            ProveedorUsuario.objects.select_related("user")
+            .filter(proveedor=self.proveedor, activo=True)
+            .order_by("-puede_confirmar_pagos", "pk")
+            .first()
+        )
+        self.portal = link.user
+        facturas = Factura.objects.filter(proveedor=self.proveedor).order_by("-fecha_factura", "-id")
+        self.factura = facturas.filter(pagos__isnull=False).first() or facturas.first()
+        if self.factura is not None:
+            mapa = PuntoVentaUsuario.objects.select_related("user").filter(punto_venta_id=self.factura.punto_venta_id).first()
+            self.pdv_user = mapa.user if mapa else None
+        self.pendientes = list(
+            facturas.filter(estado="pendiente", pagos__isnull=True, confirmado_pago=False).values_list("pk", flat=True)[:20]
+        )
+        self.pendiente = Factura.objects.filter(pk__in=self.pendientes[:1]).first()
+        # Se prefieren pagos y lotes sin confirmar: son los que muestran formularios y no solo redirigen.
+        pagos = Pago.objects.filter(factura__proveedor=self.proveedor).order_by("-fecha_pago", "-id")
+        sin_comprobante = models.Q(comprobante="") | models.Q(comprobante__isnull=True)
+        abiertos = pagos.exclude(sin_comprobante).filter(factura__confirmado_pago=False)
+        self.pago = abiertos.first() or pagos.exclude(sin_comprobante).first()
+        self.pago_libre = abiertos.filter(lote__isnull=True).first()
+        self.pago_sin_comprobante = Pago.objects.filter(sin_comprobante).order_by("-fecha_pago", "-id").first()
+        lotes = PagoLote.objects.filter(proveedor=self.proveedor).order_by("-fecha_pago", "-id")
+        self.lote = lotes.filter(pagos__factura__confirmado_pago=False).first() or lotes.first()
+        notificaciones = NotificacionProveedor.objects.filter(usuario=self.portal, proveedor=self.proveedor).order_by("-creada_en", "-id")
+        self.notificacion = notificaciones.filter(leida=False).first() or notificaciones.first()
+
+    def usuario(self, rol):
+        return {"staff": self.staff, "pdv": self.pdv_user, "portal": self.portal}.get(rol)
+
+
+def _pk(atributo, clave="pk"):
+    def kwargs(muestra):
+        objeto = getattr(muestra, atributo)
+        return None if objeto is None else {clave: objeto.pk}
+
+    return kwargs
+
+
+def _token(atributo, firmar):
+    def kwargs(muestra):
+        objeto = getattr(muestra, atributo)
+        return None if objeto is None else {"token": firmar(objeto.pk)}
+
+    return kwargs
+
+
+@dataclass(frozen=True)
+class Ruta:
+    """
+    Una URL con nombre de cartera/urls.py, el rol que la visita, como armar sus argumentos y su
+    presupuesto de consultas. Las rutas que no son GET envian `datos` como JSON y se revierten.
+    `crece` documenta por que una ruta hace mas consultas con mas filas; sin motivo no debe crecer.
+    """
+
+    nombre: str
+    rol: str = "staff"
+    kwargs: Callable = None
+    params: dict | Callable = field(default_factory=dict)
+    consultas: int = None
+    metodo: str = "get"
+    datos: Callable = None
+    crece: str = ""
+
+    @property
+    def etiqueta(self):
+        prefijo = "" if self.metodo == "get" else f"{self.metodo.upper()} "
+        return f"{prefijo}{self.nombre}[{self.rol}]"
+
+    def url(self, muestra):
+        kwargs = self.kwargs(muestra) if self.kwargs else {}
+        if kwargs is None:
+            return None
+        params = self.params(muestra) if callable(self.params) else self.params
+        if params is None:
+            return None
+        url = reverse(self.nombre, kwargs=kwargs)
+        return f"{url}?{urlencode(params)}" if params else url
+
+
+def _factura_api(muestra, numero="PRESUPUESTO-1"):
+    factura = muestra.pendiente
+    if factura is None:
+        return None
+    return {
+        "proveedor": factura.proveedor_id,
+        "punto_venta": factura.punto_venta_id,
+        "numero_factura": numero,
+        "fecha_factura": factura.fecha_factura.isoformat(),
+        "valor_factura": "1000.00",
+        "estado": "pendiente",
+    }
+
+
+def _pago_api(muestra):
+    pago = muestra.pago_libre
+    return {"factura": pago.factura_id, "fecha_pago": pago.fecha_pago.isoformat(), "pagado_por": "OFICINA", "notas": "Ajuste"}
+
+
+SALDOS_POR_LLAVE = "una actualizacion de SaldoResumen por cada (proveedor, PDV, estado) que toca el lote"
+
+
+def _facturas_api(muestra):
+    return muestra.pendiente and [_factura_api(muestra, f"PRESUPUESTO-{i}") for i in range(1, len(muestra.pendientes) + 1)]
+
+
+def _pagos_api(muestra):
+    return muestra.pendientes and [
+        {"factura": pk, "fecha_pago": muestra.pendiente.fecha_factura.isoformat(), "pagado_por": "OFICINA"}
+        for pk in muestra.pendientes
+    ]
+
+
+# Presupuesto de consultas por vista, medido con una cartera sintetica de 500 facturas. No debe
+# crecer con el numero de filas; si una vista nueva o un cambio lo supera, se revisa antes de subirlo.
+RUTAS = [
+    Ruta("dashboard", consultas=3),
+    Ruta("dashboard", rol="pdv", consultas=5),
+    Ruta("factura_create", consultas=4),
+    Ruta("factura_import", consultas=2),
+    Ruta("facturas_pendientes", consultas=8),
+    Ruta("facturas_pendientes", rol="pdv", consultas=9),
+    Ruta("pagos_list", consultas=7),
+    Ruta("facturas_todas", consultas=8),
+    Ruta("facturas_todas", rol="pdv", consultas=9),
+    Ruta("facturas_export", kwargs=lambda m: {"listado": "facturas_pendientes"}, params={"formato": "csv"}, consultas=3),
+    Ruta("factura_detalle", kwargs=_pk("factura"), consultas=12),
+    Ruta("factura_update", kwargs=_pk("pendiente"), consultas=7),
+    Ruta("pago_create", kwargs=_pk("pendiente"), consultas=5),
+    Ruta("pago_adjuntar", kwargs=_pk("pago_sin_comprobante"), consultas=4),
+    Ruta("pago_enviar_email", kwargs=_pk("pago_libre"), metodo="post", consultas=5),
+    Ruta("pago_confirmar", rol="anonimo", kwargs=_token("pago", firmar_token), consultas=1),
+    Ruta(
+        "pago_lote_create",
+        params=lambda m: {"ids": ",".join(map(str, m.pendientes))} if m.pendientes else None,
+        consultas=4,
+    ),
+    Ruta("pago_lote_confirmar", rol="anonimo", kwargs=_token("lote", firmar_token_lote), consultas=4),
+    Ruta("analytics_dashboard", consultas=4),
+    Ruta("portal_proveedor_dashboard", rol="portal", consultas=11),
+    Ruta("portal_proveedor_facturas", rol="portal", consultas=5),
+    Ruta("portal_proveedor_factura_detail", rol="portal", kwargs=_pk("factura"), consultas=10),
+    Ruta("portal_proveedor_pagos", rol="portal", consultas=5),
+    Ruta("portal_proveedor_pago_confirmar", rol="portal", kwargs=_pk("pago"), metodo="post", consultas=10),
+    Ruta("portal_proveedor_lote_detail", rol="portal", kwargs=_pk("lote"), consultas=12),
+    Ruta("portal_proveedor_lote_confirmar", rol="portal", kwargs=_pk("lote"), metodo="post", consultas=16),
+    Ruta("portal_proveedor_novedades", rol="portal", consultas=5),
+    Ruta("portal_proveedor_pago_novedad", rol="portal", kwargs=_pk("pago_libre"), consultas=5),
+    Ruta("portal_proveedor_lote_novedad", rol="portal", kwargs=_pk("lote"), consultas=10),
+    Ruta("portal_proveedor_notificaciones", rol="portal", consultas=5),
+    Ruta(
+        "portal_proveedor_notificaciones_leer_todas",
+        rol="portal",
+        metodo="post",
+        consultas=7,
+        crece="SQLite parte el bulk_create de eventos cada 999 parametros; en PostgreSQL es un solo INSERT.",
+    ),
+    Ruta("portal_proveedor_notificacion_leer", rol="portal", kwargs=_pk("notificacion"), metodo="post", consultas=8),
+    Ruta("portal_proveedor_comprobante", rol="portal", kwargs=_pk("pago", "pago_id"), consultas=6),
+    Ruta("proveedor-list", consultas=4),
+    Ruta(
+        "proveedor-list",
+        metodo="post",
+        datos=lambda m: {"nombre": "Proveedor presupuesto", "nit": "PRESUPUESTO-1"},
+        consultas=3,
+    ),
+    Ruta("proveedor-detail", kwargs=_pk("proveedor"), consultas=3),
+    Ruta(
+        "proveedor-detail",
+        kwargs=_pk("proveedor"),
+        metodo="put",
+        datos=lambda m: {"nombre": m.proveedor.nombre, "nit": m.proveedor.nit},
+        consultas=4,
+    ),
+    Ruta("proveedor-detail", kwargs=_pk("proveedor"), metodo="patch", datos=lambda m: {"telefono": "3000000000"}, consultas=4),
+    Ruta("proveedor-detail", kwargs=_pk("proveedor_libre"), metodo="delete", consultas=10),
+    Ruta("factura-list", consultas=4),
+    Ruta("factura-list", rol="pdv", consultas=6),
+    Ruta("factura-list", metodo="post", datos=_factura_api, consultas=9),
+    Ruta("factura-detail", kwargs=_pk("factura"), consultas=4),
+    Ruta(
+        "factura-detail",
+        kwargs=_pk("pendiente"),
+        metodo="put",
+        datos=lambda m: _factura_api(m, m.pendiente.numero_factura),
+        consultas=12,
+    ),
+    Ruta("factura-detail", kwargs=_pk("pendiente"), metodo="patch", datos=lambda m: {"valor_factura": "1234.00"}, consultas=10),
+    Ruta("factura-detail", kwargs=_pk("pendiente"), metodo="delete", consultas=11),
+    Ruta("factura-bulk", metodo="post", datos=_facturas_api, consultas=9),
+    Ruta(
+        "factura-bulk",
+        metodo="patch",
+        datos=lambda m: m.pendientes and [{"id": pk, "valor_factura": "1234.00"} for pk in m.pendientes],
+        consultas=11,
+        crece=SALDOS_POR_LLAVE,
+    ),
+    Ruta("pago-list", consultas=4),
+    Ruta(
+        "pago-list",
+        metodo="post",
+        datos=lambda m: m.pendiente and {
+            "factura": m.pendiente.pk,
+            "fecha_pago": m.pendiente.fecha_factura.isoformat(),
+            "pagado_por": "OFICINA",
+        },
+        consultas=17,
+    ),
+    Ruta("pago-detail", kwargs=_pk("pago"), consultas=3),
+    Ruta("pago-detail", kwargs=_pk("pago_libre"), metodo="put", datos=_pago_api, consultas=7),
+    Ruta("pago-detail", kwargs=_pk("pago_libre"), metodo="patch", datos=lambda m: {"notas": "Ajuste"}, consultas=4),
+    Ruta("pago-detail", kwargs=_pk("pago_libre"), metodo="delete", consultas=14),
+    Ruta("pago-bulk", metodo="post", datos=_pagos_api, consultas=19, crece=SALDOS_POR_LLAVE),
+    Ruta("pago-bulk", metodo="patch", datos=lambda m: m.pago_libre and [{"id": m.pago_libre.pk, "notas": "Ajuste"}], consultas=6),
+]
+
+# El api-root del router queda detras del dashboard (ambos en "").
+RUTAS_SIN_MEDIR = {"api-root"}
+
+
+def rutas_sin_cubrir(rutas=RUTAS):
+    """Nombres de URL de cartera/urls.py que no tienen una Ruta; sirve para no olvidar vistas nuevas."""
+    from cartera import urls
+
+    nombres = {patron.name for patron in urls.urlpatterns if getattr(patron, "name", None)}
+    nombres |= {patron.name for patron in urls.router.urls if patron.name}
+    return sorted(nombres - RUTAS_SIN_MEDIR - {ruta.nombre for ruta in rutas})
+
+
+def _host():
+    for host in settings.ALLOWED_HOSTS:
+        if host not in {"*", ""}:
+            return host.lstrip(".") or "localhost"
+    return "localhost"
+
+
+def medir_vistas(rutas=RUTAS, *, repeticiones=10, muestra=None):
+    """
+    Visita cada ruta con el cliente de pruebas de Django (una visita de calentamiento y luego
+    `repeticiones`) y devuelve por etiqueta el status, las consultas y los percentiles de latencia.
+    Las rutas que escriben corren cada visita en una transaccion revertida, asi todas ven los mismos datos.
+    """
+    muestra = muestra or Muestra()
+    clientes = {}
+    resultados = {}
+    for ruta in rutas:
+        url = ruta.url(muestra)
+        usuario = muestra.usuario(ruta.rol)
+        datos = ruta.datos(muestra) if url and ruta.datos else {}
+        if url is None or datos is None or (ruta.rol != "anonimo" and usuario is None):
+            resultados[ruta.etiqueta] = {"omitida": "sin datos para armar la URL o el usuario"}
+            continue
+        cliente = clientes.get(ruta.rol)
+        if cliente is None:
+            cliente = clientes[ruta.rol] = Client(HTTP_HOST=_host())
+            if usuario is not None:
+                cliente.force_login(usuario)
+
+        def visitar():
+            if ruta.metodo == "get":
+                response = cliente.get(url, secure=True)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                return response
+            with transaction.atomic():
+                response = cliente.generic(
+                    ruta.metodo.upper(), url, json.dumps(datos), content_type="application/json", secure=True
+                )
+                transaction.set_rollback(True)
+            return response
+
+        visitar()
+        tiempos, consultas = [], []
+        for _ in range(repeticiones):
+            with CaptureQueriesContext(connection) as ctx:
+                inicio = time.perf_counter()
+                response = visitar()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            # El savepoint de las escrituras no es consulta de la vista.
+            consultas.append(sum(1 for q in ctx.captured_queries if not q["sql"].startswith(SENTENCIAS_SAVEPOINT)))
+        resultados[ruta.etiqueta] = {
+            "url": url,
+            "status": response.status_code,
+            "consultas": max(consultas),
+            "presupuesto": ruta.consultas,
+            "p50_ms": round(percentil(tiempos, 50), 2),
+            "p90_ms": round(percentil(tiempos, 90), 2),
+            "p99_ms": round(percentil(tiempos, 99), 2),
+            "max_ms": round(max(tiempos), 2),
+        }
+    return resultados
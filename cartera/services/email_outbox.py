@@ -0,0 +1,179 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import connections, transaction
+from django.utils import timezone
+
+from cartera.models import CorreoPendiente
+from cartera.utils import _attach_fieldfile, _base_url, _log_envio, construir_recibo_lote, construir_recibo_pago
+
+# Tiempo que un correo queda reservado por un worker; si el proceso muere, otro lo retoma.
+RESERVA_SEGUNDOS = 600
+
+
+class CorreoNoEnviable(Exception):
+    """Error permanente: reintentar no cambia el resultado."""
+
+
+def _request_user(request):
+    user = getattr(request, "user", None) if request else None
+    return user if user and getattr(user, "is_authenticated", False) else None
+
+
+def _encolar(*, tipo, pago=None, lote=None, request=None, usuario=None):
+    existente = CorreoPendiente.objects.filter(
+        tipo=tipo,
+        pago=pago,
+        lote=lote,
+        estado__in=[CorreoPendiente.ESTADO_PENDIENTE, CorreoPendiente.ESTADO_ENVIANDO],
+    ).first()
+    if existente:
+        return existente
+    return CorreoPendiente.objects.create(
+        tipo=tipo,
+        pago=pago,
+        lote=lote,
+        base_url=_base_url(request),
+        solicitado_por=usuario or _request_user(request),
+    )
+
+
+def encolar_correo_pago(pago, *, request=None, usuario=None):
+    return _encolar(tipo="individual", pago=pago, request=request, usuario=usuario)
+
+
+def encolar_correo_lote(lote, *, request=None, usuario=None):
+    return _encolar(tipo="lote", lote=lote, request=request, usuario=usuario)
+
+
+def _reservar(limite):
+    ahora = timezone.now()
+    with transaction.atomic():
+        qs = CorreoPendiente.objects.filter(
+            estado__in=[CorreoPendiente.ESTADO_PENDIENTE, CorreoPendiente.ESTADO_ENVIANDO],
+            proximo_intento__lte=ahora,
+        ).order_by("id")
+        if connections[qs.db].features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+        ids = list(qs.values_list("pk", flat=True)[:limite])
+        if ids:
+            CorreoPendiente.objects.filter(pk__in=ids).update(
+                estado=CorreoPendiente.ESTADO_ENVIANDO,
+                proximo_intento=ahora + timedelta(seconds=RESERVA_SEGUNDOS),
+            )
+    return ids
+
+
+def _destinos_log(correo):
+    if correo.tipo == "lote":
+        pagos = list(correo.lote.pagos.select_related("factura", "factura__punto_venta", "factura__proveedor"))
+        return pagos, [{"factura": p.factura, "pago": p, "lote": correo.lote} for p in pagos]
+    return [correo.pago], [{"factura": correo.pago.factura, "pago": correo.pago}]
+
+
+def _enviar(correo, connection, pagos):
+    if correo.tipo == "lote":
+        lote = correo.lote
+        if not (lote.comprobante and lote.comprobante.name):
+            raise CorreoNoEnviable("Lote sin comprobante")
+        email, destinatario, asunto = construir_recibo_lote(lote, pagos, base_url=correo.base_url or None)
+        archivo = lote.comprobante
+    else:
+        pago = correo.pago
+        if not (pago.comprobante and pago.comprobante.name):
+            raise CorreoNoEnviable("Pago sin comprobante")
+        email, destinatario, asunto = construir_recibo_pago(pago, base_url=correo.base_url or None)
+        archivo = pago.comprobante
+    if not destinatario:
+        raise CorreoNoEnviable("Proveedor sin email")
+    email.connection = connection
+    _attach_fieldfile(email, archivo)
+    email.send(fail_silently=False)
+    return destinatario, asunto
+
+
+def _registrar(correo, destinos, *, exito, detalle, destinatario="", asunto=""):
+    for destino in destinos:
+        _log_envio(
+            tipo=correo.tipo,
+            enviado_a=destinatario,
+            asunto=asunto,
+            exito=exito,
+            detalle=detalle,
+            usuario=correo.solicitado_por,
+            **destino,
+        )
+
+
+def _fallo(correo, destinos, exc, *, permanente=False):
+    correo.intentos += 1
+    correo.ultimo_error = str(exc)
+    if permanente or correo.intentos >= settings.EMAIL_OUTBOX_MAX_INTENTOS:
+        correo.estado = CorreoPendiente.ESTADO_FALLIDO
+        destinatario = ""
+        if correo.tipo == "lote":
+            destinatario = (correo.lote.proveedor.email or "").strip()
+        elif correo.pago_id:
+            destinatario = (correo.pago.factura.proveedor.email or "").strip()
+        _registrar(correo, destinos, exito=False, detalle=str(exc), destinatario=destinatario)
+    else:
+        espera = settings.EMAIL_OUTBOX_BACKOFF_SEGUNDOS * 2 ** (correo.intentos - 1)
+        correo.estado = CorreoPendiente.ESTADO_PENDIENTE
+        correo.proximo_intento = timezone.now() + timedelta(seconds=espera)
+    correo.save(update_fields=["intentos", "ultimo_error", "estado", "proximo_intento"])
+    return correo.estado
+
+
+def procesar_correos_pendientes(*, limite=50):
+    """
+    Envia un lote de correos pendientes reutilizando una sola conexion SMTP.
+    Devuelve un dict con el conteo de enviados, reintentos y fallidos.
+    """
+    resultado = {"enviados": 0, "reintentos": 0, "fallidos": 0}
+    ids = _reservar(limite)
+    if not ids:
+        return resultado
+    correos = list(
+        CorreoPendiente.objects.filter(pk__in=ids)
+        .select_related(
+            "solicitado_por",
+            "pago__factura__proveedor",
+            "pago__factura__punto_venta",
+            "lote__proveedor",
+        )
+        .order_by("id")
+    )
+
+    def contar(estado):
+        resultado["fallidos" if estado == CorreoPendiente.ESTADO_FALLIDO else "reintentos"] += 1
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        for correo in correos:
+            contar(_fallo(correo, _destinos_log(correo)[1], exc))
+        return resultado
+
+    try:
+        for correo in correos:
+            pagos, destinos = _destinos_log(correo)
+            try:
+                destinatario, asunto = _enviar(correo, connection, pagos)
+            except CorreoNoEnviable as exc:
+                contar(_fallo(correo, destinos, exc, permanente=True))
+                continue
+            except Exception as exc:
+                contar(_fallo(correo, destinos, exc))
+                continue
+            correo.estado = CorreoPendiente.ESTADO_ENVIADO
+            correo.intentos += 1
+            correo.enviado_en = timezone.now()
+            correo.ultimo_error = ""
+            correo.save(update_fields=["estado", "intentos", "enviado_en", "ultimo_error"])
+            _registrar(correo, destinos, exito=True, detalle="Enviado", destinatario=destinatario, asunto=asunto)
+            resultado["enviados"] += 1
+    finally:
+        connection.close()
+    return resultado
@@ -0,0 +1,218 @@
+import csv
+import re
+import zipfile
+from datetime import date
+from xml.sax.saxutils import escape
+
+from cartera.models import Factura
+
+EXPORT_CHUNK_SIZE = 2000
+# Filas escritas entre cada entrega de bytes al cliente.
+FILAS_POR_ENVIO = 500
+
+ENCABEZADOS_FACTURAS = [
+    "Fecha factura",
+    "Número",
+    "Proveedor",
+    "NIT",
+    "Punto de venta",
+    "Valor",
+    "Total pagado",
+    "Saldo",
+    "Estado",
+    "Confirmación",
+    "Fecha último pago",
+]
+CAMPOS_FACTURAS = (
+    "fecha_factura",
+    "numero_factura",
+    "proveedor__nombre",
+    "proveedor__nit",
+    "punto_venta__nombre",
+    "valor_factura",
+    "total_pagado",
+    "estado",
+    "confirmado_pago",
+    "fecha_ultimo_pago",
+)
+
+
+def filas_facturas(qs, *, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Recorre el queryset (anotado con fecha_ultimo_pago) con un cursor del servidor y
+    entrega una tupla por factura, sin instanciar modelos ni cargar el resultado completo.
+    """
+    estados = dict(Factura.ESTADOS)
+    for fecha, numero, proveedor, nit, pdv, valor, pagado, estado, confirmado, ultimo_pago in qs.values_list(
+        *CAMPOS_FACTURAS
+    ).iterator(chunk_size=chunk_size):
+        yield (
+            fecha,
+            numero,
+            proveedor,
+            nit,
+            pdv,
+            valor,
+            pagado,
+            (valor or 0) - (pagado or 0),
+            estados.get(estado, estado),
+            "Confirmada" if confirmado else "Sin confirmar",
+            ultimo_pago,
+        )
+
+
+# Excel y LibreOffice interpretan como formula el texto que empieza con estos caracteres.
+_INICIO_FORMULA = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _texto_seguro(valor):
+    """Antepone ' al texto que una hoja de calculo abriria como formula (nombres, NIT y numeros digitados)."""
+    if isinstance(valor, str) and valor.startswith(_INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+class _Salida:
+    """Archivo de solo escritura: acumula bytes hasta que el generador los entrega."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, data):
+        self.partes.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drenar(self):
+        data = b"".join(self.partes)
+        self.partes.clear()
+        return data
+
+
+class _Linea:
+    def write(self, value):
+        return value
+
+
+def stream_csv(encabezados, filas, *, cada=FILAS_POR_ENVIO):
+    writer = csv.writer(_Linea())
+    # BOM para que Excel reconozca UTF-8 al abrir el archivo.
+    yield "\ufeff" + writer.writerow(encabezados)
+    bloque = []
+    for fila in filas:
+        bloque.append(writer.writerow(["" if v is None else _texto_seguro(v) for v in fila]))
+        if len(bloque) >= cada:
+            yield "".join(bloque)
+            bloque = []
+    if bloque:
+        yield "".join(bloque)
+
+
+_XML_INVALIDO = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_EPOCA_EXCEL = date(1899, 12, 30)
+_ESTILO_FECHA = 1
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    "</Types>"
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    "</Relationships>"
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    "</Relationships>"
+)
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    "</styleSheet>"
+)
+_HOJA_INICIO = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_HOJA_FIN = "</sheetData></worksheet>"
+
+
+def _workbook(hoja):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(hoja[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    )
+
+
+def _celda(valor):
+    if valor is None:
+        return "<c/>"
+    if isinstance(valor, bool):
+        valor = "Sí" if valor else "No"
+    if isinstance(valor, date):
+        return f'<c s="{_ESTILO_FECHA}"><v>{(valor - _EPOCA_EXCEL).days}</v></c>'
+    if isinstance(valor, (int, float)) or hasattr(valor, "as_tuple"):
+        return f"<c><v>{valor}</v></c>"
+    texto = escape(_XML_INVALIDO.sub("", _texto_seguro(str(valor))))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila(valores):
+    return ("<row>" + "".join(_celda(v) for v in valores) + "</row>").encode("utf-8")
+
+
+def stream_xlsx(encabezados, filas, *, hoja="Facturas", cada=FILAS_POR_ENVIO):
+    """
+    Escribe un .xlsx de una hoja directamente sobre el zip de salida, entregando los bytes
+    comprimidos cada `cada` filas; nunca arma el libro completo en memoria.
+    """
+    salida = _Salida()
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _RELS)
+        zf.writestr("xl/workbook.xml", _workbook(hoja))
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        zf.writestr("xl/styles.xml", _STYLES)
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(_HOJA_INICIO.encode("utf-8"))
+            sheet.write(_fila(encabezados))
+            yield salida.drenar()
+            for indice, fila in enumerate(filas, start=1):
+                sheet.write(_fila(fila))
+                if indice % cada == 0:
+                    data = salida.drenar()
+                    if data:
+                        yield data
+            sheet.write(_HOJA_FIN.encode("utf-8"))
+    yield salida.drenar()
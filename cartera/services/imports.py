@@ -0,0 +1,252 @@
+import csv
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import InvalidOperation
+
+from django import forms
+from django.db import IntegrityError, connections, transaction
+from django.db.models.functions import Upper
+from django.utils.dateparse import parse_date
+
+from cartera.forms import ALERTA_FACTURA, normalizar_numero_factura, normalizar_valor_factura
+from cartera.models import (
+    FACTURA_DUPLICADA_ERROR,
+    FACTURA_NUMERO_UNICO,
+    EventoAuditoria,
+    Factura,
+    Proveedor,
+    PuntoVenta,
+)
+from cartera.scoping import ensure_user_scope
+
+from .analytics import invalidar_analitica
+from .audit import construir_evento, registrar_eventos
+from .balances import aplicar_cambios_saldo
+
+IMPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 1000
+
+# Encabezados aceptados por columna; se comparan en minusculas y sin espacios alrededor.
+COLUMNAS = {
+    "proveedor": ("proveedor", "nit", "proveedor_nit"),
+    "punto_venta": ("punto_venta", "pdv", "punto de venta"),
+    "numero_factura": ("numero_factura", "numero", "factura", "número"),
+    "fecha_factura": ("fecha_factura", "fecha"),
+    "valor_factura": ("valor_factura", "valor"),
+}
+
+
+@dataclass
+class ErrorImportacion:
+    linea: int
+    numero_factura: str
+    mensaje: str
+
+
+@dataclass
+class ResultadoImportacion:
+    creadas: int = 0
+    errores: list = field(default_factory=list)
+
+    @property
+    def procesadas(self):
+        return self.creadas + len(self.errores)
+
+
+class _Catalogos:
+    """Proveedores y puntos de venta indexados una sola vez para resolver cada fila sin consultas."""
+
+    def __init__(self, usuario):
+        self.pdv_usuario = ensure_user_scope(usuario) if usuario is not None else None
+        self.proveedores = {}
+        for pk, nombre, nit in Proveedor.objects.values_list("pk", "nombre", "nit"):
+            self.proveedores.setdefault((nombre or "").strip().upper(), pk)
+            if nit:
+                self.proveedores[nit.strip().upper()] = pk
+        self.pdvs = {(nombre or "").strip().upper(): pk for pk, nombre in PuntoVenta.objects.values_list("pk", "nombre")}
+
+    def proveedor(self, valor):
+        pk = self.proveedores.get((valor or "").strip().upper())
+        if pk is None:
+            raise forms.ValidationError(f"Proveedor no encontrado: {valor or '(vacío)'}.")
+        return pk
+
+    def punto_venta(self, valor):
+        if self.pdv_usuario is not None:
+            return self.pdv_usuario.pk
+        pk = self.pdvs.get((valor or "").strip().upper())
+        if pk is None:
+            raise forms.ValidationError(f"Punto de venta no encontrado: {valor or '(vacío)'}.")
+        return pk
+
+
+def _columnas(encabezados):
+    normalizados = {(e or "").strip().lower(): e for e in encabezados or []}
+    resultado = {}
+    for campo, alias in COLUMNAS.items():
+        for nombre in alias:
+            if nombre in normalizados:
+                resultado[campo] = normalizados[nombre]
+                break
+    faltantes = [c for c in COLUMNAS if c not in resultado and c != "punto_venta"]
+    if faltantes:
+        raise forms.ValidationError(f"Faltan columnas en el archivo: {', '.join(faltantes)}.")
+    return resultado
+
+
+def _fecha(valor):
+    raw = (valor or "").strip()
+    try:
+        fecha = parse_date(raw)
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        try:
+            fecha = datetime.strptime(raw, "%d/%m/%Y").date()
+        except ValueError:
+            raise forms.ValidationError(f"Fecha inválida: {raw or '(vacía)'}.")
+    return fecha
+
+
+def _mensaje(exc):
+    return " ".join(exc.messages) if isinstance(exc, forms.ValidationError) else str(exc)
+
+
+def _normalizar(fila, columnas, catalogos, *, confirmar_valores_altos):
+    try:
+        valor = normalizar_valor_factura(fila.get(columnas["valor_factura"]) or "")
+    except InvalidOperation:
+        raise forms.ValidationError("Valor de factura inválido.")
+    if valor > ALERTA_FACTURA and not confirmar_valores_altos:
+        raise forms.ValidationError(f"Valor alto sin confirmar: ${int(valor):,}".replace(",", "."))
+    return {
+        "proveedor_id": catalogos.proveedor(fila.get(columnas["proveedor"])),
+        "punto_venta_id": catalogos.punto_venta(fila.get(columnas.get("punto_venta", ""))),
+        "numero_factura": normalizar_numero_factura(fila.get(columnas["numero_factura"])),
+        "fecha_factura": _fecha(fila.get(columnas["fecha_factura"])),
+        "valor_factura": valor,
+    }
+
+
+def _existentes(candidatas):
+    """{(proveedor_id, NUMERO): pk} de las facturas ya registradas, resuelto con una sola consulta por bloque."""
+    if not candidatas:
+        return {}
+    return {
+        (proveedor_id, numero): pk
+        for pk, proveedor_id, numero in Factura.objects.annotate(numero_normalizado=Upper("numero_factura"))
+        .filter(
+            proveedor_id__in={c["proveedor_id"] for c in candidatas},
+            numero_normalizado__in={c["numero_factura"] for c in candidatas},
+        )
+        .values_list("pk", "proveedor_id", "numero_normalizado")
+    }
+
+
+@transaction.atomic
+def _guardar_bloque(candidatas, *, usuario, request):
+    usuario_id = getattr(usuario, "pk", None)
+    facturas = Factura.objects.bulk_create(
+        [Factura(**datos, creado_por_id=usuario_id) for _linea, datos in candidatas],
+        batch_size=IMPORT_BATCH_SIZE,
+    )
+    if not connections[Factura.objects.db].features.can_return_rows_from_bulk_insert:
+        # (proveedor, numero) es unico sin distinguir mayusculas: identifica cada fila recien insertada.
+        pks = _existentes([datos for _linea, datos in candidatas])
+        for factura in facturas:
+            factura.pk = pks[(factura.proveedor_id, factura.numero_factura)]
+    aplicar_cambios_saldo((None, factura) for factura in facturas)
+    registrar_eventos(
+        construir_evento(
+            EventoAuditoria.TIPO_FACTURA_CREADA,
+            factura=factura,
+            usuario=usuario,
+            request=request,
+            metadata={
+                "numero_factura": factura.numero_factura,
+                "estado": factura.estado,
+                "valor_factura": factura.valor_factura,
+                "punto_venta_id": factura.punto_venta_id,
+                "proveedor_id": factura.proveedor_id,
+                "origen": "importacion",
+            },
+        )
+        for factura in facturas
+    )
+    return len(facturas)
+
+
+def importar_facturas(archivo, *, usuario=None, request=None, chunk_size=IMPORT_CHUNK_SIZE, confirmar_valores_altos=False, delimitador=","):
+    """
+    Importa facturas pendientes desde un CSV (objeto de texto) leyendo por bloques. Cada bloque
+    valida sus filas con la misma normalizacion de FacturaForm, descarta duplicados con una sola
+    consulta y se guarda con bulk_create en su propia transaccion. Devuelve ResultadoImportacion
+    con el numero de facturas creadas y los errores por linea.
+    """
+    usuario = usuario if getattr(usuario, "is_authenticated", False) else None
+    resultado = ResultadoImportacion()
+    lector = csv.DictReader(archivo, delimiter=delimitador)
+    columnas = _columnas(lector.fieldnames)
+    catalogos = _Catalogos(usuario)
+    vistas = set()
+    bloque = []
+
+    def procesar(bloque):
+        candidatas = []
+        for linea, fila in bloque:
+            try:
+                candidatas.append((linea, _normalizar(fila, columnas, catalogos, confirmar_valores_altos=confirmar_valores_altos)))
+            except forms.ValidationError as exc:
+                numero = (fila.get(columnas["numero_factura"]) or "").strip()
+                resultado.errores.append(ErrorImportacion(linea, numero, _mensaje(exc)))
+        existentes = _existentes([datos for _linea, datos in candidatas])
+        nuevas = []
+        for linea, datos in candidatas:
+            llave = (datos["proveedor_id"], datos["numero_factura"])
+            if llave in existentes:
+                mensaje = FACTURA_DUPLICADA_ERROR
+            elif llave in vistas:
+                mensaje = "Factura repetida en el archivo."
+            else:
+                vistas.add(llave)
+                nuevas.append((linea, datos))
+                continue
+            resultado.errores.append(ErrorImportacion(linea, datos["numero_factura"], mensaje))
+        while nuevas:
+            try:
+                resultado.creadas += _guardar_bloque(nuevas, usuario=usuario, request=request)
+                break
+            except IntegrityError as exc:
+                if FACTURA_NUMERO_UNICO not in str(exc):
+                    raise
+                # Otro usuario registro alguno de estos numeros mientras se validaba el bloque.
+                existentes = _existentes([datos for _linea, datos in nuevas])
+                if not existentes:
+                    raise
+                pendientes = []
+                for linea, datos in nuevas:
+                    if (datos["proveedor_id"], datos["numero_factura"]) in existentes:
+                        resultado.errores.append(ErrorImportacion(linea, datos["numero_factura"], FACTURA_DUPLICADA_ERROR))
+                    else:
+                        pendientes.append((linea, datos))
+                nuevas = pendientes
+
+    # La linea 1 es el encabezado.
+    for linea, fila in enumerate(lector, start=2):
+        bloque.append((linea, fila))
+        if len(bloque) >= chunk_size:
+            procesar(bloque)
+            bloque = []
+    if bloque:
+        procesar(bloque)
+    if resultado.creadas:
+        invalidar_analitica()
+    resultado.errores.sort(key=lambda e: e.linea)
+    return resultado
+
+
+def escribir_reporte_errores(errores, destino):
+    writer = csv.writer(destino)
+    writer.writerow(["linea", "numero_factura", "error"])
+    for error in errores:
+        writer.writerow([error.linea, error.numero_factura, error.mensaje])
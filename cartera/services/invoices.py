@@ -1,12 +1,37 @@
 from decimal import Decimal
 
-from django.db import transaction
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connections, transaction
 from django.utils import timezone
 
-from cartera.models import EventoAuditoria, Factura
+from cartera.models import FACTURA_DUPLICADA_ERROR, FACTURA_NUMERO_UNICO, EventoAuditoria, Factura, Pago
 
-from .audit import registrar_evento
-from .payments import crear_pago
+from .analytics import invalidar_analitica
+from .audit import construir_evento, registrar_evento, registrar_eventos
+from .balances import aplicar_cambio_saldo, aplicar_cambios_saldo, snapshot_factura, snapshot_facturas
+from .payments import crear_pago, crear_pagos
+
+FACTURA_CAMPOS_EDITABLES = (
+    "proveedor", "punto_venta", "numero_factura", "fecha_factura", "valor_factura", "estado", "total_pagado", "texto_busqueda",
+)
+
+
+def _error_duplicada():
+    return ValidationError({"numero_factura": ValidationError(FACTURA_DUPLICADA_ERROR, code="factura_duplicada")})
+
+
+def guardar_numero_unico(factura: Factura):
+    """
+    Guarda la factura dejando que el indice unico (proveedor, UPPER(numero)) resuelva la carrera
+    entre dos registros simultaneos; el perdedor recibe el mismo error que la validacion.
+    """
+    try:
+        with transaction.atomic():
+            factura.save()
+    except IntegrityError as exc:
+        if FACTURA_NUMERO_UNICO not in str(exc):
+            raise
+        raise _error_duplicada()
 
 
 @transaction.atomic
@@ -27,7 +52,10 @@ def guardar_factura_desde_form(
         factura.estado = "pendiente"
         factura.total_pagado = Decimal("0")
 
-    factura.save()
+    antes = None if created else snapshot_factura(factura)
+    guardar_numero_unico(factura)
+    aplicar_cambio_saldo(antes, factura)
+    invalidar_analitica()
     registrar_evento(
         EventoAuditoria.TIPO_FACTURA_CREADA if created else EventoAuditoria.TIPO_FACTURA_EDITADA,
         factura=factura,
@@ -54,3 +82,104 @@ def guardar_factura_desde_form(
             request=request,
         )
     return factura
+
+
+@transaction.atomic
+def guardar_facturas_lote(
+    facturas,
+    *,
+    created=False,
+    usuario=None,
+    request=None,
+    auto_payment_note="Pago auto-generado al marcar la factura como PAGADA.",
+) -> list[Factura]:
+    """
+    Version por lotes de guardar_factura_desde_form: las facturas (nuevas o ya modificadas) se
+    guardan con un bulk_create o bulk_update, el resumen de saldos se mueve una vez por fila y
+    los eventos y los pagos de las facturas PAGADAS se registran agrupados.
+    """
+    facturas = list(facturas)
+    if not facturas:
+        return []
+    ahora = timezone.now()
+    for factura in facturas:
+        if created and usuario and getattr(usuario, "is_authenticated", False) and not factura.creado_por_id:
+            factura.creado_por = usuario
+        if (factura.estado or "").lower() == "pagada":
+            factura.total_pagado = factura.valor_factura or Decimal("0")
+        else:
+            factura.estado = "pendiente"
+            factura.total_pagado = Decimal("0")
+        factura.actualizado_en = ahora
+        if not created:
+            factura.texto_busqueda = factura.calcular_texto_busqueda()
+
+    antes = {} if created else snapshot_facturas(f.pk for f in facturas)
+    try:
+        with transaction.atomic():
+            if created:
+                Factura.objects.bulk_create(facturas)
+            else:
+                Factura.objects.bulk_update(facturas, [*FACTURA_CAMPOS_EDITABLES, "actualizado_en"])
+    except IntegrityError as exc:
+        if FACTURA_NUMERO_UNICO not in str(exc):
+            raise
+        raise _error_duplicada()
+    if created and not connections[Factura.objects.db].features.can_return_rows_from_bulk_insert:
+        pks = {
+            (proveedor_id, numero): pk
+            for pk, proveedor_id, numero in Factura.objects.filter(
+                proveedor_id__in={f.proveedor_id for f in facturas},
+                numero_factura__in={f.numero_factura for f in facturas},
+            ).values_list("pk", "proveedor_id", "numero_factura")
+        }
+        for factura in facturas:
+            factura.pk = pks[(factura.proveedor_id, factura.numero_factura)]
+
+    aplicar_cambios_saldo((antes.get(factura.pk), factura) for factura in facturas)
+    invalidar_analitica()
+    registrar_eventos(
+        construir_evento(
+            EventoAuditoria.TIPO_FACTURA_CREADA if created else EventoAuditoria.TIPO_FACTURA_EDITADA,
+            factura=factura,
+            usuario=usuario,
+            request=request,
+            metadata={
+                "numero_factura": factura.numero_factura,
+                "estado": factura.estado,
+                "valor_factura": factura.valor_factura,
+                "punto_venta_id": factura.punto_venta_id,
+                "proveedor_id": factura.proveedor_id,
+            },
+        )
+        for factura in facturas
+    )
+
+    pagadas = [factura for factura in facturas if factura.estado == "pagada"]
+    if pagadas and not created:
+        con_pago = set(Pago.objects.filter(factura__in=pagadas).values_list("factura_id", flat=True))
+        pagadas = [factura for factura in pagadas if factura.pk not in con_pago]
+    if pagadas:
+        crear_pagos(
+            [
+                Pago(
+                    factura=factura,
+                    fecha_pago=timezone.localdate(),
+                    valor_pagado=factura.valor_factura or Decimal("0"),
+                    pagado_por=f"PDV - {factura.punto_venta.nombre}" if factura.punto_venta else "OFICINA",
+                    notas=auto_payment_note,
+                )
+                for factura in pagadas
+            ],
+            usuario=usuario,
+            request=request,
+        )
+    return facturas
+
+
+@transaction.atomic
+def eliminar_factura(factura: Factura):
+    antes = snapshot_factura(factura)
+    factura.delete()
+    aplicar_cambio_saldo(antes, None)
+    invalidar_analitica()
@@ -1,15 +1,19 @@
 from decimal import Decimal
 
 from django.core.exceptions import PermissionDenied, ValidationError
-from django.db import transaction
-from django.db.models import Sum
+from django.db import connections, transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThanOrEqual
 from django.utils import timezone
 
 from cartera.models import EventoAuditoria, Factura, PAGO_LOTE_MONOPROVEEDOR_ERROR, Pago, PagoLote
-from cartera.utils import enviar_recibo_lote, enviar_recibo_pago
 
-from .audit import registrar_evento
-from .provider_notifications import notificar_pago_registrado
+from .analytics import invalidar_analitica
+from .audit import construir_evento, registrar_evento, registrar_eventos
+from .balances import aplicar_cambio_saldo, aplicar_cambios_saldo, snapshot_factura, snapshot_facturas
+from .email_outbox import encolar_correo_lote, encolar_correo_pago
+from .provider_notifications import notificar_pago_registrado, notificar_pagos_registrados
 
 
 def _decimal(value):
@@ -20,12 +24,16 @@ def _decimal(value):
     return Decimal(str(value))
 
 
+@transaction.atomic
 def recalcular_factura(factura: Factura, *, save=True) -> Factura:
+    antes = snapshot_factura(factura) if save else None
     total = factura.pagos.aggregate(total=Sum("valor_pagado"))["total"] or Decimal("0")
     factura.total_pagado = total
     factura.estado = "pagada" if total >= _decimal(factura.valor_factura) else "pendiente"
     if save:
-        factura.save(update_fields=["total_pagado", "estado"])
+        factura.save(update_fields=["total_pagado", "estado", "actualizado_en"])
+        if antes:
+            aplicar_cambio_saldo(antes, {**antes, "total_pagado": factura.total_pagado, "estado": factura.estado})
     return factura
 
 
@@ -59,6 +67,7 @@ def crear_pago(
         lote=lote,
     )
     factura = recalcular_factura(factura)
+    invalidar_analitica()
     if registrar_auditoria:
         registrar_evento(
             EventoAuditoria.TIPO_PAGO_CREADO,
@@ -78,6 +87,171 @@ def crear_pago(
     return pago
 
 
+def recalcular_facturas(factura_ids):
+    """Equivalente a recalcular_factura para varias facturas con un solo UPDATE."""
+    total = Coalesce(
+        Subquery(
+            Pago.objects.filter(factura=OuterRef("pk"))
+            .order_by()
+            .values("factura")
+            .annotate(total=Sum("valor_pagado"))
+            .values("total")
+        ),
+        Value(Decimal("0")),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    return Factura.objects.filter(pk__in=factura_ids).update(
+        actualizado_en=timezone.now(),
+        total_pagado=total,
+        estado=Case(When(GreaterThanOrEqual(total, F("valor_factura")), then=Value("pagada")), default=Value("pendiente")),
+    )
+
+
+@transaction.atomic
+def crear_pagos(pagos, *, usuario=None, request=None) -> list[Pago]:
+    """
+    Version por lotes de crear_pago para pagos sueltos (instancias sin guardar, una por factura):
+    un INSERT para los pagos, un UPDATE para sus facturas y la auditoria y las notificaciones
+    agrupadas.
+    """
+    pagos = list(pagos)
+    if not pagos:
+        return []
+    for pago in pagos:
+        pago.fecha_pago = pago.fecha_pago or timezone.localdate()
+        pago.valor_pagado = _decimal(pago.valor_pagado if pago.valor_pagado is not None else pago.factura.valor_factura)
+        pago.pagado_por = pago.pagado_por or ""
+        pago.notas = pago.notas or ""
+
+    ids = [pago.factura_id for pago in pagos]
+    devuelve_pks = connections[Pago.objects.db].features.can_return_rows_from_bulk_insert
+    if not devuelve_pks:
+        # Todo pago nuevo actualiza su factura: con ellas bloqueadas, ningun otro pago suelto de estas
+        # facturas se confirma antes que este lote y el ultimo de cada una es el recien creado.
+        list(Factura.objects.select_for_update().filter(pk__in=ids).values_list("pk", flat=True))
+    antes = snapshot_facturas(ids)
+    Pago.objects.bulk_create(pagos)
+    if not devuelve_pks:
+        pks = dict(Pago.objects.filter(lote__isnull=True, factura_id__in=ids).order_by("pk").values_list("factura_id", "pk"))
+        for pago in pagos:
+            pago.pk = pks[pago.factura_id]
+
+    recalcular_facturas(ids)
+    despues = snapshot_facturas(ids)
+    aplicar_cambios_saldo((antes.get(pk), despues.get(pk)) for pk in ids)
+    for pago in pagos:
+        pago.factura.total_pagado = despues[pago.factura_id]["total_pagado"]
+        pago.factura.estado = despues[pago.factura_id]["estado"]
+    invalidar_analitica()
+
+    registrar_eventos(
+        construir_evento(
+            EventoAuditoria.TIPO_PAGO_CREADO,
+            factura=pago.factura,
+            pago=pago,
+            usuario=usuario,
+            request=request,
+            metadata={
+                "valor_pagado": pago.valor_pagado,
+                "fecha_pago": pago.fecha_pago,
+                "pagado_por": pago.pagado_por,
+                "lote_id": None,
+            },
+        )
+        for pago in pagos
+    )
+    notificar_pagos_registrados(pagos, request=request)
+    return pagos
+
+
+@transaction.atomic
+def actualizar_pagos(pagos, campos) -> list[Pago]:
+    """Guarda `campos` de varios pagos ya modificados con un UPDATE por lote, como save() pago por pago."""
+    pagos = list(pagos)
+    if not pagos:
+        return []
+    ahora = timezone.now()
+    for pago in pagos:
+        pago.actualizado_en = ahora
+    Pago.objects.bulk_update(pagos, [*campos, "actualizado_en"])
+    invalidar_analitica()
+    return pagos
+
+
+@transaction.atomic
+def crear_pagos_lote(
+    *,
+    lote: PagoLote,
+    facturas,
+    fecha_pago=None,
+    pagado_por="",
+    comprobante=None,
+    notas="",
+    usuario=None,
+    request=None,
+) -> list[Pago]:
+    """
+    Registra un pago por el valor total de cada factura del lote, con el mismo resultado
+    que llamar crear_pago por factura pero con inserciones y actualizaciones por lotes.
+    """
+    facturas = list(facturas)
+    for factura in facturas:
+        validar_lote_monoproveedor(factura=factura, lote=lote)
+    if not facturas:
+        return []
+
+    ids = [factura.pk for factura in facturas]
+    antes = snapshot_facturas(ids)
+    pagos = Pago.objects.bulk_create([
+        Pago(
+            factura=factura,
+            fecha_pago=fecha_pago or timezone.localdate(),
+            valor_pagado=_decimal(factura.valor_factura),
+            pagado_por=pagado_por or "",
+            comprobante=comprobante,
+            notas=notas or "",
+            lote=lote,
+        )
+        for factura in facturas
+    ])
+    if not connections[Pago.objects.db].features.can_return_rows_from_bulk_insert:
+        pks = dict(Pago.objects.filter(lote=lote, factura_id__in=ids).values_list("factura_id", "pk"))
+        for pago in pagos:
+            pago.pk = pks[pago.factura_id]
+
+    recalcular_facturas(ids)
+    despues = snapshot_facturas(ids)
+    aplicar_cambios_saldo((antes.get(pk), despues.get(pk)) for pk in ids)
+    for factura in facturas:
+        factura.total_pagado = despues[factura.pk]["total_pagado"]
+        factura.estado = despues[factura.pk]["estado"]
+    invalidar_analitica()
+
+    eventos = [
+        construir_evento(
+            EventoAuditoria.TIPO_PAGO_CREADO,
+            factura=pago.factura,
+            pago=pago,
+            lote=lote,
+            usuario=usuario,
+            request=request,
+            metadata={
+                "valor_pagado": pago.valor_pagado,
+                "fecha_pago": pago.fecha_pago,
+                "pagado_por": pago.pagado_por,
+                "lote_id": lote.pk,
+            },
+        )
+        for pago in pagos
+    ]
+    # Las notificaciones de lote se generan una vez por usuario y lote: solo el primer
+    # pago las produce, con sus eventos en el mismo orden que el camino fila por fila.
+    registrar_eventos(eventos[:1])
+    notificar_pago_registrado(pagos[0], request=request)
+    registrar_eventos(eventos[1:])
+    return pagos
+
+
 @transaction.atomic
 def eliminar_pago_seguro(pago: Pago, *, usuario=None, request=None) -> Factura:
     factura = pago.factura
@@ -95,6 +269,7 @@ def eliminar_pago_seguro(pago: Pago, *, usuario=None, request=None) -> Factura:
     }
     pago.delete()
     factura = recalcular_factura(factura)
+    invalidar_analitica()
     registrar_evento(
         EventoAuditoria.TIPO_PAGO_ELIMINADO,
         factura=factura,
@@ -110,6 +285,7 @@ def _es_pago_contado(pago: Pago) -> bool:
 
 
 def enviar_correo_pago_si_aplica(request, pago: Pago):
+    """Deja el recibo del pago en la cola de correo; el envio lo hace procesar_correos."""
     if _es_pago_contado(pago):
         return False, "Pago de contado", "contado"
     if not (pago.comprobante and pago.comprobante.name):
@@ -117,13 +293,17 @@ def enviar_correo_pago_si_aplica(request, pago: Pago):
     destinatario = ((pago.factura.proveedor.email or "").strip() if pago.factura.proveedor else "")
     if not destinatario:
         return False, "Proveedor sin email", "sin_email"
-    ok, info = enviar_recibo_pago(request, pago)
-    return ok, info, "enviado" if ok else "error"
+    encolar_correo_pago(pago, request=request)
+    return True, "En cola de envío", "encolado"
 
 
 def enviar_correo_lote_si_aplica(request, lote: PagoLote):
-    ok, info = enviar_recibo_lote(request, lote)
-    return ok, info, "enviado" if ok else "error"
+    if not (lote.proveedor.email or "").strip():
+        return False, "Proveedor sin email", "sin_email"
+    if not (lote.comprobante and lote.comprobante.name):
+        return False, "Lote sin comprobante", "sin_comprobante"
+    encolar_correo_lote(lote, request=request)
+    return True, "En cola de envío", "encolado"
 
 
 @transaction.atomic
@@ -141,7 +321,8 @@ def confirmar_factura(
         factura.confirmado_pago = True
         factura.confirmado_fecha = timezone.now()
         factura.confirmado_por_email = email if email is not None else factura.proveedor.email
-        factura.save(update_fields=["confirmado_pago", "confirmado_fecha", "confirmado_por_email"])
+        factura.save(update_fields=["confirmado_pago", "confirmado_fecha", "confirmado_por_email", "actualizado_en"])
+        invalidar_analitica()
         registrar_evento(
             event_type,
             factura=factura,
@@ -171,17 +352,21 @@ def confirmar_lote(
         raise ValidationError(PAGO_LOTE_MONOPROVEEDOR_ERROR)
 
     ahora = timezone.now()
+    email = lote.proveedor.email
     facturas_confirmadas = []
     for pago in pagos:
         factura = pago.factura
         if not factura.confirmado_pago:
             factura.confirmado_pago = True
             factura.confirmado_fecha = ahora
-            factura.confirmado_por_email = lote.proveedor.email
-            factura.save(update_fields=["confirmado_pago", "confirmado_fecha", "confirmado_por_email"])
+            factura.confirmado_por_email = email
             facturas_confirmadas.append(factura.pk)
 
     if facturas_confirmadas:
+        Factura.objects.filter(pk__in=facturas_confirmadas).update(
+            confirmado_pago=True, confirmado_fecha=ahora, confirmado_por_email=email, actualizado_en=ahora
+        )
+        invalidar_analitica()
         registrar_evento(
             event_type,
             lote=lote,
@@ -0,0 +1,157 @@
+import io
+import os
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.utils import timezone
+
+from cartera.models import ComprobanteArchivo
+
+# Pillow (con pillow-heif para las fotos HEIC) y pypdfium2 estan en requirements.txt; sin ellos no se
+# generan vistas previas y los comprobantes se sirven completos, como antes.
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:
+    Image = ImageOps = UnidentifiedImageError = None
+else:
+    try:
+        from pillow_heif import register_heif_opener
+    except ImportError:
+        pass
+    else:
+        register_heif_opener()
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+VISTA_PREVIA_LADO = 1600
+MINIATURA_LADO = 320
+CALIDAD_JPEG = 80
+# Primera pagina de los PDF a 144 dpi (pdfium parte de 72).
+PDF_ESCALA = 2
+# Igual que la cola de correos: si el worker muere con un comprobante reservado, otro lo retoma.
+RESERVA_SEGUNDOS = 600
+MAX_INTENTOS = 3
+ESPERA_SEGUNDOS = 300
+
+
+class SinVistaPrevia(Exception):
+    """El archivo no admite vista previa con las librerias instaladas; reintentar no cambia el resultado."""
+
+
+def derivados_disponibles():
+    return Image is not None
+
+
+def _abrir_imagen(comprobante):
+    with comprobante.archivo.open("rb") as fh:
+        if comprobante.tipo_contenido == "application/pdf":
+            if pypdfium2 is None:
+                raise SinVistaPrevia("pypdfium2 no esta instalado")
+            try:
+                pdf = pypdfium2.PdfDocument(fh.read())
+            except pypdfium2.PdfiumError as exc:
+                raise SinVistaPrevia(str(exc))
+            try:
+                return pdf[0].render(scale=PDF_ESCALA).to_pil()
+            finally:
+                pdf.close()
+        try:
+            imagen = Image.open(fh)
+            imagen.load()
+        except UnidentifiedImageError as exc:
+            raise SinVistaPrevia(str(exc))
+    return ImageOps.exif_transpose(imagen)
+
+
+def _jpeg(imagen, lado):
+    copia = imagen.convert("RGB")
+    copia.thumbnail((lado, lado))
+    salida = io.BytesIO()
+    copia.save(salida, "JPEG", quality=CALIDAD_JPEG, optimize=True, progressive=True)
+    return ContentFile(salida.getvalue())
+
+
+def generar_derivados(comprobante):
+    """Guarda la vista previa y la miniatura JPEG junto al original: <nombre>.vista.jpg y <nombre>.mini.jpg."""
+    imagen = _abrir_imagen(comprobante)
+    base = os.path.splitext(comprobante.archivo.name)[0]
+    storage = comprobante.archivo.storage
+    comprobante.vista_previa = storage.save(f"{base}.vista.jpg", _jpeg(imagen, VISTA_PREVIA_LADO))
+    comprobante.miniatura = storage.save(f"{base}.mini.jpg", _jpeg(imagen, MINIATURA_LADO))
+
+
+def _reservar(limite):
+    ahora = timezone.now()
+    with transaction.atomic():
+        qs = ComprobanteArchivo.objects.filter(
+            derivados__in=[ComprobanteArchivo.DERIVADOS_PENDIENTE, ComprobanteArchivo.DERIVADOS_PROCESANDO],
+            derivados_proximo_intento__lte=ahora,
+        ).order_by("id")
+        if connections[qs.db].features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+        ids = list(qs.values_list("pk", flat=True)[:limite])
+        if ids:
+            ComprobanteArchivo.objects.filter(pk__in=ids).update(
+                derivados=ComprobanteArchivo.DERIVADOS_PROCESANDO,
+                derivados_proximo_intento=ahora + timedelta(seconds=RESERVA_SEGUNDOS),
+            )
+    return ids
+
+
+def generar_vistas_previas_pendientes(*, limite=20):
+    """
+    Genera vista previa y miniatura de los comprobantes pendientes, fuera de la peticion que los subio.
+    Devuelve un dict con el conteo de listos, sin vista previa, reintentos y fallidos.
+    """
+    resultado = {"listos": 0, "sin_vista_previa": 0, "reintentos": 0, "fallidos": 0}
+    if not derivados_disponibles():
+        return resultado
+    for comprobante in ComprobanteArchivo.objects.filter(pk__in=_reservar(limite)).order_by("id"):
+        try:
+            generar_derivados(comprobante)
+        except SinVistaPrevia as exc:
+            comprobante.derivados = ComprobanteArchivo.DERIVADOS_NO_APLICA
+            comprobante.derivados_error = str(exc)
+            resultado["sin_vista_previa"] += 1
+        except Exception as exc:
+            comprobante.derivados_intentos += 1
+            comprobante.derivados_error = str(exc)
+            if comprobante.derivados_intentos >= MAX_INTENTOS:
+                comprobante.derivados = ComprobanteArchivo.DERIVADOS_FALLIDO
+                resultado["fallidos"] += 1
+            else:
+                comprobante.derivados = ComprobanteArchivo.DERIVADOS_PENDIENTE
+                espera = ESPERA_SEGUNDOS * 2 ** (comprobante.derivados_intentos - 1)
+                comprobante.derivados_proximo_intento = timezone.now() + timedelta(seconds=espera)
+                resultado["reintentos"] += 1
+        else:
+            comprobante.derivados = ComprobanteArchivo.DERIVADOS_LISTO
+            comprobante.derivados_error = ""
+            resultado["listos"] += 1
+        comprobante.save(
+            update_fields=[
+                "vista_previa",
+                "miniatura",
+                "derivados",
+                "derivados_intentos",
+                "derivados_proximo_intento",
+                "derivados_error",
+            ]
+        )
+    return resultado
+
+
+def vistas_previas(nombres):
+    """{nombre del comprobante: ComprobanteArchivo con vista previa lista}, en una consulta."""
+    nombres = {nombre for nombre in nombres if nombre}
+    if not nombres:
+        return {}
+    return {
+        comprobante.archivo.name: comprobante
+        for comprobante in ComprobanteArchivo.objects.filter(
+            archivo__in=nombres, derivados=ComprobanteArchivo.DERIVADOS_LISTO
+        ).only("archivo", "vista_previa", "miniatura")
+    }
@@ -1,8 +1,19 @@
+import hashlib
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count
 from django.urls import reverse
 
-from cartera.models import EventoAuditoria, NotificacionProveedor, ProveedorUsuario
+from cartera.models import ContadorNotificaciones, EventoAuditoria, NotificacionProveedor, ProveedorUsuario
+
+from .audit import construir_evento, registrar_evento, registrar_eventos
+from .provider_scope import PortalScope, require_portal_access
 
-from .audit import registrar_evento
+# La llave del snapshot cambia con cada ajuste de los contadores, asi que no hace falta invalidar.
+ULTIMAS_CACHE_TIMEOUT = 3600
+ULTIMAS_CAMPOS = ("pk", "tipo", "titulo", "mensaje", "leida", "url_destino", "creada_en", "proveedor_id")
 
 
 def _usuarios_destino(proveedor):
@@ -13,6 +24,51 @@ def _usuarios_destino(proveedor):
     )
 
 
+def _insertar_notificaciones(nuevas):
+    """Un INSERT masivo; en motores sin RETURNING en INSERT masivo, una fila a la vez para tener cada pk."""
+    if connections[NotificacionProveedor.objects.db].features.can_return_rows_from_bulk_insert:
+        NotificacionProveedor.objects.bulk_create(nuevas)
+    else:
+        for notif in nuevas:
+            notif.save(force_insert=True)
+
+
+class ResumenNotificaciones:
+    """No leidas y ultimas notificaciones de un usuario del portal, sin contar filas de NotificacionProveedor."""
+
+    def __init__(self, alcance):
+        self.alcance = alcance
+        self.proveedor_ids = require_portal_access(alcance)
+        self.contadores = list(
+            ContadorNotificaciones.objects.filter(usuario=alcance.user, proveedor_id__in=self.proveedor_ids)
+            .order_by("proveedor_id")
+            .values_list("proveedor_id", "no_leidas", "actualizado_en")
+        )
+        self.no_leidas = max(sum(no_leidas for _pid, no_leidas, _ts in self.contadores), 0)
+
+    def _llave(self):
+        estado = repr((sorted(self.proveedor_ids), self.contadores)).encode()
+        return f"cartera:portal:ultimas:{self.alcance.user.pk}:{hashlib.sha256(estado).hexdigest()}"
+
+    def ultimas(self, limite=5):
+        llave = f"{self._llave()}:{limite}"
+        snapshot = cache.get(llave)
+        if snapshot is None:
+            snapshot = list(
+                NotificacionProveedor.objects.filter(usuario=self.alcance.user, proveedor_id__in=self.proveedor_ids)
+                .order_by("-creada_en", "-id")
+                .values(*ULTIMAS_CAMPOS)[:limite]
+            )
+            cache.set(llave, snapshot, ULTIMAS_CACHE_TIMEOUT)
+        return snapshot
+
+
+def resumen_notificaciones(alcance):
+    if not isinstance(alcance, PortalScope):
+        alcance = PortalScope(alcance)
+    return ResumenNotificaciones(alcance)
+
+
 def crear_notificacion(
     *,
     usuario,
@@ -56,132 +112,211 @@ def crear_notificacion(
     return notif
 
 
-def notificar_pago_registrado(pago, *, request=None):
-    proveedor = pago.factura.proveedor
-    if pago.lote_id:
-        url = reverse("portal_proveedor_lote_detail", args=[pago.lote_id])
-        tipo = NotificacionProveedor.TIPO_LOTE_REGISTRADO
-        titulo = f"Lote #{pago.lote_id} registrado"
-        mensaje = "Se registró un pago por lote asociado a tus facturas."
-        created = []
-        for link in _usuarios_destino(proveedor):
-            notif, was_created = NotificacionProveedor.objects.get_or_create(
-                usuario=link.user,
+def despachar_notificaciones(
+    *,
+    proveedor,
+    tipo,
+    titulo,
+    mensaje="",
+    factura=None,
+    pago=None,
+    lote=None,
+    url_destino="",
+    request=None,
+    metadata=None,
+    unica_por_lote=False,
+):
+    """
+    Notifica a todos los usuarios activos del proveedor con un INSERT de notificaciones y
+    un registro agrupado de sus eventos de auditoria. Con unica_por_lote, omite a los
+    usuarios que ya tienen una notificacion de ese tipo para el lote.
+    """
+    usuarios = list({link.user_id: link.user for link in _usuarios_destino(proveedor)}.values())
+    if unica_por_lote and lote is not None and usuarios:
+        existentes = set(
+            NotificacionProveedor.objects.filter(
                 proveedor=proveedor,
                 tipo=tipo,
-                lote=pago.lote,
-                defaults={
-                    "titulo": titulo,
-                    "mensaje": mensaje,
-                    "url_destino": url,
-                    "factura": pago.factura,
-                    "pago": pago,
+                lote=lote,
+                usuario__in=usuarios,
+            ).values_list("usuario_id", flat=True)
+        )
+        usuarios = [usuario for usuario in usuarios if usuario.pk not in existentes]
+    if not usuarios:
+        return []
+    nuevas = [
+        NotificacionProveedor(
+            usuario=usuario,
+            proveedor=proveedor,
+            tipo=tipo,
+            titulo=titulo,
+            mensaje=mensaje or "",
+            factura=factura,
+            pago=pago,
+            lote=lote,
+            url_destino=url_destino or "",
+        )
+        for usuario in usuarios
+    ]
+    _insertar_notificaciones(nuevas)
+    registrar_eventos(
+        [
+            construir_evento(
+                EventoAuditoria.TIPO_NOTIFICACION_GENERADA,
+                factura=factura,
+                pago=pago,
+                lote=lote,
+                usuario=notif.usuario,
+                request=request,
+                metadata={
+                    "origen": "portal_proveedor",
+                    "proveedor_id": proveedor.pk,
+                    "notificacion_id": notif.pk,
+                    "tipo": tipo,
+                    **(metadata or {}),
                 },
             )
-            if was_created:
-                registrar_evento(
-                    EventoAuditoria.TIPO_NOTIFICACION_GENERADA,
-                    factura=pago.factura,
-                    pago=pago,
-                    lote=pago.lote,
-                    usuario=link.user,
-                    request=request,
-                    metadata={
-                        "origen": "portal_proveedor",
-                        "proveedor_id": proveedor.pk,
-                        "notificacion_id": notif.pk,
-                        "tipo": tipo,
-                    },
-                )
-                created.append(notif)
-        return created
-
-    url = reverse("portal_proveedor_factura_detail", args=[pago.factura_id])
-    return [
-        crear_notificacion(
-            usuario=link.user,
+            for notif in nuevas
+        ]
+    )
+    return nuevas
+
+
+def _url_destino(*, factura=None, lote=None):
+    if lote is not None:
+        return reverse("portal_proveedor_lote_detail", args=[lote.pk])
+    return reverse("portal_proveedor_factura_detail", args=[factura.pk])
+
+
+def notificar_pago_registrado(pago, *, request=None):
+    proveedor = pago.factura.proveedor
+    if pago.lote_id:
+        # Una notificacion por usuario y lote, sin importar cuantos pagos tenga el lote.
+        return despachar_notificaciones(
             proveedor=proveedor,
-            tipo=NotificacionProveedor.TIPO_PAGO_REGISTRADO,
-            titulo=f"Pago registrado para factura {pago.factura.numero_factura}",
-            mensaje="Hay un nuevo pago disponible para revisar y confirmar.",
+            tipo=NotificacionProveedor.TIPO_LOTE_REGISTRADO,
+            titulo=f"Lote #{pago.lote_id} registrado",
+            mensaje="Se registró un pago por lote asociado a tus facturas.",
             factura=pago.factura,
             pago=pago,
-            url_destino=url,
+            lote=pago.lote,
+            url_destino=_url_destino(lote=pago.lote),
             request=request,
+            unica_por_lote=True,
         )
-        for link in _usuarios_destino(proveedor)
+
+    return despachar_notificaciones(proveedor=proveedor, pago=pago, request=request, **_aviso_pago(pago))
+
+
+def _aviso_pago(pago):
+    return {
+        "tipo": NotificacionProveedor.TIPO_PAGO_REGISTRADO,
+        "titulo": f"Pago registrado para factura {pago.factura.numero_factura}",
+        "mensaje": "Hay un nuevo pago disponible para revisar y confirmar.",
+        "factura": pago.factura,
+        "url_destino": _url_destino(factura=pago.factura),
+    }
+
+
+def notificar_pagos_registrados(pagos, *, request=None):
+    """
+    notificar_pago_registrado para varios pagos sueltos: los usuarios de todos los proveedores se
+    leen en una consulta y las notificaciones, los contadores y los eventos se escriben por lotes.
+    """
+    pagos = list(pagos)
+    for pago in pagos:
+        if pago.lote_id:
+            notificar_pago_registrado(pago, request=request)
+    pagos = [pago for pago in pagos if not pago.lote_id]
+    destinos = {}
+    links = ProveedorUsuario.objects.select_related("user").filter(
+        proveedor_id__in={pago.factura.proveedor_id for pago in pagos},
+        activo=True,
+        recibe_notificaciones=True,
+    )
+    for link in links:
+        destinos.setdefault(link.proveedor_id, {})[link.user_id] = link.user
+    nuevas = [
+        NotificacionProveedor(usuario=usuario, proveedor=pago.factura.proveedor, pago=pago, **_aviso_pago(pago))
+        for pago in pagos
+        for usuario in destinos.get(pago.factura.proveedor_id, {}).values()
     ]
+    if not nuevas:
+        return []
+    _insertar_notificaciones(nuevas)
+    registrar_eventos(
+        [
+            construir_evento(
+                EventoAuditoria.TIPO_NOTIFICACION_GENERADA,
+                factura=notif.factura,
+                pago=notif.pago,
+                usuario=notif.usuario,
+                request=request,
+                metadata={
+                    "origen": "portal_proveedor",
+                    "proveedor_id": notif.proveedor_id,
+                    "notificacion_id": notif.pk,
+                    "tipo": notif.tipo,
+                },
+            )
+            for notif in nuevas
+        ]
+    )
+    return nuevas
 
 
 def notificar_correo_enviado(*, factura=None, pago=None, lote=None, request=None, exito=False):
     proveedor = factura.proveedor if factura else lote.proveedor if lote else None
     if not proveedor:
         return []
-    url = reverse("portal_proveedor_lote_detail", args=[lote.pk]) if lote else reverse("portal_proveedor_factura_detail", args=[factura.pk])
-    return [
-        crear_notificacion(
-            usuario=link.user,
-            proveedor=proveedor,
-            tipo=NotificacionProveedor.TIPO_CORREO_ENVIADO,
-            titulo="Correo de confirmación enviado" if exito else "Correo de confirmación no enviado",
-            mensaje="Se registró el resultado del envío de correo de confirmación.",
-            factura=factura,
-            pago=pago,
-            lote=lote,
-            url_destino=url,
-            request=request,
-            metadata={"exito": exito},
-        )
-        for link in _usuarios_destino(proveedor)
-    ]
+    return despachar_notificaciones(
+        proveedor=proveedor,
+        tipo=NotificacionProveedor.TIPO_CORREO_ENVIADO,
+        titulo="Correo de confirmación enviado" if exito else "Correo de confirmación no enviado",
+        mensaje="Se registró el resultado del envío de correo de confirmación.",
+        factura=factura,
+        pago=pago,
+        lote=lote,
+        url_destino=_url_destino(factura=factura, lote=lote),
+        request=request,
+        metadata={"exito": exito},
+    )
 
 
 def notificar_confirmacion(*, proveedor, usuario_actor, factura=None, pago=None, lote=None, request=None):
-    tipo = NotificacionProveedor.TIPO_CONFIRMACION_LOTE if lote else NotificacionProveedor.TIPO_CONFIRMACION_PAGO
-    titulo = "Lote confirmado" if lote else "Pago confirmado"
-    url = reverse("portal_proveedor_lote_detail", args=[lote.pk]) if lote else reverse("portal_proveedor_factura_detail", args=[factura.pk])
-    return [
-        crear_notificacion(
-            usuario=link.user,
-            proveedor=proveedor,
-            tipo=tipo,
-            titulo=titulo,
-            mensaje="La recepción fue confirmada desde el portal de proveedores.",
-            factura=factura,
-            pago=pago,
-            lote=lote,
-            url_destino=url,
-            request=request,
-            metadata={"usuario_actor_id": getattr(usuario_actor, "pk", None)},
-        )
-        for link in _usuarios_destino(proveedor)
-    ]
+    return despachar_notificaciones(
+        proveedor=proveedor,
+        tipo=NotificacionProveedor.TIPO_CONFIRMACION_LOTE if lote else NotificacionProveedor.TIPO_CONFIRMACION_PAGO,
+        titulo="Lote confirmado" if lote else "Pago confirmado",
+        mensaje="La recepción fue confirmada desde el portal de proveedores.",
+        factura=factura,
+        pago=pago,
+        lote=lote,
+        url_destino=_url_destino(factura=factura, lote=lote),
+        request=request,
+        metadata={"usuario_actor_id": getattr(usuario_actor, "pk", None)},
+    )
 
 
 def notificar_novedad(*, proveedor, usuario_actor, factura=None, pago=None, lote=None, motivo="", request=None):
-    url = reverse("portal_proveedor_lote_detail", args=[lote.pk]) if lote else reverse("portal_proveedor_factura_detail", args=[factura.pk])
-    return [
-        crear_notificacion(
-            usuario=link.user,
-            proveedor=proveedor,
-            tipo=NotificacionProveedor.TIPO_NOVEDAD,
-            titulo="Novedad reportada",
-            mensaje="Se registró una novedad desde el portal de proveedores.",
-            factura=factura,
-            pago=pago,
-            lote=lote,
-            url_destino=url,
-            request=request,
-            metadata={"usuario_actor_id": getattr(usuario_actor, "pk", None), "motivo": motivo},
-        )
-        for link in _usuarios_destino(proveedor)
-    ]
+    return despachar_notificaciones(
+        proveedor=proveedor,
+        tipo=NotificacionProveedor.TIPO_NOVEDAD,
+        titulo="Novedad reportada",
+        mensaje="Se registró una novedad desde el portal de proveedores.",
+        factura=factura,
+        pago=pago,
+        lote=lote,
+        url_destino=_url_destino(factura=factura, lote=lote),
+        request=request,
+        metadata={"usuario_actor_id": getattr(usuario_actor, "pk", None), "motivo": motivo},
+    )
 
 
 def marcar_notificacion_leida(notificacion, *, request=None):
     if not notificacion.leida:
-        notificacion.leida = True
-        notificacion.save(update_fields=["leida"])
+        if not notificacion.marcar_leida():
+            return notificacion
         registrar_evento(
             EventoAuditoria.TIPO_NOTIFICACION_LEIDA,
             factura=notificacion.factura,
@@ -196,3 +331,79 @@ def marcar_notificacion_leida(notificacion, *, request=None):
             },
         )
     return notificacion
+
+
+@transaction.atomic
+def marcar_todas_leidas(alcance, *, request=None):
+    """
+    Marca como leidas todas las notificaciones visibles del usuario con un solo UPDATE
+    y registra sus eventos de auditoria en una escritura agrupada. Devuelve cuantas marco.
+    """
+    if not isinstance(alcance, PortalScope):
+        alcance = PortalScope(alcance)
+    pendientes = list(
+        NotificacionProveedor.objects.select_for_update()
+        .filter(usuario=alcance.user, proveedor_id__in=require_portal_access(alcance), leida=False)
+        .order_by("id")
+        .values("pk", "proveedor_id", "factura_id", "pago_id", "lote_id")
+    )
+    if not pendientes:
+        return 0
+    NotificacionProveedor.objects.filter(pk__in=[n["pk"] for n in pendientes]).update(leida=True)
+    marcadas = Counter((alcance.user.pk, notif["proveedor_id"]) for notif in pendientes)
+    ContadorNotificaciones.objects.aplicar({llave: -cantidad for llave, cantidad in marcadas.items()})
+    eventos = []
+    for notif in pendientes:
+        evento = construir_evento(
+            EventoAuditoria.TIPO_NOTIFICACION_LEIDA,
+            usuario=alcance.user,
+            request=request,
+            metadata={
+                "origen": "portal_proveedor",
+                "proveedor_id": notif["proveedor_id"],
+                "notificacion_id": notif["pk"],
+            },
+        )
+        evento.factura_id = notif["factura_id"]
+        evento.pago_id = notif["pago_id"]
+        evento.lote_id = notif["lote_id"]
+        eventos.append(evento)
+    registrar_eventos(eventos)
+    return len(pendientes)
+
+
+def _contadores_esperados():
+    return {
+        (fila["usuario_id"], fila["proveedor_id"]): fila["no_leidas"]
+        for fila in NotificacionProveedor.objects.filter(leida=False)
+        .order_by()
+        .values("usuario_id", "proveedor_id")
+        .annotate(no_leidas=Count("pk"))
+    }
+
+
+def diferencias_contadores():
+    """Compara los contadores guardados con las notificaciones no leidas; devuelve una lista de (llave, guardado, esperado)."""
+    esperado = _contadores_esperados()
+    guardado = {
+        (usuario_id, proveedor_id): no_leidas
+        for usuario_id, proveedor_id, no_leidas in ContadorNotificaciones.objects.values_list(
+            "usuario_id", "proveedor_id", "no_leidas"
+        )
+    }
+    diferencias = []
+    for llave in sorted(set(esperado) | set(guardado)):
+        if guardado.get(llave, 0) != esperado.get(llave, 0):
+            diferencias.append((llave, guardado.get(llave, 0), esperado.get(llave, 0)))
+    return diferencias
+
+
+@transaction.atomic
+def reconstruir_contadores():
+    esperado = _contadores_esperados()
+    ContadorNotificaciones.objects.all().delete()
+    ContadorNotificaciones.objects.bulk_create(
+        ContadorNotificaciones(usuario_id=usuario_id, proveedor_id=proveedor_id, no_leidas=no_leidas)
+        for (usuario_id, proveedor_id), no_leidas in esperado.items()
+    )
+    return len(esperado)
@@ -19,14 +19,49 @@ def proveedor_ids(user):
     return list(proveedores_activos(user).values_list("id", flat=True))
 
 
+class PortalScope:
+    """
+    Alcance del portal de un usuario: vinculos activos, proveedores y permisos de confirmacion.
+    Se resuelve con una sola consulta y se reutiliza durante todo el request.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.links = list(proveedor_links(user))
+        proveedores = {}
+        for link in self.links:
+            proveedores.setdefault(link.proveedor_id, link.proveedor)
+        self.proveedores = sorted(proveedores.values(), key=lambda p: (p.nombre, p.pk))
+        self.proveedor_ids = [p.pk for p in self.proveedores]
+        self._confirmables = {link.proveedor_id for link in self.links if link.puede_confirmar_pagos}
+
+    def puede_confirmar(self, proveedor):
+        return getattr(proveedor, "pk", proveedor) in self._confirmables
+
+
+def portal_scope(request):
+    """Devuelve el PortalScope del usuario del request, calculandolo una sola vez."""
+    scope = getattr(request, "_cartera_portal_scope", None)
+    if scope is None or scope.user != request.user:
+        scope = PortalScope(request.user)
+        request._cartera_portal_scope = scope
+    return scope
+
+
+def _scope(user):
+    return user if isinstance(user, PortalScope) else PortalScope(user)
+
+
 def require_portal_access(user):
-    ids = proveedor_ids(user)
+    ids = _scope(user).proveedor_ids
     if not ids:
         raise PermissionDenied("No tienes un proveedor activo asociado al portal.")
     return ids
 
 
 def user_can_confirm(user, proveedor):
+    if isinstance(user, PortalScope):
+        return user.puede_confirmar(proveedor)
     return proveedor_links(user).filter(proveedor=proveedor, puede_confirmar_pagos=True).exists()
 
 
@@ -55,9 +90,10 @@ def lotes_visibles(user):
 
 
 def notificaciones_visibles(user):
-    ids = require_portal_access(user)
+    scope = _scope(user)
+    ids = require_portal_access(scope)
     return NotificacionProveedor.objects.select_related("proveedor", "factura", "pago", "lote").filter(
-        usuario=user,
+        usuario=scope.user,
         proveedor_id__in=ids,
     )
 
@@ -79,7 +115,11 @@ def get_notificacion_for_user(user, pk):
 
 
 def validate_comprobante_access(user, pago):
-    if not pagos_visibles(user).filter(pk=pago.pk).exists():
+    if isinstance(user, PortalScope):
+        visible = pago.factura.proveedor_id in require_portal_access(user)
+    else:
+        visible = pagos_visibles(user).filter(pk=pago.pk).exists()
+    if not visible:
         raise PermissionDenied("No tienes permiso para ver este comprobante.")
     if not (pago.comprobante and pago.comprobante.name):
         raise PermissionDenied("Este pago no tiene comprobante disponible.")
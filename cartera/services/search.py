@@ -0,0 +1,138 @@
+import sqlite3
+
+from django.db import connections
+from django.db.models import F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+
+from cartera.models import Factura, normalizar_busqueda
+
+# Indice de busqueda sobre Factura.texto_busqueda: trigramas GIN en PostgreSQL, tabla FTS5 con
+# tokenizador trigram en SQLite. Ambos resuelven "contiene" sin recorrer la tabla ni hacer joins.
+FTS_TABLA = "cartera_factura_fts"
+TRGM_INDICE = "factura_busqueda_trgm_idx"
+# Los trigramas no indexan terminos mas cortos; esos se buscan con LIKE sobre la misma columna.
+MIN_TRIGRAMA = 3
+
+_FTS_TRIGGERS = {
+    "ai": (
+        "AFTER INSERT ON cartera_factura BEGIN "
+        f"INSERT INTO {FTS_TABLA}(rowid, texto_busqueda) VALUES (new.id, new.texto_busqueda); END"
+    ),
+    "ad": (
+        "AFTER DELETE ON cartera_factura BEGIN "
+        f"INSERT INTO {FTS_TABLA}({FTS_TABLA}, rowid, texto_busqueda) VALUES ('delete', old.id, old.texto_busqueda); END"
+    ),
+    "au": (
+        "AFTER UPDATE OF texto_busqueda ON cartera_factura BEGIN "
+        f"INSERT INTO {FTS_TABLA}({FTS_TABLA}, rowid, texto_busqueda) VALUES ('delete', old.id, old.texto_busqueda); "
+        f"INSERT INTO {FTS_TABLA}(rowid, texto_busqueda) VALUES (new.id, new.texto_busqueda); END"
+    ),
+}
+_motores = {}
+
+
+class SimilitudPalabra(Func):
+    """word_similarity de pg_trgm: que tanto se parece el termino a alguna parte del texto (0 a 1)."""
+
+    function = "word_similarity"
+    output_field = FloatField()
+
+
+def _fts5_disponible(connection):
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        opciones = {fila[0] for fila in cursor.fetchall()}
+    return "ENABLE_FTS5" in opciones
+
+
+def sentencias_crear_indice(connection):
+    """SQL del indice para el motor de la base de datos; en SQLite sin FTS5 no hay indice y se busca con LIKE."""
+    if connection.vendor == "postgresql":
+        return [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            f"CREATE INDEX IF NOT EXISTS {TRGM_INDICE} ON cartera_factura USING gin (texto_busqueda gin_trgm_ops)",
+        ]
+    if connection.vendor == "sqlite" and _fts5_disponible(connection):
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLA} USING fts5("
+            "texto_busqueda, content='cartera_factura', content_rowid='id', tokenize='trigram')",
+            *(f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLA}_{sufijo} {cuerpo}" for sufijo, cuerpo in _FTS_TRIGGERS.items()),
+            f"INSERT INTO {FTS_TABLA}({FTS_TABLA}) VALUES ('rebuild')",
+        ]
+    return []
+
+
+def sentencias_eliminar_indice(connection):
+    if connection.vendor == "postgresql":
+        return [f"DROP INDEX IF EXISTS {TRGM_INDICE}"]
+    if connection.vendor == "sqlite":
+        return [*(f"DROP TRIGGER IF EXISTS {FTS_TABLA}_{sufijo}" for sufijo in _FTS_TRIGGERS), f"DROP TABLE IF EXISTS {FTS_TABLA}"]
+    return []
+
+
+def crear_indice_busqueda(schema_editor):
+    for sentencia in sentencias_crear_indice(schema_editor.connection):
+        schema_editor.execute(sentencia)
+    _motores.pop(schema_editor.connection.alias, None)
+
+
+def eliminar_indice_busqueda(schema_editor):
+    for sentencia in sentencias_eliminar_indice(schema_editor.connection):
+        schema_editor.execute(sentencia)
+    _motores.pop(schema_editor.connection.alias, None)
+
+
+def reconstruir_indice_busqueda(using=None):
+    """Borra y recrea el indice con un cursor, sin editor de esquema, para poder correr dentro de una transaccion."""
+    connection = connections[using or Factura.objects.db]
+    with connection.cursor() as cursor:
+        for sentencia in sentencias_eliminar_indice(connection) + sentencias_crear_indice(connection):
+            cursor.execute(sentencia)
+    _motores.pop(connection.alias, None)
+
+
+def motor_busqueda(using=None):
+    """'trigram', 'fts5' o 'like' segun la base de datos; se averigua una vez por conexion."""
+    connection = connections[using or Factura.objects.db]
+    if connection.alias not in _motores:
+        if connection.vendor == "postgresql":
+            motor = "trigram"
+        elif connection.vendor == "sqlite" and FTS_TABLA in connection.introspection.table_names():
+            motor = "fts5"
+        else:
+            motor = "like"
+        _motores[connection.alias] = motor
+    return _motores[connection.alias]
+
+
+def buscar_facturas(queryset, q, *, tambien=None, ordenar=False):
+    """
+    Filtra las facturas cuyo texto de busqueda (numero, proveedor, NIT y PDV normalizados) contiene
+    `q`, mas las que cumplan `tambien` si se da. Con ordenar=True anota `relevancia` (mayor es mejor):
+    word_similarity en PostgreSQL y bm25 en SQLite.
+    """
+    termino = normalizar_busqueda(q)
+    if not termino:
+        return queryset
+    motor = motor_busqueda(queryset.db)
+    if motor == "fts5" and len(termino) >= MIN_TRIGRAMA:
+        frase = '"' + termino.replace('"', '""') + '"'
+        tabla = Factura._meta.db_table
+        condicion = Q(pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLA} WHERE {FTS_TABLA} MATCH %s", (frase,)))
+        # rank es bm25: mas negativo es mas relevante.
+        relevancia = RawSQL(
+            f"-(SELECT rank FROM {FTS_TABLA} WHERE {FTS_TABLA} MATCH %s AND rowid = {tabla}.id)",
+            (frase,),
+            output_field=FloatField(),
+        )
+    else:
+        condicion = Q(texto_busqueda__contains=termino)
+        relevancia = SimilitudPalabra(Value(termino), F("texto_busqueda")) if motor == "trigram" else Value(0.0)
+    if tambien is not None:
+        condicion |= tambien
+    queryset = queryset.filter(condicion)
+    if ordenar:
+        queryset = queryset.annotate(relevancia=relevancia)
+    return queryset
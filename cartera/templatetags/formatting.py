@@ -1,5 +1,7 @@
 from django import template
+from django.http import QueryDict
 
+from cartera.pagination import CURSOR_PARAM
 from cartera.scoping import get_user_pdv
 
 register = template.Library()
@@ -46,3 +48,32 @@ def user_pv(context):
     request = context.get("request")
     user = getattr(request, "user", None)
     return get_user_pdv(user)
+
+
+@register.simple_tag(takes_context=True)
+def cursor_query(context, cursor=None):
+    """
+    Conserva los filtros actuales del GET y reemplaza el cursor de paginacion.
+    """
+    request = context.get("request")
+    params = request.GET.copy() if request else None
+    if params is None:
+        return f"?{CURSOR_PARAM}={cursor}" if cursor else "?"
+    params.pop(CURSOR_PARAM, None)
+    params.pop("page", None)
+    if cursor:
+        params[CURSOR_PARAM] = cursor
+    return f"?{params.urlencode()}"
+
+
+@register.simple_tag(takes_context=True)
+def export_query(context, formato):
+    """
+    Conserva los filtros actuales del GET, sin paginacion, y agrega el formato de exportacion.
+    """
+    request = context.get("request")
+    params = request.GET.copy() if request else QueryDict(mutable=True)
+    params.pop(CURSOR_PARAM, None)
+    params.pop("page", None)
+    params["formato"] = formato
+    return f"?{params.urlencode()}"
@@ -1,18 +1,46 @@
-from datetime import date
+import csv
+import hashlib
+import json
+import os
+from datetime import date, timedelta
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+from io import BytesIO, StringIO
+from xml.etree import ElementTree
 from decimal import Decimal
-from unittest import mock
+from unittest import mock, skipUnless
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ValidationError
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.management import CommandError, call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import SimpleTestCase, TestCase, override_settings
+from django.core.files.storage import InMemoryStorage
+from django.core.mail import EmailMessage, get_connection
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 
+from carterapro.storage_backends import MediaStorage
+
 from .forms import FacturaForm
+from .serializers import FACTURA_API_COLUMNAS, PAGO_API_COLUMNAS, FacturaSerializer, PagoSerializer
+from .pagination import CursorInvalido, KeysetPaginator, decode_cursor, encode_cursor
 from .models import (
+    FACTURA_DUPLICADA_ERROR,
+    ComprobanteArchivo,
+    ContadorNotificaciones,
     CorreoEnvioLog,
+    CorreoPendiente,
     EventoAuditoria,
     Factura,
     NotificacionProveedor,
@@ -22,9 +50,40 @@ from .models import (
     ProveedorUsuario,
     PuntoVenta,
     PuntoVentaUsuario,
+    SaldoResumen,
+    normalizar_busqueda,
+)
+from .services.analytics import calcular_analitica, obtener_analitica, previous_month_bounds, rango_por_defecto
+from .services.audit import registrar_evento
+from .services.balances import diferencias_saldos, reconstruir_saldos
+from .services.benchmarks import RUTAS, medir_vistas, percentil, rutas_sin_cubrir, sembrar_cartera
+from .services.email_outbox import encolar_correo_pago, procesar_correos_pendientes
+from .services.exports import stream_xlsx
+from .services.imports import _existentes as _existentes_importacion, importar_facturas
+from .services.invoices import eliminar_factura, guardar_factura_desde_form
+from .services.payments import (
+    confirmar_factura,
+    confirmar_lote,
+    crear_pago,
+    crear_pagos,
+    crear_pagos_lote,
+    eliminar_pago_seguro,
+    enviar_correo_lote_si_aplica,
+    recalcular_factura,
+)
+from .services.provider_notifications import (
+    crear_notificacion,
+    diferencias_contadores,
+    marcar_todas_leidas,
+    notificar_confirmacion,
+    notificar_novedad,
+    notificar_pago_registrado,
+    resumen_notificaciones,
 )
-from .services.payments import confirmar_lote, crear_pago, eliminar_pago_seguro, recalcular_factura
-from .utils import enviar_recibo_pago, firmar_token, firmar_token_lote
+from .services.previews import SinVistaPrevia, derivados_disponibles, generar_vistas_previas_pendientes
+from .services.search import motor_busqueda
+from .services.provider_scope import PortalScope, facturas_visibles, portal_scope, user_can_confirm
+from .utils import _attach_fieldfile, firmar_token, firmar_token_lote
 from .validators import validate_comprobante_file
 
 
@@ -42,10 +101,32 @@ class SettingsEnvironmentTests(SimpleTestCase):
         self.assertEqual(settings.DATABASES["default"]["ENGINE"], "django.db.backends.sqlite3")
         self.assertEqual(settings.PASSWORD_HASHERS, ["django.contrib.auth.hashers.MD5PasswordHasher"])
 
+    def _settings_de(self, **env):
+        codigo = "import django; django.setup(); from django.conf import settings; print(settings.CACHES['default']['BACKEND'])"
+        entorno = {"PATH": os.environ.get("PATH", ""), "DJANGO_SETTINGS_MODULE": "carterapro.settings", **env}
+        salida = subprocess.run(
+            [sys.executable, "-c", codigo], cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True, check=True
+        )
+        return salida.stdout.strip()
+
+    def test_cache_por_defecto_compartida_en_produccion(self):
+        produccion = {
+            "APP_ENV": "production",
+            "SECRET_KEY": "k" * 50,
+            "ALLOWED_HOSTS": "cartera.example.com",
+            "CSRF_TRUSTED_ORIGINS": "https://cartera.example.com",
+            "SITE_URL": "https://cartera.example.com",
+            "DATABASE_URL": "sqlite:////tmp/cartera-settings.sqlite3",
+            "EMAIL_HOST_PASSWORD": "x",
+        }
+        self.assertEqual(self._settings_de(**produccion), "django.core.cache.backends.db.DatabaseCache")
+        self.assertEqual(self._settings_de(APP_ENV="local", DJANGO_LOAD_DOTENV="false"), "django.core.cache.backends.locmem.LocMemCache")
+
 
 @override_settings(STORAGES=TEST_STORAGES)
 class CarteraBaseTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.staff = User.objects.create_user("staff", password="pass", is_staff=True)
         self.user = User.objects.create_user("pdv-user", password="pass")
         self.other_user = User.objects.create_user("other-user", password="pass")
@@ -103,6 +184,95 @@ class FacturaFormValueFormatTests(CarteraBaseTestCase):
                 self.assertEqual(form.cleaned_data["valor_factura"], expected)
 
 
+@override_settings(STORAGES=TEST_STORAGES)
+class FacturaNumeroUnicoTests(CarteraBaseTestCase):
+    def _data(self, numero, **extra):
+        return {
+            "proveedor": self.proveedor.id,
+            "punto_venta": self.pv.id,
+            "numero_factura": numero,
+            "fecha_factura": "2026-03-01",
+            "valor_factura": "1000",
+            "estado": "pendiente",
+            **extra,
+        }
+
+    def test_indice_unico_ignora_mayusculas(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Factura.objects.create(
+                proveedor=self.proveedor,
+                punto_venta=self.other_pv,
+                numero_factura="f-001",
+                fecha_factura=date(2026, 1, 1),
+                valor_factura=Decimal("1.00"),
+            )
+
+    def test_formulario_reporta_duplicado_en_el_campo(self):
+        form = FacturaForm(data=self._data(" f-001 "), user=self.staff)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors["numero_factura"], ["Ya existe una factura con ese proveedor y ese número."])
+
+        form = FacturaForm(data=self._data("f-001"), instance=self.factura, user=self.staff)
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_api_reporta_duplicado(self):
+        api = APIClient()
+        api.force_authenticate(self.staff)
+        response = api.post(reverse("factura-list"), self._data("f-002"), format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["numero_factura"], ["Ya existe una factura con ese proveedor y ese número."])
+
+    def test_carrera_entre_validacion_y_guardado_devuelve_el_mismo_error(self):
+        reconstruir_saldos()
+        form = FacturaForm(data=self._data("F-RACE"), user=self.staff)
+        self.assertTrue(form.is_valid(), form.errors)
+        Factura.objects.create(
+            proveedor=self.proveedor,
+            punto_venta=self.other_pv,
+            numero_factura="f-race",
+            fecha_factura=date(2026, 3, 1),
+            valor_factura=Decimal("5.00"),
+        )
+        reconstruir_saldos()
+        with self.assertRaises(ValidationError) as ctx:
+            guardar_factura_desde_form(form.save(commit=False), created=True, usuario=self.staff)
+        self.assertEqual(ctx.exception.message_dict, {"numero_factura": ["Ya existe una factura con ese proveedor y ese número."]})
+        self.assertEqual(diferencias_saldos(), [])
+        self.assertFalse(EventoAuditoria.objects.filter(metadata__numero_factura="F-RACE").exists())
+
+    def test_vista_de_creacion_muestra_el_error_de_la_carrera(self):
+        self.client.force_login(self.staff)
+        with mock.patch.object(Factura, "validate_constraints"):
+            response = self.client.post(reverse("factura_create"), self._data("f-001"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["form"].errors["numero_factura"], ["Ya existe una factura con ese proveedor y ese número."])
+        self.assertEqual(Factura.objects.filter(numero_factura__iexact="F-001").count(), 1)
+
+    def test_importacion_reintenta_el_bloque_sin_los_numeros_tomados(self):
+        real = _existentes_importacion
+        lecturas = []
+
+        def _existentes(candidatas):
+            # La primera lectura no ve F-001, como si otra carga la hubiera registrado despues de validar.
+            lecturas.append(len(candidatas))
+            return set() if len(lecturas) == 1 else real(candidatas)
+
+        with mock.patch("cartera.services.imports._existentes", side_effect=_existentes):
+            resultado = importar_facturas(
+                StringIO(
+                    "proveedor,punto_venta,numero_factura,fecha_factura,valor_factura\n"
+                    "900,PDV Centro,f-001,2026-03-01,1000\n"
+                    "900,PDV Centro,N-1,2026-03-01,1000\n"
+                )
+            )
+        self.assertEqual(resultado.creadas, 1)
+        self.assertEqual(
+            [(e.linea, e.mensaje) for e in resultado.errores],
+            [(2, "Ya existe una factura con ese proveedor y ese número.")],
+        )
+        self.assertTrue(Factura.objects.filter(numero_factura="N-1").exists())
+
+
 @override_settings(STORAGES=TEST_STORAGES)
 class PermissionScopeTests(CarteraBaseTestCase):
     def test_normal_user_cannot_see_other_pdv_invoice_detail(self):
@@ -297,6 +467,339 @@ class BusinessServiceTests(CarteraBaseTestCase):
         self.assertEqual(evento.metadata["pago_id"], pago_a_id)
 
 
+@override_settings(STORAGES=TEST_STORAGES)
+class SaldoResumenTests(CarteraBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        reconstruir_saldos()
+
+    def _saldo(self, pv, estado):
+        row = SaldoResumen.objects.filter(proveedor=self.proveedor, punto_venta=pv, estado=estado).first()
+        return (row.facturas, row.saldo) if row else (0, Decimal("0"))
+
+    def test_cambios_actualizan_la_fecha_del_resumen(self):
+        antes = timezone.now() - timedelta(days=1)
+        SaldoResumen.objects.update(actualizado_en=antes)
+        crear_pago(factura=self.factura, valor_pagado=Decimal("40000.00"), pagado_por="OFICINA")
+        fila = SaldoResumen.objects.get(proveedor=self.proveedor, punto_venta=self.pv, estado="pendiente")
+        self.assertGreater(fila.actualizado_en, antes)
+
+    def test_services_keep_summary_in_sync(self):
+        self.assertEqual(self._saldo(self.pv, "pendiente"), (1, Decimal("100000.00")))
+
+        pago = crear_pago(factura=self.factura, valor_pagado=Decimal("40000.00"), pagado_por="OFICINA")
+        self.assertEqual(self._saldo(self.pv, "pendiente"), (1, Decimal("60000.00")))
+        crear_pago(factura=self.factura, valor_pagado=Decimal("60000.00"), pagado_por="OFICINA")
+        self.assertEqual(self._saldo(self.pv, "pendiente"), (0, Decimal("0")))
+        self.assertEqual(self._saldo(self.pv, "pagada"), (1, Decimal("0")))
+        self.factura.refresh_from_db()
+        eliminar_pago_seguro(pago, usuario=self.staff)
+        self.assertEqual(self._saldo(self.pv, "pendiente"), (1, Decimal("40000.00")))
+
+        nueva = Factura(
+            proveedor=self.proveedor,
+            punto_venta=self.other_pv,
+            numero_factura="SR-001",
+            fecha_factura=date(2026, 3, 1),
+            valor_factura=Decimal("50000.00"),
+        )
+        guardar_factura_desde_form(nueva, created=True, usuario=self.staff)
+        self.assertEqual(self._saldo(self.other_pv, "pendiente"), (2, Decimal("250000.00")))
+        nueva.punto_venta = self.pv
+        nueva.valor_factura = Decimal("70000.00")
+        guardar_factura_desde_form(nueva, created=False, usuario=self.staff)
+        self.assertEqual(self._saldo(self.other_pv, "pendiente"), (1, Decimal("200000.00")))
+        self.assertEqual(self._saldo(self.pv, "pendiente"), (2, Decimal("110000.00")))
+        eliminar_factura(nueva)
+        self.assertEqual(self._saldo(self.pv, "pendiente"), (1, Decimal("40000.00")))
+        self.assertEqual(diferencias_saldos(), [])
+
+    def test_dashboard_reads_summary(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.context["total_pendiente"], Decimal("300000.00"))
+        self.assertEqual(response.context["pendientes_count"], 2)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.context["total_pendiente"], Decimal("100000.00"))
+        self.assertEqual(response.context["proveedores_con_saldo"], 1)
+
+    def test_command_checks_and_rebuilds_drift(self):
+        SaldoResumen.objects.filter(punto_venta=self.pv).update(facturas=7)
+        with self.assertRaises(CommandError):
+            call_command("recalcular_saldos", "--check", stdout=StringIO())
+        call_command("recalcular_saldos", stdout=StringIO())
+        self.assertEqual(diferencias_saldos(), [])
+        call_command("recalcular_saldos", "--check", stdout=StringIO())
+
+
+def _analitica_referencia(*, d1, d2, rango, pv_scope=None, prov=None, today):
+    """Calculo fila por fila equivalente a la version anterior de analytics_dashboard."""
+    base = Factura.objects.all()
+    if pv_scope:
+        base = base.filter(punto_venta=pv_scope)
+    if prov:
+        base = base.filter(proveedor_id=prov)
+    periodo = list(base.filter(fecha_factura__range=[d1, d2]))
+    pagos = list(Pago.objects.filter(factura__in=periodo).select_related("factura"))
+    pendientes = list(base.filter(estado="pendiente"))
+    total = sum((f.valor_factura for f in periodo), Decimal("0"))
+    pagado = sum((p.valor_pagado for p in pagos), Decimal("0"))
+    dias = [(p.fecha_pago - p.factura.fecha_factura).days for p in pagos]
+    valor_pendiente = sum((f.valor_factura - f.total_pagado for f in pendientes), Decimal("0"))
+    hoy = timezone.localdate()
+    por_prov = {}
+    for f in periodo:
+        por_prov[f.proveedor_id] = por_prov.get(f.proveedor_id, Decimal("0")) + f.valor_factura
+    top = sorted(por_prov.values(), reverse=True)
+    con_pago = {p.factura_id for p in pagos}
+    contado = [p for p in pagos if "auto-generado" in (p.notas or "").lower()]
+    con_comp = [p for p in pagos if p.comprobante]
+    resultado = {
+        "kpi_total": round(total, 0),
+        "kpi_facturas": len(periodo),
+        "kpi_pagado": round(pagado, 0),
+        "kpi_dias": round(round(sum(dias) / len(dias), 1), 1) if dias else 0.0,
+        "kpi_valor_pendiente": round(valor_pendiente, 0),
+        "kpi_num_pendientes": len(pendientes),
+        "kpi_pct_pagado": round(_pct(pagado, total), 1),
+        "kpi_pct_contado": round(_pct(len(contado), len(pagos)), 1),
+        "kpi_tasa_conf": round(_pct(len([f for f in periodo if f.confirmado_pago]), len(con_pago)), 1),
+        "kpi_cob_comp": round(_pct(len(con_comp), len(pagos)), 1),
+        "kpi_share_top1": round(_pct(top[0] if top else 0, total), 1),
+        "kpi_share_top3": round(_pct(sum(top[:3]), total), 1),
+        "kpi_nuevas_7d": base.filter(creado_en__gte=timezone.now() - timedelta(days=7)).count(),
+        "kpi_antig_pend": round(sum((hoy - f.fecha_factura).days for f in pendientes) / len(pendientes), 1) if pendientes else 0.0,
+        "kpi_ticket_pend": round(valor_pendiente / len(pendientes), 0) if pendientes else 0.0,
+    }
+    if rango == "mes_actual":
+        prev_d1, prev_d2 = previous_month_bounds(today)
+        prev_total = sum((f.valor_factura for f in base.filter(fecha_factura__range=[prev_d1, prev_d2])), Decimal("0"))
+        resultado["kpi_delta_mes_ant"] = round(_pct(total - prev_total, prev_total), 1)
+        resultado["kpi_delta_monto"] = round(total - prev_total, 0)
+    else:
+        resultado["kpi_delta_mes_ant"] = None
+        resultado["kpi_delta_monto"] = Decimal("0")
+    return resultado
+
+
+def _pct(num, den):
+    return (Decimal(num) / Decimal(den)) * Decimal("100") if den else Decimal("0")
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class AnalyticsServiceTests(CarteraBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = date(2026, 3, 15)
+        self.proveedor_dos = Proveedor.objects.create(nombre="Proveedor Dos", nit="901")
+        facturas = [
+            (self.proveedor, self.pv, "A-1", date(2026, 3, 1), "150000.00"),
+            (self.proveedor, self.other_pv, "A-2", date(2026, 3, 5), "80000.00"),
+            (self.proveedor_dos, self.pv, "B-1", date(2026, 3, 10), "320000.00"),
+            (self.proveedor_dos, self.pv, "B-2", date(2026, 2, 20), "45000.00"),
+            (self.proveedor_dos, self.other_pv, "B-3", date(2026, 3, 12), "99000.00"),
+        ]
+        self.facturas = {}
+        for proveedor, pv, numero, fecha, valor in facturas:
+            self.facturas[numero] = Factura.objects.create(
+                proveedor=proveedor,
+                punto_venta=pv,
+                numero_factura=numero,
+                fecha_factura=fecha,
+                valor_factura=Decimal(valor),
+            )
+        pagos = [
+            ("A-1", date(2026, 3, 4), "150000.00", "Pago auto-generado (contado)", True),
+            ("B-1", date(2026, 3, 20), "100000.00", "", False),
+            ("B-1", date(2026, 3, 25), "20000.00", "", True),
+            ("B-2", date(2026, 3, 1), "45000.00", "", False),
+            ("B-3", date(2026, 3, 12), "9000.00", "AUTO-GENERADO", False),
+        ]
+        for numero, fecha, valor, notas, con_comprobante in pagos:
+            factura = self.facturas[numero]
+            Pago.objects.create(
+                factura=factura,
+                fecha_pago=fecha,
+                valor_pagado=Decimal(valor),
+                notas=notas,
+                comprobante="comprobantes/c.pdf" if con_comprobante else "",
+            )
+            recalcular_factura(factura)
+        Factura.objects.filter(numero_factura="A-1").update(confirmado_pago=True)
+
+    def assertCoincideConReferencia(self, **kwargs):
+        d1, d2 = rango_por_defecto(kwargs["rango"], self.today)
+        kwargs.setdefault("d1", d1)
+        kwargs.setdefault("d2", d2)
+        resultado = calcular_analitica(today=self.today, **kwargs)
+        esperado = _analitica_referencia(
+            d1=kwargs["d1"],
+            d2=kwargs["d2"],
+            rango=kwargs["rango"],
+            pv_scope=kwargs.get("pv_scope"),
+            prov=kwargs.get("prov"),
+            today=self.today,
+        )
+        for key, value in esperado.items():
+            self.assertEqual(resultado[key], value, key)
+        return resultado
+
+    def test_coincide_con_calculo_por_filas(self):
+        self.assertCoincideConReferencia(rango="mes_actual")
+        self.assertCoincideConReferencia(rango="este_anio")
+        self.assertCoincideConReferencia(rango="mes_actual", pv_scope=self.pv)
+        self.assertCoincideConReferencia(rango="mes_anterior", prov=str(self.proveedor_dos.id))
+        self.assertCoincideConReferencia(rango="personalizado", d1=date(2026, 3, 6), d2=date(2026, 3, 31))
+
+    def test_series_y_ranking(self):
+        resultado = self.assertCoincideConReferencia(rango="este_anio")
+        self.assertEqual(resultado["top_prov"][0]["id"], self.proveedor.id)
+        self.assertEqual([m["m"] for m in resultado["by_month"]], ["2026-01-01", "2026-02-01", "2026-03-01"])
+        self.assertEqual(resultado["top_facturas"][0]["numero_factura"], "B-1")
+
+    def test_numero_de_consultas_fijo(self):
+        with self.assertNumQueries(6):
+            calcular_analitica(d1=date(2026, 1, 1), d2=self.today, rango="mes_actual", today=self.today)
+
+    def test_cache_reutiliza_resultado_hasta_que_cambian_los_datos(self):
+        filtros = {"d1": date(2026, 3, 1), "d2": date(2026, 3, 31), "rango": "mes_actual", "today": self.today}
+        primero = obtener_analitica(**filtros)
+        with self.assertNumQueries(0):
+            self.assertEqual(obtener_analitica(**filtros), primero)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_pago(factura=self.facturas["A-2"], fecha_pago=date(2026, 3, 14), valor_pagado=Decimal("80000.00"))
+        nuevo = obtener_analitica(**filtros)
+        self.assertEqual(nuevo["kpi_pagado"], primero["kpi_pagado"] + Decimal("80000"))
+        self.assertEqual(nuevo, calcular_analitica(**filtros))
+
+    def test_cache_separa_alcance_de_pdv(self):
+        filtros = {"d1": date(2026, 1, 1), "d2": self.today, "rango": "este_anio", "today": self.today}
+        global_ = obtener_analitica(**filtros)
+        centro = obtener_analitica(pv_scope=self.pv, **filtros)
+        norte = obtener_analitica(pdv=str(self.other_pv.id), **filtros)
+        self.assertNotEqual(global_["kpi_total"], centro["kpi_total"])
+        self.assertEqual(centro["kpi_total"] + norte["kpi_total"], global_["kpi_total"])
+
+    def test_confirmacion_invalida_cache(self):
+        filtros = {"d1": date(2026, 3, 1), "d2": date(2026, 3, 31), "rango": "mes_actual", "today": self.today}
+        self.assertEqual(obtener_analitica(**filtros)["kpi_tasa_conf"], calcular_analitica(**filtros)["kpi_tasa_conf"])
+        with self.captureOnCommitCallbacks(execute=True):
+            confirmar_factura(self.facturas["B-1"], email="proveedor@example.com")
+        self.assertEqual(obtener_analitica(**filtros)["kpi_tasa_conf"], calcular_analitica(**filtros)["kpi_tasa_conf"])
+
+    def test_backends_de_archivo_y_base_de_datos(self):
+        filtros = {"d1": date(2026, 3, 1), "d2": date(2026, 3, 31), "rango": "mes_actual", "today": self.today}
+        with tempfile.TemporaryDirectory() as location:
+            backends = [
+                {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location},
+                {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "cartera_cache_test"},
+            ]
+            for backend in backends:
+                with self.subTest(backend=backend["BACKEND"]), override_settings(CACHES={"default": backend}):
+                    call_command("createcachetable", verbosity=0)
+                    esperado = calcular_analitica(**filtros)
+                    self.assertEqual(obtener_analitica(**filtros), esperado)
+                    self.assertEqual(obtener_analitica(**filtros), esperado)
+                    with self.captureOnCommitCallbacks(execute=True):
+                        crear_pago(factura=self.facturas["A-2"], fecha_pago=date(2026, 3, 14), valor_pagado=Decimal("1000.00"))
+                    self.assertEqual(obtener_analitica(**filtros), calcular_analitica(**filtros))
+
+    def test_vista_usa_servicio(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("analytics_dashboard"), {"rango": "este_anio"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("kpi_total", response.context)
+        self.assertIn("top_prov_json", response.context)
+
+
+@override_settings(STORAGES=TEST_STORAGES, AUDITORIA_DIFERIDA=True)
+class AuditoriaDiferidaTests(CarteraBaseTestCase):
+    def _inserts_auditoria(self, ctx):
+        tabla = EventoAuditoria._meta.db_table
+        return [q for q in ctx.captured_queries if q["sql"].startswith(f'INSERT INTO "{tabla}"')]
+
+    def test_eventos_se_escriben_en_un_insert_al_confirmar(self):
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                pago = crear_pago(
+                    factura=self.factura,
+                    fecha_pago=date(2026, 2, 2),
+                    valor_pagado=Decimal("100000.00"),
+                    usuario=self.staff,
+                )
+                confirmar_factura(self.factura, pago=pago, usuario=self.staff)
+                self.assertFalse(EventoAuditoria.objects.exists())
+        self.assertEqual(len(self._inserts_auditoria(ctx)), 1)
+        self.assertEqual(
+            list(EventoAuditoria.objects.order_by("id").values_list("tipo", "factura_id", "usuario_id")),
+            [
+                (EventoAuditoria.TIPO_PAGO_CREADO, self.factura.pk, self.staff.pk),
+                (EventoAuditoria.TIPO_CONFIRMACION_FACTURA_PUBLICA, self.factura.pk, self.staff.pk),
+            ],
+        )
+
+    def test_savepoint_revertido_descarta_sus_eventos(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_evento(EventoAuditoria.TIPO_FACTURA_EDITADA, factura=self.factura, metadata={"paso": 1})
+            try:
+                with transaction.atomic():
+                    registrar_evento(EventoAuditoria.TIPO_FACTURA_EDITADA, factura=self.factura, metadata={"paso": 2})
+                    raise ValueError
+            except ValueError:
+                pass
+            with transaction.atomic():
+                registrar_evento(EventoAuditoria.TIPO_FACTURA_EDITADA, factura=self.factura, metadata={"paso": 3})
+        pasos = list(EventoAuditoria.objects.order_by("id").values_list("metadata__paso", flat=True))
+        self.assertEqual(pasos, [1, 3])
+
+    def test_ultimo_evento_en_savepoint_revertido(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_evento(EventoAuditoria.TIPO_FACTURA_EDITADA, factura=self.factura, metadata={"paso": 1})
+            try:
+                with transaction.atomic():
+                    registrar_evento(EventoAuditoria.TIPO_FACTURA_EDITADA, factura=self.factura, metadata={"paso": 2})
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(list(EventoAuditoria.objects.values_list("metadata__paso", flat=True)), [1])
+
+    def test_savepoints_anidados_se_escriben_en_un_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        registrar_evento(EventoAuditoria.TIPO_FACTURA_EDITADA, factura=self.factura, metadata={"paso": 1})
+                        raise ValueError
+                except ValueError:
+                    pass
+                with transaction.atomic():
+                    registrar_evento(EventoAuditoria.TIPO_FACTURA_EDITADA, factura=self.factura, metadata={"paso": 2})
+                    with transaction.atomic():
+                        registrar_evento(EventoAuditoria.TIPO_FACTURA_EDITADA, factura=self.factura, metadata={"paso": 3})
+                registrar_evento(EventoAuditoria.TIPO_FACTURA_EDITADA, factura=self.factura, metadata={"paso": 4})
+        self.assertEqual(len(self._inserts_auditoria(ctx)), 1)
+        pasos = list(EventoAuditoria.objects.order_by("id").values_list("metadata__paso", flat=True))
+        self.assertEqual(pasos, [2, 3, 4])
+
+    def test_referencia_eliminada_en_la_misma_transaccion_queda_en_null(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pago = Pago.objects.create(factura=self.factura, fecha_pago=date(2026, 2, 2), valor_pagado=Decimal("1.00"))
+            registrar_evento(EventoAuditoria.TIPO_PAGO_CREADO, factura=self.factura, pago=pago)
+            pago.delete()
+        evento = EventoAuditoria.objects.get()
+        self.assertIsNone(evento.pago_id)
+        self.assertEqual(evento.factura_id, self.factura.pk)
+
+
+@override_settings(AUDITORIA_DIFERIDA=True)
+class AuditoriaSinTransaccionTests(TransactionTestCase):
+    def test_fuera_de_transaccion_escribe_de_inmediato(self):
+        registrar_evento(EventoAuditoria.TIPO_FACTURA_EDITADA, metadata={"origen": "cli"})
+        self.assertEqual(EventoAuditoria.objects.get().metadata, {"origen": "cli"})
+
+
 @override_settings(STORAGES=TEST_STORAGES)
 class ComprobanteValidationTests(TestCase):
     def test_rejects_dangerous_extension(self):
@@ -314,6 +817,388 @@ class ComprobanteValidationTests(TestCase):
         uploaded = SimpleUploadedFile("comprobante.pdf", b"%PDF-1.4", content_type="application/pdf")
         validate_comprobante_file(uploaded)
 
+    def test_revisa_el_contenido_y_no_solo_la_extension(self):
+        disfrazados = [
+            SimpleUploadedFile("comprobante.pdf", b"MZ\x90\x00ejecutable", content_type="application/pdf"),
+            SimpleUploadedFile("foto.jpg", b"%PDF-1.4", content_type="image/jpeg"),
+            SimpleUploadedFile("comprobante.pdf", b"\xff\xd8\xff\xe0foto", content_type="application/pdf"),
+        ]
+        for uploaded in disfrazados:
+            with self.subTest(nombre=uploaded.name), self.assertRaises(ValidationError):
+                validate_comprobante_file(uploaded)
+        heic = SimpleUploadedFile("foto.heic", b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00", content_type="image/heic")
+        validate_comprobante_file(heic)
+        self.assertEqual(heic.tell(), 0)
+        # Una foto PNG con extension .jpg sigue siendo una imagen permitida.
+        validate_comprobante_file(SimpleUploadedFile("foto.jpg", b"\x89PNG\r\n\x1a\nresto", content_type="image/jpeg"))
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class ComprobantePorContenidoTests(CarteraBaseTestCase):
+    PDF = b"%PDF-1.4 recibo de consignacion"
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=self.media_root)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+    def _archivos(self):
+        return sorted(
+            os.path.relpath(os.path.join(raiz, nombre), self.media_root)
+            for raiz, _dirs, nombres in os.walk(self.media_root)
+            for nombre in nombres
+        )
+
+    def test_mismo_contenido_se_guarda_una_vez(self):
+        digest = hashlib.sha256(self.PDF).hexdigest()
+        primero = crear_pago(factura=self.factura, comprobante=SimpleUploadedFile("recibo.pdf", self.PDF))
+        segundo = crear_pago(factura=self.other_factura, comprobante=SimpleUploadedFile("otro-nombre.PDF", self.PDF))
+        self.assertEqual(primero.comprobante.name, f"comprobantes/{digest[:2]}/{digest}.pdf")
+        self.assertEqual(segundo.comprobante.name, primero.comprobante.name)
+        self.assertEqual(self._archivos(), [primero.comprobante.name])
+        archivo = ComprobanteArchivo.objects.get()
+        self.assertEqual((archivo.sha256, archivo.tamano, archivo.tipo_contenido), (digest, len(self.PDF), "application/pdf"))
+        with Pago.objects.get(pk=segundo.pk).comprobante.open("rb") as fh:
+            self.assertEqual(fh.read(), self.PDF)
+
+    def test_contenido_distinto_no_se_mezcla(self):
+        crear_pago(factura=self.factura, comprobante=SimpleUploadedFile("recibo.pdf", self.PDF))
+        foto = crear_pago(factura=self.other_factura, comprobante=SimpleUploadedFile("foto.jpeg", b"\xff\xd8\xff\xe0foto"))
+        self.assertTrue(foto.comprobante.name.endswith(".jpg"))
+        self.assertEqual(ComprobanteArchivo.objects.count(), 2)
+        self.assertEqual(len(self._archivos()), 2)
+
+    def test_adjuntar_reutiliza_el_comprobante_de_un_lote(self):
+        pago = crear_pago(factura=self.factura)
+        lote = PagoLote.objects.create(
+            proveedor=self.proveedor,
+            fecha_pago=date(2026, 3, 1),
+            pagado_por="OFICINA",
+            comprobante=SimpleUploadedFile("lote.pdf", self.PDF),
+        )
+        self.client.force_login(self.staff)
+        response = self.client.post(
+            reverse("pago_adjuntar", args=[pago.pk]),
+            {"comprobante": SimpleUploadedFile("copia.pdf", self.PDF, content_type="application/pdf")},
+        )
+        self.assertEqual(response.status_code, 302)
+        pago.refresh_from_db()
+        self.assertEqual(pago.comprobante.name, lote.comprobante.name)
+        self.assertEqual(len(self._archivos()), 1)
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class VistasPreviasComprobanteTests(CarteraBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=media_root)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.pago = crear_pago(factura=self.factura, comprobante=SimpleUploadedFile("recibo.pdf", b"%PDF-1.4 recibo"))
+        self.archivo = ComprobanteArchivo.objects.get()
+        self.base = os.path.splitext(self.archivo.archivo.name)[0]
+
+    def _listo(self):
+        ComprobanteArchivo.objects.filter(pk=self.archivo.pk).update(
+            derivados=ComprobanteArchivo.DERIVADOS_LISTO,
+            vista_previa=f"{self.base}.vista.jpg",
+            miniatura=f"{self.base}.mini.jpg",
+        )
+
+    def test_portal_sirve_vista_previa_y_original_a_un_clic(self):
+        portal_user = User.objects.create_user("portal-vista", password="pass")
+        ProveedorUsuario.objects.create(user=portal_user, proveedor=self.proveedor)
+        self.client.force_login(portal_user)
+        url = reverse("portal_proveedor_comprobante", args=[self.pago.pk])
+        self.assertTrue(self.client.get(url)["Location"].endswith(".pdf"))
+        self._listo()
+        self.assertTrue(self.client.get(url)["Location"].endswith(".vista.jpg"))
+        self.assertTrue(self.client.get(url, {"original": "1"})["Location"].endswith(".pdf"))
+        self.assertEqual(
+            list(
+                EventoAuditoria.objects.filter(tipo=EventoAuditoria.TIPO_COMPROBANTE_VISUALIZADO)
+                .order_by("id")
+                .values_list("metadata__original", flat=True)
+            ),
+            [False, False, True],
+        )
+
+    def test_detalle_interno_muestra_miniatura(self):
+        self.client.force_login(self.staff)
+        url = reverse("factura_detalle", args=[self.factura.pk])
+        self.assertNotContains(self.client.get(url), "comprobante-miniatura")
+        self._listo()
+        response = self.client.get(url)
+        self.assertContains(response, f"{self.base}.mini.jpg")
+        self.assertContains(response, f"{self.base}.vista.jpg")
+        self.assertContains(response, f'href="{self.pago.comprobante.url}"')
+
+    @mock.patch("cartera.services.previews.derivados_disponibles", return_value=True)
+    def test_cola_reintenta_y_descarta_sin_bloquear(self, _disponibles):
+        with mock.patch("cartera.services.previews.generar_derivados", side_effect=OSError("storage caido")):
+            self.assertEqual(generar_vistas_previas_pendientes()["reintentos"], 1)
+            # Con el reintento en el futuro no se vuelve a tomar de inmediato.
+            self.assertEqual(generar_vistas_previas_pendientes()["reintentos"], 0)
+        self.archivo.refresh_from_db()
+        self.assertEqual((self.archivo.derivados, self.archivo.derivados_intentos), (ComprobanteArchivo.DERIVADOS_PENDIENTE, 1))
+
+        ComprobanteArchivo.objects.update(derivados_proximo_intento=timezone.now())
+        with mock.patch("cartera.services.previews.generar_derivados", side_effect=SinVistaPrevia("sin pdfium")):
+            self.assertEqual(generar_vistas_previas_pendientes()["sin_vista_previa"], 1)
+        self.archivo.refresh_from_db()
+        self.assertEqual(self.archivo.derivados, ComprobanteArchivo.DERIVADOS_NO_APLICA)
+        self.assertEqual(self.archivo.derivados_error, "sin pdfium")
+
+    def test_comando_exige_pillow(self):
+        with mock.patch("cartera.services.previews.Image", None), self.assertRaises(CommandError):
+            call_command("generar_vistas_previas", stdout=StringIO())
+
+    @skipUnless(derivados_disponibles(), "Pillow no esta instalado")
+    def test_genera_jpeg_reducidos_junto_al_original(self):
+        from PIL import Image
+
+        contenido = BytesIO()
+        Image.new("RGB", (3000, 2000), "white").save(contenido, "PNG")
+        pago = crear_pago(factura=self.other_factura, comprobante=SimpleUploadedFile("foto.png", contenido.getvalue()))
+        call_command("generar_vistas_previas", stdout=StringIO())
+        archivo = ComprobanteArchivo.objects.get(archivo=pago.comprobante.name)
+        self.assertEqual(archivo.derivados, ComprobanteArchivo.DERIVADOS_LISTO)
+        self.assertEqual(archivo.vista_previa.name, pago.comprobante.name.replace(".png", ".vista.jpg"))
+        with archivo.miniatura.open("rb") as fh:
+            miniatura = Image.open(fh)
+            self.assertEqual((miniatura.format, max(miniatura.size)), ("JPEG", 320))
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class PagoLoteBatchTests(CarteraBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.portal_users = [User.objects.create_user(f"portal-{i}", password="pass") for i in range(2)]
+        for portal_user in self.portal_users:
+            ProveedorUsuario.objects.create(user=portal_user, proveedor=self.proveedor)
+
+    def _facturas(self, prefijo, cantidad):
+        return [
+            Factura.objects.create(
+                proveedor=self.proveedor,
+                punto_venta=self.pv if i % 2 else self.other_pv,
+                numero_factura=f"{prefijo}-{i}",
+                fecha_factura=date(2026, 2, 1) + timedelta(days=i),
+                valor_factura=Decimal("1000.00") * (i + 1),
+            )
+            for i in range(cantidad)
+        ]
+
+    def _lote(self):
+        return PagoLote.objects.create(
+            proveedor=self.proveedor,
+            fecha_pago=date(2026, 3, 1),
+            pagado_por="OFICINA",
+            comprobante="comprobantes/lote.pdf",
+        )
+
+    def _resultado(self, lote, facturas):
+        facturas = Factura.objects.filter(pk__in=[f.pk for f in facturas]).order_by("pk")
+        pagos = Pago.objects.filter(lote=lote).order_by("factura_id")
+        eventos = EventoAuditoria.objects.filter(lote=lote).order_by("id")
+        return {
+            "facturas": [(f.total_pagado, f.estado) for f in facturas],
+            "pagos": [(p.fecha_pago, p.valor_pagado, p.pagado_por, p.comprobante.name, p.notas) for p in pagos],
+            "eventos": [
+                (e.tipo, e.usuario_id, sorted(k for k in e.metadata if k not in {"lote_id", "notificacion_id"}))
+                for e in eventos
+            ],
+            "notificaciones": sorted(
+                NotificacionProveedor.objects.filter(lote=lote).values_list("usuario_id", "tipo", "mensaje")
+            ),
+        }
+
+    def test_coincide_con_crear_pago_por_factura(self):
+        facturas_a = self._facturas("A", 4)
+        facturas_b = self._facturas("B", 4)
+        reconstruir_saldos()
+        lote_a = self._lote()
+        lote_b = self._lote()
+        for factura in facturas_a:
+            crear_pago(
+                factura=factura,
+                fecha_pago=lote_a.fecha_pago,
+                valor_pagado=factura.valor_factura,
+                pagado_por="OFICINA",
+                lote=lote_a,
+                notas="Pago del lote.",
+                comprobante="comprobantes/lote.pdf",
+                usuario=self.staff,
+            )
+        pagos = crear_pagos_lote(
+            lote=lote_b,
+            facturas=facturas_b,
+            fecha_pago=lote_b.fecha_pago,
+            pagado_por="OFICINA",
+            notas="Pago del lote.",
+            comprobante="comprobantes/lote.pdf",
+            usuario=self.staff,
+        )
+
+        self.assertEqual(len(pagos), 4)
+        self.assertTrue(all(p.pk for p in pagos))
+        self.assertTrue(all(f.estado == "pagada" for f in facturas_b))
+        esperado = self._resultado(lote_a, facturas_a)
+        self.assertEqual(self._resultado(lote_b, facturas_b), esperado)
+        self.assertEqual(len(esperado["notificaciones"]), len(self.portal_users))
+        notificacion = NotificacionProveedor.objects.filter(lote=lote_b).first()
+        self.assertEqual(notificacion.pago, pagos[0])
+        evento = EventoAuditoria.objects.get(tipo=EventoAuditoria.TIPO_NOTIFICACION_GENERADA, lote=lote_b, usuario=notificacion.usuario)
+        self.assertEqual(evento.metadata["notificacion_id"], notificacion.pk)
+        self.assertEqual(diferencias_saldos(), [])
+
+    def test_numero_de_consultas_no_depende_del_tamano_del_lote(self):
+        conteos = []
+        for prefijo, cantidad in (("C", 2), ("D", 3), ("E", 30)):
+            facturas = self._facturas(prefijo, cantidad)
+            reconstruir_saldos()
+            lote = self._lote()
+            with CaptureQueriesContext(connection) as ctx:
+                crear_pagos_lote(lote=lote, facturas=facturas, pagado_por="OFICINA", usuario=self.staff)
+            conteos.append(len(ctx.captured_queries))
+        self.assertEqual(conteos[1], conteos[2])
+
+    def test_rechaza_facturas_de_otro_proveedor(self):
+        otro = Proveedor.objects.create(nombre="Proveedor Dos", nit="901")
+        factura = Factura.objects.create(
+            proveedor=otro,
+            punto_venta=self.pv,
+            numero_factura="X-1",
+            fecha_factura=date(2026, 2, 1),
+            valor_factura=Decimal("1000.00"),
+        )
+        with self.assertRaises(ValidationError):
+            crear_pagos_lote(lote=self._lote(), facturas=[self.factura, factura], pagado_por="OFICINA")
+        self.assertFalse(Pago.objects.exists())
+
+    def test_vista_de_lote_usa_camino_por_lotes(self):
+        facturas = self._facturas("F", 3)
+        self.client.force_login(self.staff)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root), mock.patch(
+            "cartera.views.enviar_correo_lote_si_aplica", return_value=(True, "", "enviado")
+        ):
+            response = self.client.post(
+                reverse("pago_lote_create"),
+                {
+                    "ids": ",".join(str(f.pk) for f in facturas),
+                    "fecha_pago": "2026-03-01",
+                    "pagado_por": "OFICINA",
+                    "comprobante": SimpleUploadedFile("lote.pdf", b"%PDF-1.4", content_type="application/pdf"),
+                },
+            )
+        self.assertEqual(response.status_code, 302)
+        lote = PagoLote.objects.get()
+        self.assertEqual(lote.pagos.count(), 3)
+        self.assertEqual(Pago.objects.filter(lote=lote).first().notas, f"Pago perteneciente al Lote #{lote.id}.")
+        self.assertEqual(
+            EventoAuditoria.objects.filter(tipo=EventoAuditoria.TIPO_PAGO_CREADO, lote=lote).count(),
+            3,
+        )
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class DespachoNotificacionesTests(CarteraBaseTestCase):
+    def _usuarios_portal(self, cantidad, *, inicio=0):
+        usuarios = [User.objects.create_user(f"portal-{inicio + i}", password="pass") for i in range(cantidad)]
+        for usuario in usuarios:
+            ProveedorUsuario.objects.create(user=usuario, proveedor=self.proveedor)
+        return usuarios
+
+    def _pago(self, factura, lote=None):
+        return Pago.objects.create(
+            factura=factura,
+            fecha_pago=date(2026, 3, 1),
+            valor_pagado=Decimal("1000.00"),
+            pagado_por="OFICINA",
+            lote=lote,
+        )
+
+    def test_consultas_no_dependen_del_numero_de_usuarios(self):
+        pago = self._pago(self.factura)
+        conteos = []
+        for inicio, cantidad in ((0, 1), (1, 5)):
+            self._usuarios_portal(cantidad, inicio=inicio)
+            with CaptureQueriesContext(connection) as ctx:
+                notificaciones = notificar_confirmacion(
+                    proveedor=self.proveedor,
+                    usuario_actor=self.staff,
+                    factura=self.factura,
+                    pago=pago,
+                )
+            conteos.append(len(ctx.captured_queries))
+        self.assertEqual(len(notificaciones), 6)
+        self.assertEqual(conteos[0], conteos[1])
+        with self.assertNumQueries(4):
+            notificar_confirmacion(proveedor=self.proveedor, usuario_actor=self.staff, factura=self.factura, pago=pago)
+
+    def test_eventos_referencian_cada_notificacion(self):
+        self._usuarios_portal(3)
+        pago = self._pago(self.factura)
+        notificaciones = notificar_novedad(
+            proveedor=self.proveedor,
+            usuario_actor=self.staff,
+            factura=self.factura,
+            pago=pago,
+            motivo="Valor distinto",
+        )
+        eventos = EventoAuditoria.objects.filter(tipo=EventoAuditoria.TIPO_NOTIFICACION_GENERADA, pago=pago)
+        self.assertEqual(
+            sorted((e.usuario_id, e.metadata["notificacion_id"]) for e in eventos),
+            sorted((n.usuario_id, n.pk) for n in notificaciones),
+        )
+        self.assertTrue(all(e.metadata["motivo"] == "Valor distinto" for e in eventos))
+        self.assertTrue(all(e.metadata["usuario_actor_id"] == self.staff.pk for e in eventos))
+
+    def test_notificacion_de_lote_es_unica_para_todo_el_lote(self):
+        usuarios = self._usuarios_portal(2)
+        lote = PagoLote.objects.create(proveedor=self.proveedor, fecha_pago=date(2026, 3, 1), pagado_por="OFICINA")
+        primero = self._pago(self.factura, lote)
+        segundo = self._pago(self.other_factura, lote)
+        self.assertEqual(len(notificar_pago_registrado(primero)), 2)
+        self._usuarios_portal(1, inicio=2)
+        nuevas = notificar_pago_registrado(segundo)
+
+        self.assertEqual([n.usuario_id for n in nuevas], [User.objects.get(username="portal-2").pk])
+        self.assertEqual(
+            NotificacionProveedor.objects.filter(lote=lote, tipo=NotificacionProveedor.TIPO_LOTE_REGISTRADO).count(),
+            3,
+        )
+        self.assertEqual(
+            EventoAuditoria.objects.filter(tipo=EventoAuditoria.TIPO_NOTIFICACION_GENERADA, lote=lote).count(),
+            3,
+        )
+        self.assertEqual(NotificacionProveedor.objects.get(lote=lote, usuario=usuarios[0]).pago, primero)
+
+    def test_motor_sin_returning_asigna_la_llave_de_cada_notificacion(self):
+        self._usuarios_portal(2)
+        pago = self._pago(self.factura)
+        anterior = notificar_confirmacion(proveedor=self.proveedor, usuario_actor=self.staff, factura=self.factura, pago=pago)
+        with mock.patch.object(
+            type(connection.features), "can_return_rows_from_bulk_insert", new_callable=mock.PropertyMock, return_value=False
+        ):
+            nuevas = notificar_confirmacion(proveedor=self.proveedor, usuario_actor=self.staff, factura=self.factura, pago=pago)
+        self.assertTrue(all(n.pk for n in nuevas))
+        self.assertFalse({n.pk for n in nuevas} & {n.pk for n in anterior})
+        for notif in nuevas:
+            self.assertEqual(NotificacionProveedor.objects.get(pk=notif.pk).usuario_id, notif.usuario_id)
+
+    def test_sin_usuarios_no_consulta_mas(self):
+        pago = self._pago(self.factura)
+        with self.assertNumQueries(1):
+            self.assertEqual(notificar_pago_registrado(pago), [])
+
 
 @override_settings(STORAGES=TEST_STORAGES)
 class PublicConfirmationTests(CarteraBaseTestCase):
@@ -401,9 +1286,896 @@ class PaidInvoiceListTests(CarteraBaseTestCase):
         self.assertContains(response, "05/02/2026")
 
 
+@override_settings(STORAGES=TEST_STORAGES)
+class FacturaListingAnnotationTests(CarteraBaseTestCase):
+    def _facturas(self, prefijo, cantidad):
+        facturas = []
+        for i in range(cantidad):
+            factura = Factura.objects.create(
+                proveedor=self.proveedor,
+                punto_venta=self.pv,
+                numero_factura=f"{prefijo}-{i}",
+                fecha_factura=date(2026, 2, 1) + timedelta(days=i),
+                valor_factura=Decimal("1000.00"),
+            )
+            if i % 3 == 0:
+                Pago.objects.create(factura=factura, fecha_pago=date(2026, 3, 1), valor_pagado=Decimal("100.00"), pagado_por="OFICINA")
+                Pago.objects.create(factura=factura, fecha_pago=date(2026, 3, 9), valor_pagado=Decimal("100.00"), pagado_por="OFICINA")
+            facturas.append(factura)
+        return facturas
+
+    def _consultas(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_consultas_constantes_por_tamano_de_pagina(self):
+        self.client.force_login(self.staff)
+        for nombre in ("facturas_pendientes", "facturas_todas", "pagos_list"):
+            with self.subTest(vista=nombre):
+                url = reverse(nombre)
+                estado = "pagada" if nombre == "pagos_list" else "pendiente"
+                self._facturas(f"{nombre}-A", 3)
+                Factura.objects.filter(numero_factura__startswith=nombre).update(estado=estado)
+                pequeno = self._consultas(url)
+                self._facturas(f"{nombre}-B", 30)
+                Factura.objects.filter(numero_factura__startswith=nombre).update(estado=estado)
+                grande = self._consultas(url)
+                self.assertEqual(pequeno, grande)
+                self.assertGreaterEqual(len(self.client.get(url).context["facturas"]), 30)
+
+    def test_anotaciones_reemplazan_el_acceso_a_pagos(self):
+        con_pagos, sin_pagos = self._facturas("X", 2)
+        Factura.objects.filter(pk=self.other_factura.pk).update(confirmado_pago=True)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("facturas_pendientes"))
+        facturas = {f.pk: f for f in response.context["facturas"]}
+        self.assertEqual(facturas[con_pagos.pk].pagos_count, 2)
+        self.assertEqual(facturas[con_pagos.pk].fecha_ultimo_pago, date(2026, 3, 9))
+        self.assertFalse(facturas[con_pagos.pk].es_editable)
+        self.assertEqual(facturas[sin_pagos.pk].pagos_count, 0)
+        self.assertIsNone(facturas[sin_pagos.pk].fecha_ultimo_pago)
+        self.assertTrue(facturas[sin_pagos.pk].es_editable)
+        self.assertFalse(facturas[self.other_factura.pk].es_editable)
+        self.assertContains(response, reverse("factura_update", args=[sin_pagos.pk]))
+        self.assertNotContains(response, reverse("factura_update", args=[con_pagos.pk]))
+        self.assertContains(response, f'class="cb-fact" value="{sin_pagos.pk}"')
+        self.assertNotContains(response, f'class="cb-fact" value="{con_pagos.pk}"')
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class FacturaExportTests(CarteraBaseTestCase):
+    def _contenido(self, response):
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content)
+
+    def test_csv_respeta_filtros_y_alcance(self):
+        Pago.objects.create(factura=self.factura, fecha_pago=date(2026, 2, 5), valor_pagado=Decimal("40000.00"), pagado_por="PDV")
+        Factura.objects.filter(pk=self.factura.pk).update(total_pagado=Decimal("40000.00"))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("facturas_export", args=["facturas_pendientes"]), {"q": "F-00"})
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn("facturas_pendientes_", response["Content-Disposition"])
+        filas = list(csv.reader(StringIO(self._contenido(response).decode("utf-8-sig"))))
+        self.assertEqual(filas[0][:3], ["Fecha factura", "Número", "Proveedor"])
+        self.assertEqual(len(filas), 2)
+        self.assertEqual(filas[1][1], "F-001")
+        self.assertEqual(filas[1][7], "60000.00")
+        self.assertEqual(filas[1][10], "2026-02-05")
+
+    def test_pagadas_solo_exporta_facturas_pagadas(self):
+        Factura.objects.filter(pk=self.other_factura.pk).update(estado="pagada")
+        self.client.force_login(self.staff)
+        contenido = self._contenido(self.client.get(reverse("facturas_export", args=["pagos_list"])))
+        self.assertIn(b"F-002", contenido)
+        self.assertNotIn(b"F-001", contenido)
+        response = self.client.get(reverse("facturas_export", args=["desconocido"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_xlsx_es_un_libro_valido(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("facturas_export", args=["facturas_todas"]), {"formato": "xlsx"})
+        self.assertEqual(response["Content-Type"], "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        with zipfile.ZipFile(BytesIO(self._contenido(response))) as libro:
+            self.assertIn("xl/styles.xml", libro.namelist())
+            hoja = ElementTree.fromstring(libro.read("xl/worksheets/sheet1.xml"))
+        ns = {"x": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+        filas = hoja.findall("x:sheetData/x:row", ns)
+        self.assertEqual(len(filas), 3)
+        numeros = {fila.findall("x:c", ns)[1].findtext("x:is/x:t", namespaces=ns) for fila in filas[1:]}
+        self.assertEqual(numeros, {"F-001", "F-002"})
+        primera_fecha = filas[1].findall("x:c", ns)[0]
+        self.assertEqual(primera_fecha.get("s"), "1")
+
+    def test_texto_que_parece_formula_se_exporta_como_texto(self):
+        Proveedor.objects.filter(pk=self.proveedor.pk).update(nombre="=1+1", nit="@SUMA(A1)")
+        Factura.objects.filter(pk=self.factura.pk).update(numero_factura="-2+3")
+        self.client.force_login(self.staff)
+        url = reverse("facturas_export", args=["facturas_todas"])
+        filas = list(csv.reader(StringIO(self._contenido(self.client.get(url)).decode("utf-8-sig"))))
+        fila = next(f for f in filas if f[1] == "'-2+3")
+        self.assertEqual(fila[2:4], ["'=1+1", "'@SUMA(A1)"])
+        self.assertFalse(any(f[7].startswith("'") for f in filas[1:]))
+
+        with zipfile.ZipFile(BytesIO(self._contenido(self.client.get(url, {"formato": "xlsx"})))) as libro:
+            hoja = ElementTree.fromstring(libro.read("xl/worksheets/sheet1.xml"))
+        ns = {"x": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+        textos = {celda.findtext("x:is/x:t", namespaces=ns) for celda in hoja.iter(f"{{{ns['x']}}}c")}
+        self.assertTrue({"'-2+3", "'=1+1", "'@SUMA(A1)"} <= textos)
+        self.assertFalse({"-2+3", "=1+1", "@SUMA(A1)"} & textos)
+
+    def test_xlsx_entrega_bytes_antes_de_leer_todas_las_filas(self):
+        leidas = []
+
+        def filas():
+            for i in range(5000):
+                leidas.append(i)
+                yield (date(2026, 1, 1), hashlib.sha256(str(i).encode()).hexdigest(), Decimal("1.50"), None)
+
+        partes = stream_xlsx(["Fecha", "Número", "Valor", "Vacio"], filas(), cada=100)
+        self.assertTrue(next(partes))
+        self.assertEqual(leidas, [])
+        next(partes)
+        self.assertLess(len(leidas), 5000)
+        contenido = b"".join(partes)
+        self.assertEqual(len(leidas), 5000)
+        self.assertTrue(contenido)
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class IndicesListadosTests(CarteraBaseTestCase):
+    def test_sembrar_cartera_deja_saldos_cuadrados(self):
+        conteos = sembrar_cartera(facturas=300, proveedores=5, pdvs=3, batch_size=100)
+        self.assertEqual(conteos["facturas"], 300)
+        self.assertEqual(Factura.objects.filter(numero_factura__startswith="SYN1-").count(), 300)
+        self.assertEqual(Pago.objects.filter(factura__numero_factura__startswith="SYN1-").count(), conteos["pagos"])
+        self.assertEqual(diferencias_saldos(), [])
+
+    def test_listado_de_pendientes_usa_indice_compuesto(self):
+        sembrar_cartera(facturas=500, proveedores=5, pdvs=3)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        plan = Factura.objects.filter(estado="pendiente", punto_venta=self.pv).order_by("-fecha_factura", "-id")[:51].explain()
+        self.assertIn("factura_pdv_pend_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_benchmark_revierte_datos_e_indices(self):
+        salida = StringIO()
+        call_command("benchmark_listados", "--facturas", "200", "--proveedores", "4", "--pdvs", "2", "--repeticiones", "1", stdout=salida)
+        self.assertIn("Pendientes (staff)", salida.getvalue())
+        self.assertIn("factura_estado_fecha_idx", salida.getvalue())
+        self.assertFalse(Factura.objects.filter(numero_factura__startswith="SYN1-").exists())
+        with connection.cursor() as cursor:
+            indices = connection.introspection.get_constraints(cursor, Factura._meta.db_table)
+        self.assertIn("factura_pdv_pend_idx", indices)
+        self.assertNotIn("benchmark_factura_pdv", indices)
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class SembradoYBenchmarkTests(CarteraBaseTestCase):
+    def test_seed_cartera_crea_datos_consistentes(self):
+        salida = StringIO()
+        call_command("seed_cartera", "--facturas", "400", "--proveedores", "6", "--pdvs", "3", "--bloque", "150", "--semilla", "7", stdout=salida)
+        self.assertIn("400 facturas", salida.getvalue())
+        facturas = Factura.objects.filter(numero_factura__startswith="SYN7-")
+        self.assertEqual(facturas.count(), 400)
+        self.assertEqual(diferencias_saldos(), [])
+        self.assertEqual(Pago.objects.filter(factura__in=facturas).count(), facturas.filter(estado="pagada").count())
+        self.assertFalse(Pago.objects.filter(lote__isnull=False).exclude(lote__proveedor=F("factura__proveedor")).exists())
+        self.assertTrue(facturas.filter(confirmado_pago=True).exists())
+        self.assertEqual(
+            EventoAuditoria.objects.filter(tipo=EventoAuditoria.TIPO_FACTURA_CREADA, metadata__origen="sintetico").count(), 400
+        )
+        no_leidas = NotificacionProveedor.objects.filter(proveedor__nit__startswith="SYN7-", leida=False).count()
+        self.assertEqual(ContadorNotificaciones.objects.aggregate(total=Sum("no_leidas"))["total"], no_leidas)
+        self.assertFalse(User.objects.get(username="syn7-staff").has_usable_password())
+
+        with self.assertRaises(CommandError):
+            call_command("seed_cartera", "--facturas", "1", "--semilla", "7", stdout=StringIO())
+
+    def test_todas_las_urls_tienen_ruta_de_benchmark(self):
+        self.assertEqual(rutas_sin_cubrir(), [])
+
+    def test_benchmark_vistas_reporta_json_por_vista(self):
+        sembrar_cartera(facturas=120, proveedores=3, pdvs=2, semilla=3)
+        Proveedor.objects.create(nombre="Proveedor sin facturas")
+        salida = StringIO()
+        call_command("benchmark_vistas", "--repeticiones", "2", stdout=salida)
+        reporte = json.loads(salida.getvalue())
+        self.assertEqual(reporte["sin_cubrir"], [])
+        self.assertEqual(reporte["sobre_presupuesto"], [])
+        self.assertEqual(set(reporte["vistas"]), {ruta.etiqueta for ruta in RUTAS})
+        for etiqueta, vista in reporte["vistas"].items():
+            with self.subTest(vista=etiqueta):
+                self.assertNotIn("omitida", vista)
+                self.assertLess(vista["status"], 500)
+                self.assertLessEqual(vista["p50_ms"], vista["p99_ms"])
+                self.assertGreater(vista["consultas"], 0)
+                self.assertIsNotNone(vista["presupuesto"])
+        self.assertEqual(reporte["vistas"]["facturas_pendientes[staff]"]["status"], 200)
+
+    def test_percentil_interpola(self):
+        self.assertEqual(percentil([10, 20, 30, 40], 50), 25)
+        self.assertEqual(percentil([5], 99), 5)
+        self.assertEqual(percentil([], 90), 0.0)
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class ApiListadosOptimizadosTests(CarteraBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient()
+        self.api.force_authenticate(self.staff)
+
+    def _consultas(self, nombre, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.api.get(reverse(nombre), params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.data["results"]
+
+    def test_listados_hacen_las_mismas_consultas_con_mil_filas(self):
+        sembrar_cartera(facturas=20, proveedores=2, pdvs=2, semilla=1)
+        facturas_chica, filas = self._consultas("factura-list", page_size=1000)
+        self.assertEqual(len(filas), Factura.objects.count())
+        pagos_chica, _ = self._consultas("pago-list", page_size=1000)
+
+        sembrar_cartera(facturas=1200, proveedores=5, pdvs=3, semilla=2)
+        facturas_grande, filas = self._consultas("factura-list", page_size=1000)
+        self.assertEqual(len(filas), 1000)
+        pagos_grande, filas_pagos = self._consultas("pago-list", page_size=1000)
+        self.assertEqual(len(filas_pagos), min(Pago.objects.count(), 1000))
+
+        self.assertEqual(facturas_grande, facturas_chica)
+        self.assertEqual(pagos_grande, pagos_chica)
+
+    def test_fecha_pago_anotada_coincide_con_la_del_ultimo_pago(self):
+        crear_pago(
+            factura=self.factura,
+            fecha_pago=date(2026, 1, 10),
+            valor_pagado=self.factura.valor_factura,
+            pagado_por="OFICINA",
+            usuario=self.staff,
+        )
+        _consultas, filas = self._consultas("factura-list")
+        por_id = {fila["id"]: fila for fila in filas}
+        self.assertEqual(por_id[self.factura.pk]["fecha_pago"], "2026-01-10")
+        self.assertIsNone(por_id[self.other_factura.pk]["fecha_pago"])
+        self.assertEqual(FacturaSerializer(Factura.objects.get(pk=self.factura.pk)).data["fecha_pago"], "2026-01-10")
+
+        detalle = self.api.get(reverse("factura-detail", args=[self.factura.pk]))
+        self.assertEqual(detalle.data["fecha_pago"], "2026-01-10")
+        self.assertEqual(detalle.data["proveedor_nombre"], "Proveedor Uno")
+        self.assertEqual(detalle.data["saldo"], Decimal("0.00"))
+
+    def test_pago_list_serializa_datos_de_factura_y_proveedor(self):
+        pago = crear_pago(
+            factura=self.factura,
+            fecha_pago=date(2026, 1, 10),
+            valor_pagado=self.factura.valor_factura,
+            pagado_por="OFICINA",
+            usuario=self.staff,
+        )
+        _consultas, filas = self._consultas("pago-list")
+        fila = next(fila for fila in filas if fila["id"] == pago.pk)
+        self.assertEqual(fila["factura_numero"], "F-001")
+        self.assertEqual(fila["proveedor_email"], "proveedor@example.com")
+        self.assertEqual(fila["punto_venta"], self.pv.pk)
+        self.assertEqual(fila["punto_venta_nombre"], "PDV Centro")
+
+    def test_page_size_tiene_tope(self):
+        sembrar_cartera(facturas=30, proveedores=1, pdvs=1, semilla=1)
+        _consultas, filas = self._consultas("factura-list", page_size=5)
+        self.assertEqual(len(filas), 5)
+        with mock.patch("cartera.pagination.ApiCursorPagination.max_page_size", 10):
+            _consultas, filas = self._consultas("factura-list", page_size=1000)
+        self.assertEqual(len(filas), 10)
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class ApiSincronizacionTests(CarteraBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient()
+        self.api.force_authenticate(self.staff)
+
+    def _recorrer(self, nombre, **params):
+        ids, paginas, url = [], 0, reverse(nombre)
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.api.get(url, params if paginas == 0 else None)
+            self.assertEqual(response.status_code, 200)
+            sql = " ".join(q["sql"].upper() for q in ctx.captured_queries)
+            self.assertNotIn("COUNT(", sql)
+            self.assertNotIn("OFFSET", sql)
+            ids += [fila["id"] for fila in response.data["results"]]
+            url, paginas = response.data["next"], paginas + 1
+        return ids, paginas
+
+    def test_cursor_recorre_todo_por_creacion_sin_count_ni_offset(self):
+        sembrar_cartera(facturas=250, proveedores=3, pdvs=2, semilla=1)
+        ids, paginas = self._recorrer("factura-list", page_size=100)
+        self.assertEqual(paginas, 3)
+        self.assertEqual(ids, list(Factura.objects.order_by("creado_en", "id").values_list("id", flat=True)))
+
+        ids_pagos, _ = self._recorrer("pago-list", page_size=40)
+        self.assertEqual(ids_pagos, list(Pago.objects.order_by("creado_en", "id").values_list("id", flat=True)))
+
+    def test_cursor_respeta_ordering_y_vuelve_atras(self):
+        sembrar_cartera(facturas=30, proveedores=1, pdvs=1, semilla=1)
+        ids, _ = self._recorrer("factura-list", page_size=7, ordering="-valor_factura")
+        self.assertEqual(ids, list(Factura.objects.order_by("-valor_factura", "-id").values_list("id", flat=True)))
+
+        primera = self.api.get(reverse("factura-list"), {"page_size": 7})
+        segunda = self.api.get(primera.data["next"])
+        self.assertIsNone(primera.data["previous"])
+        anterior = self.api.get(segunda.data["previous"])
+        self.assertEqual([f["id"] for f in anterior.data["results"]], [f["id"] for f in primera.data["results"]])
+
+    def test_modified_since_trae_solo_lo_modificado(self):
+        sembrar_cartera(facturas=40, proveedores=2, pdvs=2, semilla=1)
+        corte = timezone.now()
+        factura = Factura.objects.filter(estado="pendiente", pagos__isnull=True).order_by("id").first()
+        respuesta = self.api.patch(reverse("factura-detail", args=[factura.pk]), {"valor_factura": "1234.00"}, format="json")
+        self.assertEqual(respuesta.status_code, 200)
+        lote = PagoLote.objects.filter(pagos__factura__confirmado_pago=False).distinct().first()
+        confirmar_lote(lote)
+        pago = Pago.objects.filter(lote__isnull=True).order_by("id").first()
+        pago.notas = "Ajuste"
+        pago.save()
+
+        ids, _ = self._recorrer("factura-list", modified_since=corte.isoformat())
+        esperadas = {factura.pk, *lote.pagos.values_list("factura_id", flat=True)}
+        self.assertEqual(set(ids), esperadas)
+        self.assertEqual(
+            ids, list(Factura.objects.filter(pk__in=esperadas).order_by("actualizado_en", "id").values_list("id", flat=True))
+        )
+        ids_pagos, _ = self._recorrer("pago-list", modified_since=corte.isoformat())
+        self.assertEqual(ids_pagos, [pago.pk])
+
+        hoy = self.api.get(reverse("factura-list"), {"modified_since": timezone.localdate().isoformat()})
+        self.assertEqual(hoy.status_code, 200)
+        invalida = self.api.get(reverse("factura-list"), {"modified_since": "ayer"})
+        self.assertEqual(invalida.status_code, 400)
+        self.assertIn("modified_since", invalida.data)
+
+    def test_cursor_invalido_responde_404_sin_volver_a_la_primera_pagina(self):
+        for cursor in ["basura", encode_cursor("next", ["no-es-fecha", 1])]:
+            with self.subTest(cursor=cursor):
+                response = self.api.get(reverse("factura-list"), {"cursor": cursor})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.data["detail"], "Cursor inválido.")
+
+    def test_fields_reduce_respuesta_y_columnas(self):
+        crear_pago(factura=self.factura, fecha_pago=date(2026, 1, 10), valor_pagado=self.factura.valor_factura, usuario=self.staff)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.api.get(reverse("factura-list"), {"fields": "id,numero_factura"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data["results"][0]), {"id", "numero_factura"})
+        consulta = next(q["sql"] for q in ctx.captured_queries if '"cartera_factura"."numero_factura"' in q["sql"])
+        self.assertNotIn('"cartera_factura"."total_pagado"', consulta)
+        self.assertNotIn('"cartera_factura"."confirmado_por_email"', consulta)
+        self.assertNotIn("cartera_pago", consulta)
+        self.assertNotIn("cartera_proveedor", consulta)
+
+        response = self.api.get(reverse("factura-list"), {"fields": "numero_factura,fecha_pago"})
+        fila = next(f for f in response.data["results"] if f["numero_factura"] == "F-001")
+        self.assertEqual(fila, {"numero_factura": "F-001", "fecha_pago": "2026-01-10"})
+
+        response = self.api.get(reverse("pago-list"), {"fields": "id,factura_numero,actualizado_en"})
+        self.assertEqual(set(response.data["results"][0]), {"id", "factura_numero", "actualizado_en"})
+
+        desconocido = self.api.get(reverse("factura-list"), {"fields": "id,clave"})
+        self.assertEqual(desconocido.status_code, 400)
+        self.assertIn("fields", desconocido.data)
+
+    def test_columnas_api_cubren_los_campos_del_serializer(self):
+        self.assertEqual(set(FACTURA_API_COLUMNAS), set(FacturaSerializer().fields))
+        self.assertEqual(set(PAGO_API_COLUMNAS), set(PagoSerializer().fields))
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class ApiCargaMasivaTests(CarteraBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        reconstruir_saldos()
+        self.api = APIClient()
+        self.api.force_authenticate(self.staff)
+        self.portal_user = User.objects.create_user("portal-masivo", password="pass")
+        ProveedorUsuario.objects.create(user=self.portal_user, proveedor=self.proveedor)
+
+    def _factura(self, numero, **extra):
+        return {
+            "proveedor": self.proveedor.pk,
+            "punto_venta": self.pv.pk,
+            "numero_factura": numero,
+            "fecha_factura": "2026-02-01",
+            "valor_factura": "5000.00",
+            **extra,
+        }
+
+    def test_crea_facturas_con_resultado_por_item(self):
+        response = self.api.post(
+            reverse("factura-bulk"),
+            [
+                self._factura("m-1"),
+                self._factura("M-2", estado="pagada"),
+                self._factura("f-001"),
+                self._factura("M-1"),
+                self._factura("M-3", proveedor=999999),
+                "no es un objeto",
+            ],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        resultados = response.data["results"]
+        self.assertEqual([r["status"] for r in resultados], ["created", "created", "error", "error", "error", "error"])
+        self.assertEqual(resultados[0]["data"]["numero_factura"], "M-1")
+        self.assertEqual(resultados[2]["errors"]["numero_factura"], [FACTURA_DUPLICADA_ERROR])
+        self.assertEqual(resultados[3]["errors"]["numero_factura"], ["Factura repetida en la solicitud."])
+        self.assertIn("proveedor", resultados[4]["errors"])
+
+        pagada = Factura.objects.get(pk=resultados[1]["id"])
+        self.assertEqual(pagada.estado, "pagada")
+        self.assertEqual(pagada.creado_por, self.staff)
+        self.assertEqual(pagada.pagos.get().notas, "Pago auto-generado al crear la factura como PAGADA via API.")
+        self.assertEqual(resultados[1]["data"]["fecha_pago"], timezone.localdate().isoformat())
+        self.assertEqual(
+            EventoAuditoria.objects.filter(tipo=EventoAuditoria.TIPO_FACTURA_CREADA, factura__numero_factura__startswith="M-").count(), 2
+        )
+        self.assertEqual(NotificacionProveedor.objects.filter(usuario=self.portal_user, factura=pagada).count(), 1)
+        self.assertEqual(diferencias_saldos(), [])
+
+    def test_pdv_crea_solo_en_su_punto_de_venta(self):
+        self.api.force_authenticate(self.user)
+        propia = self._factura("PDV-1")
+        del propia["punto_venta"]
+        response = self.api.post(
+            reverse("factura-bulk"),
+            [propia, self._factura("PDV-2", punto_venta=self.other_pv.pk)],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        propia, ajena = response.data["results"]
+        self.assertEqual(Factura.objects.get(pk=propia["id"]).punto_venta, self.pv)
+        self.assertIn("punto_venta", ajena["errors"])
+
+    def test_sin_items_validos_o_sin_lista_responde_400(self):
+        self.assertEqual(self.api.post(reverse("factura-bulk"), {"numero_factura": "X"}, format="json").status_code, 400)
+        response = self.api.post(reverse("factura-bulk"), [self._factura("F-001")], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["results"][0]["status"], "error")
+        self.assertFalse(Factura.objects.filter(numero_factura="F-001").exclude(pk=self.factura.pk).exists())
+
+    def test_actualiza_facturas_y_respeta_las_protegidas(self):
+        crear_pago(factura=self.other_factura, pagado_por="OFICINA")
+        response = self.api.patch(
+            reverse("factura-bulk"),
+            [
+                {"id": self.factura.pk, "valor_factura": "150000.00", "estado": "pagada"},
+                {"id": self.other_factura.pk, "valor_factura": "1.00"},
+                {"id": 999999, "valor_factura": "1.00"},
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["status"] for r in response.data["results"]], ["updated", "error", "error"])
+        self.factura.refresh_from_db()
+        self.assertEqual((self.factura.valor_factura, self.factura.estado), (Decimal("150000.00"), "pagada"))
+        self.assertEqual(
+            self.factura.pagos.get().notas, "Pago auto-generado al marcar la factura como PAGADA via API."
+        )
+        self.assertEqual(diferencias_saldos(), [])
+
+    def test_crea_y_actualiza_pagos_por_lote(self):
+        tercera = Factura.objects.create(
+            proveedor=self.proveedor, punto_venta=self.pv, numero_factura="F-003",
+            fecha_factura=date(2026, 1, 3), valor_factura=Decimal("300000.00"),
+        )
+        reconstruir_saldos()
+        datos = {"fecha_pago": "2026-02-01", "pagado_por": "OFICINA"}
+        response = self.api.post(
+            reverse("pago-bulk"),
+            [
+                {"factura": self.factura.pk, **datos},
+                {"factura": tercera.pk, **datos, "pagado_por": "PDV - pdv centro"},
+                {"factura": self.factura.pk, **datos},
+                {"factura": self.other_factura.pk, **datos, "pagado_por": "PDV - Inexistente"},
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        resultados = response.data["results"]
+        self.assertEqual([r["status"] for r in resultados], ["created", "created", "error", "error"])
+        self.assertEqual(resultados[2]["errors"]["non_field_errors"], ["Esta factura ya tiene un pago registrado."])
+        self.assertIn("pagado_por", resultados[3]["errors"])
+        self.assertEqual(resultados[1]["data"]["proveedor_email"], "proveedor@example.com")
+        self.assertEqual(
+            list(Factura.objects.filter(pk__in=[self.factura.pk, tercera.pk]).values_list("estado", flat=True)), ["pagada"] * 2
+        )
+        self.assertEqual(
+            EventoAuditoria.objects.filter(tipo=EventoAuditoria.TIPO_PAGO_CREADO).count(), 2
+        )
+        self.assertEqual(NotificacionProveedor.objects.filter(usuario=self.portal_user).count(), 2)
+        self.assertEqual(ContadorNotificaciones.objects.get(usuario=self.portal_user).no_leidas, 2)
+        self.assertEqual(diferencias_saldos(), [])
+
+        ids = [r["id"] for r in resultados[:2]]
+        response = self.api.patch(reverse("pago-bulk"), [{"id": pk, "notas": "Conciliado"} for pk in ids], format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Pago.objects.filter(pk__in=ids).values_list("notas", flat=True)), ["Conciliado"] * 2)
+
+    def test_crear_pagos_sin_returning_asigna_la_llave_de_cada_pago(self):
+        anterior = Pago.objects.create(factura=self.factura, fecha_pago=date(2026, 1, 5), valor_pagado=Decimal("1.00"))
+        with mock.patch.object(
+            type(connection.features), "can_return_rows_from_bulk_insert", new_callable=mock.PropertyMock, return_value=False
+        ):
+            pagos = crear_pagos(
+                [Pago(factura=self.factura, valor_pagado=Decimal("2.00")), Pago(factura=self.other_factura)]
+            )
+        self.assertNotEqual(pagos[0].pk, anterior.pk)
+        self.assertEqual(
+            [Pago.objects.get(pk=pago.pk).valor_pagado for pago in pagos],
+            [Decimal("2.00"), self.other_factura.valor_factura],
+        )
+
+    def test_consultas_no_crecen_con_el_tamano_del_lote(self):
+        def consultas(nombre, items):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.api.post(reverse(nombre), items, format="json")
+            self.assertEqual(response.status_code, 201)
+            self.assertTrue(all(r["status"] == "created" for r in response.data["results"]))
+            return len(ctx.captured_queries)
+
+        pocas = consultas("factura-bulk", [self._factura(f"Q-{i}") for i in range(2)])
+        muchas = consultas("factura-bulk", [self._factura(f"R-{i}") for i in range(40)])
+        self.assertEqual(pocas, muchas)
+
+        pendientes = list(Factura.objects.filter(numero_factura__regex=r"^[QR]-").order_by("pk").values_list("pk", flat=True))
+        pago = {"fecha_pago": "2026-02-01", "pagado_por": "OFICINA"}
+        # El primer lote crea la fila "pagada" del resumen y el contador del portal.
+        consultas("pago-bulk", [{"factura": pendientes[0], **pago}])
+        pocas = consultas("pago-bulk", [{"factura": pk, **pago} for pk in pendientes[1:3]])
+        muchas = consultas("pago-bulk", [{"factura": pk, **pago} for pk in pendientes[3:]])
+        self.assertEqual(pocas, muchas)
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class BusquedaFacturasTests(CarteraBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.proveedor_b = Proveedor.objects.create(nombre="Distribuidora Ñandú Médica", nit="901777", email="b@example.com")
+        self.factura_b = Factura.objects.create(
+            proveedor=self.proveedor_b,
+            punto_venta=self.pv,
+            numero_factura="ND-010",
+            fecha_factura=date(2026, 1, 3),
+            valor_factura=Decimal("5000.00"),
+        )
+
+    def _ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [f.pk for f in response.context["facturas"]]
+
+    def test_texto_normalizado_al_crear_y_renombrar(self):
+        self.assertEqual(normalizar_busqueda("  Ñandú   MÉDICA "), "nandu medica")
+        self.assertEqual(self.factura_b.texto_busqueda, "nd-010 distribuidora nandu medica 901777 pdv centro")
+        self.proveedor_b.nombre = "Drogueria Sur"
+        self.proveedor_b.save()
+        self.pv.nombre = "PDV Poblado"
+        self.pv.save()
+        self.factura_b.refresh_from_db()
+        self.assertEqual(self.factura_b.texto_busqueda, "nd-010 drogueria sur 901777 pdv poblado")
+        self.factura.refresh_from_db()
+        self.assertIn("pdv poblado", self.factura.texto_busqueda)
+        call_command("reindexar_busqueda", "--check", stdout=StringIO())
+
+    def test_listado_staff_ignora_tildes_y_mayusculas(self):
+        self.assertEqual(motor_busqueda(), "fts5" if connection.vendor == "sqlite" else "trigram")
+        self.client.force_login(self.staff)
+        url = reverse("facturas_todas")
+        self.assertEqual(self._ids(self.client.get(url, {"q": "ñandu medica"})), [self.factura_b.pk])
+        self.assertEqual(self._ids(self.client.get(url, {"q": "NANDÚ"})), [self.factura_b.pk])
+        self.assertEqual(self._ids(self.client.get(url, {"q": "901777"})), [self.factura_b.pk])
+        # Terminos cortos para los trigramas van por LIKE sobre la misma columna.
+        self.assertEqual(self._ids(self.client.get(url, {"q": "nd"})), [self.factura_b.pk])
+        self.assertEqual(set(self._ids(self.client.get(url, {"q": "pdv norte"}))), {self.other_factura.pk})
+
+    def test_resultados_ordenados_por_relevancia_y_paginados(self):
+        Factura.objects.bulk_create(
+            Factura(
+                proveedor=self.proveedor,
+                punto_venta=self.pv,
+                numero_factura=f"REL-{index:03d}",
+                fecha_factura=date(2026, 2, 1),
+                valor_factura=Decimal("1000.00"),
+            )
+            for index in range(60)
+        )
+        self.assertTrue(all(f.texto_busqueda.startswith("rel-") for f in Factura.objects.filter(numero_factura__startswith="REL-")))
+        self.client.force_login(self.staff)
+        url = reverse("facturas_todas")
+        response = self.client.get(url, {"q": "rel-0"})
+        vistos = self._ids(response)
+        page = response.context["page_obj"]
+        while page.has_next():
+            response = self.client.get(url, {"q": "rel-0", "cursor": page.next_cursor})
+            vistos += self._ids(response)
+            page = response.context["page_obj"]
+        esperados = set(Factura.objects.filter(numero_factura__startswith="REL-0").values_list("pk", flat=True))
+        self.assertEqual(len(vistos), len(esperados))
+        self.assertEqual(set(vistos), esperados)
+
+    def test_portal_busca_solo_en_su_proveedor(self):
+        portal_user = User.objects.create_user("portal-busqueda", password="pass")
+        ProveedorUsuario.objects.create(user=portal_user, proveedor=self.proveedor_b)
+        self.client.force_login(portal_user)
+        url = reverse("portal_proveedor_facturas")
+        self.assertEqual(self._ids(self.client.get(url, {"q": "nd-010"})), [self.factura_b.pk])
+        self.assertEqual(self._ids(self.client.get(url, {"q": "F-001"})), [])
+
+    def test_api_search_usa_el_indice(self):
+        api = APIClient()
+        api.force_authenticate(self.staff)
+        response = api.get(reverse("factura-list"), {"search": "medica"})
+        self.assertEqual([fila["id"] for fila in response.data["results"]], [self.factura_b.pk])
+        response = api.get(reverse("factura-list"), {"search": "proveedor uno", "ordering": "-valor_factura"})
+        self.assertEqual([fila["id"] for fila in response.data["results"]], [self.other_factura.pk, self.factura.pk])
+
+    def test_importacion_llena_el_texto_de_busqueda(self):
+        importar_facturas(StringIO("proveedor,punto_venta,numero_factura,fecha_factura,valor_factura\n901777,PDV Norte,imp-1,2026-03-01,1000\n"))
+        factura = Factura.objects.get(numero_factura="IMP-1")
+        self.assertEqual(factura.texto_busqueda, "imp-1 distribuidora nandu medica 901777 pdv norte")
+        self.client.force_login(self.staff)
+        self.assertEqual(self._ids(self.client.get(reverse("facturas_todas"), {"q": "imp-1"})), [factura.pk])
+
+    def test_reindexar_corrige_texto_desactualizado(self):
+        Factura.objects.filter(pk=self.factura_b.pk).update(texto_busqueda="")
+        with self.assertRaises(CommandError):
+            call_command("reindexar_busqueda", "--check", stdout=StringIO())
+        salida = StringIO()
+        call_command("reindexar_busqueda", stdout=salida)
+        self.assertIn("1 factura(s) corregida(s)", salida.getvalue())
+        self.client.force_login(self.staff)
+        self.assertEqual(self._ids(self.client.get(reverse("facturas_todas"), {"q": "medica"})), [self.factura_b.pk])
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class PresupuestoConsultasTests(CarteraBaseTestCase):
+    """
+    Recorre RUTAS con 10 y con 500 facturas: las consultas no crecen con las filas ni pasan su presupuesto.
+    La semilla deja en la cartera chica un lote, un pago sin comprobante y una notificacion sin leer,
+    asi ambas corridas pasan por los mismos caminos de cada vista.
+    """
+
+    def _medir(self, facturas):
+        with transaction.atomic():
+            sembrar_cartera(facturas=facturas, proveedores=2, pdvs=2, semilla=6)
+            Proveedor.objects.create(nombre="Proveedor sin facturas")
+            resultados = medir_vistas(RUTAS, repeticiones=1)
+            transaction.set_rollback(True)
+        return resultados
+
+    def test_todas_las_rutas_tienen_presupuesto(self):
+        self.assertEqual([ruta.etiqueta for ruta in RUTAS if ruta.consultas is None], [])
+        etiquetas = [ruta.etiqueta for ruta in RUTAS]
+        self.assertEqual(len(etiquetas), len(set(etiquetas)))
+
+    def test_consultas_por_vista_no_crecen_con_las_filas(self):
+        chica, grande = self._medir(10), self._medir(500)
+        for ruta in RUTAS:
+            with self.subTest(ruta=ruta.etiqueta):
+                antes, despues = chica[ruta.etiqueta], grande[ruta.etiqueta]
+                self.assertNotIn("omitida", antes)
+                self.assertNotIn("omitida", despues)
+                self.assertLess(despues["status"], 400)
+                self.assertEqual(antes["status"], despues["status"])
+                self.assertLessEqual(despues["consultas"], ruta.consultas)
+                if not ruta.crece:
+                    self.assertLessEqual(despues["consultas"], antes["consultas"])
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class ImportacionFacturasTests(CarteraBaseTestCase):
+    ENCABEZADO = "proveedor,punto_venta,numero_factura,fecha_factura,valor_factura\n"
+
+    def _csv(self, *filas):
+        return StringIO(self.ENCABEZADO + "".join(f"{fila}\n" for fila in filas))
+
+    def test_importa_y_reporta_errores_por_linea(self):
+        reconstruir_saldos()
+        resultado = importar_facturas(
+            self._csv(
+                "900,PDV Centro,a-100,2026-03-01,150.000",
+                "Proveedor Uno,PDV Norte, b-200 ,05/03/2026,\"1.234,50\"",
+                "900,PDV Centro,f-001,2026-03-01,1000",
+                "900,PDV Centro,A-100,2026-03-02,1000",
+                "999,PDV Centro,C-1,2026-03-01,1000",
+                "900,PDV Centro,C-2,2026-13-01,1000",
+                "900,PDV Centro,C-3,2026-03-01,abc",
+                "900,PDV Centro,C-4,2026-03-01,2.000.000",
+                "900,PDV Inexistente,C-5,2026-03-01,1000",
+            ),
+            usuario=self.staff,
+        )
+        self.assertEqual(resultado.creadas, 2)
+        self.assertEqual(
+            [(e.linea, e.mensaje) for e in resultado.errores],
+            [
+                (4, "Ya existe una factura con ese proveedor y ese número."),
+                (5, "Factura repetida en el archivo."),
+                (6, "Proveedor no encontrado: 999."),
+                (7, "Fecha inválida: 2026-13-01."),
+                (8, "Valor de factura inválido."),
+                (9, "Valor alto sin confirmar: $2.000.000"),
+                (10, "Punto de venta no encontrado: PDV Inexistente."),
+            ],
+        )
+        nueva = Factura.objects.get(numero_factura="B-200")
+        self.assertEqual(nueva.valor_factura, Decimal("1234.50"))
+        self.assertEqual(nueva.fecha_factura, date(2026, 3, 5))
+        self.assertEqual(nueva.punto_venta, self.other_pv)
+        self.assertEqual(nueva.estado, "pendiente")
+        self.assertEqual(nueva.creado_por, self.staff)
+        self.assertEqual(diferencias_saldos(), [])
+        evento = EventoAuditoria.objects.get(tipo=EventoAuditoria.TIPO_FACTURA_CREADA, factura=nueva)
+        self.assertEqual(evento.usuario, self.staff)
+        self.assertEqual(evento.metadata["origen"], "importacion")
+        self.assertEqual(evento.metadata["valor_factura"], "1234.50")
+        self.assertEqual(nueva.texto_busqueda, nueva.calcular_texto_busqueda())
+
+    def test_usuario_pdv_importa_en_su_punto_de_venta(self):
+        resultado = importar_facturas(
+            StringIO("proveedor,numero_factura,fecha_factura,valor_factura\n900,P-1,2026-03-01,1000\n"),
+            usuario=self.user,
+        )
+        self.assertEqual(resultado.creadas, 1)
+        self.assertEqual(Factura.objects.get(numero_factura="P-1").punto_venta, self.pv)
+
+    def test_columnas_faltantes(self):
+        with self.assertRaises(ValidationError):
+            importar_facturas(StringIO("proveedor,valor\n900,1000\n"))
+
+    def test_consultas_por_bloque_no_dependen_de_las_filas(self):
+        # La primera carga crea la fila del resumen de saldos; se descuenta del conteo.
+        importar_facturas(self._csv("900,PDV Centro,W-0,2026-03-01,1000"))
+        conteos = []
+        # 60 filas caben en un solo INSERT aun con el limite de 999 parametros de SQLite.
+        for prefijo, cantidad in (("Q", 10), ("R", 60)):
+            filas = [f"900,PDV Centro,{prefijo}-{i},2026-03-01,1000" for i in range(cantidad)]
+            with CaptureQueriesContext(connection) as ctx:
+                resultado = importar_facturas(self._csv(*filas), chunk_size=200)
+            self.assertEqual(resultado.creadas, cantidad)
+            conteos.append(len(ctx.captured_queries))
+        self.assertEqual(conteos[0], conteos[1])
+
+    def test_comando_escribe_reporte_de_errores(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        archivo = f"{directorio}/facturas.csv"
+        with open(archivo, "w", encoding="utf-8") as fh:
+            fh.write(self.ENCABEZADO + "900,PDV Centro,M-1,2026-03-01,1000\n900,PDV Centro,M-1,2026-03-01,1000\n")
+        salida = StringIO()
+        call_command("importar_facturas", archivo, "--usuario", "staff", "--bloque", "1", stdout=salida)
+        self.assertIn("1 factura(s) creada(s), 1 error(es)", salida.getvalue())
+        with open(f"{archivo}.errores.csv", encoding="utf-8") as fh:
+            self.assertEqual(
+                list(csv.reader(fh)),
+                [["linea", "numero_factura", "error"], ["3", "M-1", "Ya existe una factura con ese proveedor y ese número."]],
+            )
+        with self.assertRaises(CommandError):
+            call_command("importar_facturas", archivo, "--usuario", "nadie", stdout=StringIO())
+
+    def test_vista_de_carga(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse("factura_import")).status_code, 200)
+        archivo = SimpleUploadedFile(
+            "facturas.csv",
+            (self.ENCABEZADO + "900,PDV Centro,V-1,2026-03-01,1000\n900,PDV Centro,V-1,2026-03-01,1000\n").encode("utf-8"),
+            content_type="text/csv",
+        )
+        response = self.client.post(reverse("factura_import"), {"archivo": archivo})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["resultado"].creadas, 1)
+        self.assertContains(response, "Factura repetida en el archivo.")
+        self.assertTrue(Factura.objects.filter(numero_factura="V-1").exists())
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class KeysetPaginationTests(CarteraBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for index in range(1, 8):
+            Factura.objects.create(
+                proveedor=self.proveedor,
+                punto_venta=self.pv,
+                numero_factura=f"KP-{index:03d}",
+                fecha_factura=date(2026, 3, 1 + index // 2),
+                valor_factura=Decimal("1000.00"),
+            )
+        self.qs = Factura.objects.all()
+        self.expected = list(Factura.objects.order_by("-fecha_factura", "-id").values_list("id", flat=True))
+
+    def test_walks_forward_and_backward_without_gaps(self):
+        paginator = KeysetPaginator(self.qs, 3)
+        seen = []
+        page = paginator.page()
+        pages = [page]
+        self.assertFalse(page.has_previous())
+        while True:
+            seen.extend(f.id for f in page)
+            if not page.has_next():
+                break
+            page = paginator.page(page.next_cursor)
+            pages.append(page)
+        self.assertEqual(seen, self.expected)
+
+        back = paginator.page(pages[-1].previous_cursor)
+        self.assertEqual([f.id for f in back], [f.id for f in pages[-2]])
+        self.assertTrue(back.has_next())
+
+    def test_last_cursor_returns_final_rows(self):
+        paginator = KeysetPaginator(self.qs, 4)
+        page = paginator.page(paginator.page().last_cursor)
+        self.assertEqual([f.id for f in page], self.expected[-4:])
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        paginator = KeysetPaginator(self.qs, 3)
+        for token in ["basura", encode_cursor("next", ["no-es-fecha", 1]), "%%%"]:
+            with self.subTest(token=token):
+                page = paginator.page(token)
+                self.assertEqual([f.id for f in page], self.expected[:3])
+        self.assertIsNone(decode_cursor("basura"))
+        for token in ["basura", encode_cursor("next", ["no-es-fecha", 1]), encode_cursor("next", [1])]:
+            with self.subTest(estricto=token), self.assertRaises(CursorInvalido):
+                paginator.page(token, estricto=True)
+
+    def test_campo_de_orden_inexistente_no_se_oculta(self):
+        paginator = KeysetPaginator(self.qs, 3, ("-no_existe", "-id"))
+        with self.assertRaises(FieldDoesNotExist):
+            paginator.page(encode_cursor("next", ["x", 1]))
+
+    def test_page_query_count_does_not_depend_on_depth(self):
+        paginator = KeysetPaginator(self.qs, 2)
+        page = paginator.page()
+        with self.assertNumQueries(1):
+            list(paginator.page(page.next_cursor))
+        deep = paginator.page(paginator.page().last_cursor)
+        with self.assertNumQueries(1):
+            list(paginator.page(deep.previous_cursor))
+
+    def test_listing_view_follows_cursor_and_keeps_filters(self):
+        Factura.objects.bulk_create(
+            Factura(
+                proveedor=self.proveedor,
+                punto_venta=self.pv,
+                numero_factura=f"KPV-{index:03d}",
+                fecha_factura=date(2026, 2, 1),
+                valor_factura=Decimal("1000.00"),
+            )
+            for index in range(50)
+        )
+        self.expected = list(Factura.objects.order_by("-fecha_factura", "-id").values_list("id", flat=True))
+        self.client.force_login(self.staff)
+        url = reverse("facturas_todas")
+        response = self.client.get(url, {"prov": self.proveedor.id})
+        self.assertEqual(response.status_code, 200)
+        page = response.context["page_obj"]
+        self.assertEqual(page.approximate_count, len(self.expected))
+        self.assertTrue(page.count_is_exact)
+        self.assertContains(response, f"prov={self.proveedor.id}&amp;cursor=")
+
+        response = self.client.get(url, {"cursor": page.next_cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.expected[0], [f.id for f in response.context["facturas"]])
+
+
 @override_settings(STORAGES=TEST_STORAGES)
 class EmailTests(CarteraBaseTestCase):
-    def test_enviar_recibo_pago_uses_attachment_and_logs_success(self):
+    def test_recibo_pago_uses_attachment_and_logs_success(self):
         pago = Pago.objects.create(
             factura=self.factura,
             fecha_pago=date(2026, 2, 5),
@@ -411,12 +2183,12 @@ class EmailTests(CarteraBaseTestCase):
             pagado_por=f"PDV - {self.pv.nombre}",
             comprobante="comprobantes/test.pdf",
         )
-        with mock.patch("cartera.utils._attach_fieldfile") as attach, mock.patch(
+        encolar_correo_pago(pago)
+        with mock.patch("cartera.services.email_outbox._attach_fieldfile") as attach, mock.patch(
             "cartera.utils.EmailMultiAlternatives.send", return_value=1
         ):
-            ok, info = enviar_recibo_pago(None, pago)
-        self.assertTrue(ok)
-        self.assertEqual(info, "Enviado")
+            resultado = procesar_correos_pendientes()
+        self.assertEqual(resultado["enviados"], 1)
         attach.assert_called_once()
         self.assertTrue(CorreoEnvioLog.objects.filter(pago=pago, exito=True).exists())
         self.assertTrue(
@@ -429,6 +2201,208 @@ class EmailTests(CarteraBaseTestCase):
         )
 
 
+MEMORIA_STORAGES = {**TEST_STORAGES, "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"}}
+
+
+@override_settings(STORAGES=MEMORIA_STORAGES)
+class AdjuntoComprobanteTests(CarteraBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        ajuste = override_settings(COMPROBANTE_CACHE_DIR=self.cache_dir, COMPROBANTE_CACHE_MAX_BYTES=25)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+    def _pago(self, contenido):
+        return crear_pago(factura=self.factura, comprobante=SimpleUploadedFile("recibo.pdf", contenido))
+
+    def _adjuntar(self, pago):
+        email = EmailMessage("Recibo", "Cuerpo", to=["proveedor@example.com"])
+        _attach_fieldfile(email, pago.comprobante)
+        return email.message()
+
+    def _en_cache(self):
+        return sorted(os.listdir(self.cache_dir))
+
+    def test_reenvio_no_vuelve_a_descargar(self):
+        pago = self._pago(b"%PDF-1.4 " + b"x" * 6)
+        with mock.patch.object(InMemoryStorage, "open", autospec=True, side_effect=InMemoryStorage.open) as abrir:
+            primero = self._adjuntar(pago)
+            segundo = self._adjuntar(pago)
+        self.assertEqual(abrir.call_count, 1)
+        for mensaje in (primero, segundo):
+            adjunto = mensaje.get_payload()[1]
+            self.assertEqual(adjunto.get_content_type(), "application/pdf")
+            self.assertEqual(adjunto.get_filename(), os.path.basename(pago.comprobante.name))
+            self.assertEqual(adjunto.get_payload(decode=True), b"%PDF-1.4 " + b"x" * 6)
+        self.assertEqual(len(self._en_cache()), 1)
+
+    def test_cache_saca_primero_lo_menos_usado(self):
+        viejo, medio, nuevo = (self._pago(b"%PDF-1.4 " + bytes([letra]) * 3) for letra in b"abc")
+        en_cache = {
+            pago.pk: hashlib.sha256(pago.comprobante.name.encode("utf-8")).hexdigest() + ".pdf"
+            for pago in (viejo, medio, nuevo)
+        }
+        self._adjuntar(viejo)
+        self._adjuntar(medio)
+        os.utime(os.path.join(self.cache_dir, en_cache[viejo.pk]), (1000, 1000))
+        os.utime(os.path.join(self.cache_dir, en_cache[medio.pk]), (2000, 2000))
+        # Reenviar "viejo" lo marca como recien usado; al llegar "nuevo" sale "medio".
+        self._adjuntar(viejo)
+        self._adjuntar(nuevo)
+        self.assertEqual(self._en_cache(), sorted([en_cache[viejo.pk], en_cache[nuevo.pk]]))
+
+    def test_archivo_mayor_que_la_cache_no_se_guarda(self):
+        pago = self._pago(b"%PDF-1.4 " + b"z" * 40)
+        mensaje = self._adjuntar(pago)
+        self.assertEqual(mensaje.get_payload()[1].get_payload(decode=True), b"%PDF-1.4 " + b"z" * 40)
+        self.assertEqual(self._en_cache(), [])
+
+
+class MediaStorageUrlCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.storage = MediaStorage(
+            bucket_name="cartera-test",
+            access_key="test",
+            secret_key="test",
+            region_name="us-east-1",
+            signature_version="s3v4",
+            querystring_expire=3600,
+        )
+        cliente = self.storage.connection.meta.client
+        patcher = mock.patch.object(cliente, "generate_presigned_url", wraps=cliente.generate_presigned_url)
+        self.firmar = patcher.start()
+        self.addCleanup(patcher.stop)
+        reloj = mock.patch("carterapro.storage_backends.time.monotonic", return_value=1000.0)
+        self.reloj = reloj.start()
+        self.addCleanup(reloj.stop)
+
+    def test_reutiliza_la_url_firmada_por_nombre(self):
+        url = self.storage.url("comprobantes/ab/abc.pdf")
+        self.assertIn("X-Amz-Signature=", url)
+        self.assertEqual(self.storage.url("comprobantes/ab/abc.pdf"), url)
+        self.assertEqual(self.firmar.call_count, 1)
+        self.assertNotEqual(self.storage.url("comprobantes/cd/cde.pdf"), url)
+        self.assertEqual(self.firmar.call_count, 2)
+
+    def test_vuelve_a_firmar_antes_de_que_expire(self):
+        self.storage.url("comprobantes/ab/abc.pdf")
+        self.reloj.return_value = 1000.0 + 3600 * 0.75 - 1
+        self.storage.url("comprobantes/ab/abc.pdf")
+        self.assertEqual(self.firmar.call_count, 1)
+        self.reloj.return_value = 1000.0 + 3600 * 0.75
+        self.storage.url("comprobantes/ab/abc.pdf")
+        self.assertEqual(self.firmar.call_count, 2)
+
+    def test_parametros_propios_no_usan_la_cache(self):
+        self.storage.url("comprobantes/ab/abc.pdf")
+        self.storage.url("comprobantes/ab/abc.pdf", expire=60)
+        self.storage.url("comprobantes/ab/abc.pdf", parameters={"ResponseContentDisposition": "attachment"})
+        self.assertEqual(self.firmar.call_count, 3)
+
+    def test_cache_acotada_saca_la_menos_usada(self):
+        self.storage.url_cache_size = 2
+        for nombre in ("a.pdf", "b.pdf", "a.pdf", "c.pdf"):
+            self.storage.url(nombre)
+        self.assertEqual(list(self.storage._urls), ["a.pdf", "c.pdf"])
+        self.storage.url("b.pdf")
+        self.assertEqual(self.firmar.call_count, 4)
+
+
+@override_settings(STORAGES=TEST_STORAGES, EMAIL_OUTBOX_MAX_INTENTOS=2, EMAIL_OUTBOX_BACKOFF_SEGUNDOS=60)
+class CorreoPendienteTests(CarteraBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("cartera.services.email_outbox._attach_fieldfile")
+        self.attach = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _pago(self, factura=None, **kwargs):
+        return Pago.objects.create(
+            factura=factura or self.factura,
+            fecha_pago=date(2026, 2, 5),
+            valor_pagado=Decimal("1000.00"),
+            pagado_por="OFICINA",
+            comprobante="comprobantes/test.pdf",
+            **kwargs,
+        )
+
+    def test_la_vista_encola_y_el_worker_envia(self):
+        pago = self._pago()
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse("pago_enviar_email", args=[pago.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        correo = CorreoPendiente.objects.get(pago=pago)
+        self.assertEqual(correo.estado, CorreoPendiente.ESTADO_PENDIENTE)
+        self.assertEqual(correo.solicitado_por, self.staff)
+
+        out = StringIO()
+        call_command("procesar_correos", stdout=out)
+        correo.refresh_from_db()
+        self.assertEqual(correo.estado, CorreoPendiente.ESTADO_ENVIADO)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["proveedor@example.com"])
+        self.assertIn("http://testserver/", mail.outbox[0].body)
+        log = CorreoEnvioLog.objects.get(pago=pago)
+        self.assertTrue(log.exito)
+        self.assertTrue(
+            EventoAuditoria.objects.filter(tipo=EventoAuditoria.TIPO_CORREO_ENVIADO, pago=pago, usuario=self.staff).exists()
+        )
+        self.assertIn("1 enviado(s)", out.getvalue())
+
+    def test_no_duplica_correo_pendiente(self):
+        pago = self._pago()
+        encolar_correo_pago(pago)
+        encolar_correo_pago(pago)
+        self.assertEqual(CorreoPendiente.objects.filter(pago=pago).count(), 1)
+
+    def test_una_conexion_por_lote(self):
+        for factura in (self.factura, self.other_factura):
+            encolar_correo_pago(self._pago(factura))
+        with mock.patch("cartera.services.email_outbox.get_connection", wraps=get_connection) as conexion:
+            resultado = procesar_correos_pendientes()
+        self.assertEqual(conexion.call_count, 1)
+        self.assertEqual(resultado, {"enviados": 2, "reintentos": 0, "fallidos": 0})
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_reintenta_con_espera_y_registra_fallo_final(self):
+        pago = self._pago()
+        correo = encolar_correo_pago(pago)
+        with mock.patch("cartera.utils.EmailMultiAlternatives.send", side_effect=OSError("smtp caido")):
+            self.assertEqual(procesar_correos_pendientes()["reintentos"], 1)
+            correo.refresh_from_db()
+            self.assertEqual(correo.estado, CorreoPendiente.ESTADO_PENDIENTE)
+            self.assertEqual(correo.intentos, 1)
+            self.assertGreater(correo.proximo_intento, timezone.now() + timedelta(seconds=50))
+            self.assertFalse(CorreoEnvioLog.objects.exists())
+            self.assertEqual(procesar_correos_pendientes()["reintentos"], 0)
+
+            CorreoPendiente.objects.filter(pk=correo.pk).update(proximo_intento=timezone.now())
+            self.assertEqual(procesar_correos_pendientes()["fallidos"], 1)
+        correo.refresh_from_db()
+        self.assertEqual(correo.estado, CorreoPendiente.ESTADO_FALLIDO)
+        log = CorreoEnvioLog.objects.get(pago=pago)
+        self.assertFalse(log.exito)
+        self.assertEqual(log.detalle, "smtp caido")
+
+    def test_correo_de_lote_registra_un_log_por_pago(self):
+        lote = PagoLote.objects.create(
+            proveedor=self.proveedor,
+            fecha_pago=date(2026, 2, 5),
+            pagado_por="OFICINA",
+            comprobante="comprobantes/lote.pdf",
+        )
+        pagos = [self._pago(factura, lote=lote) for factura in (self.factura, self.other_factura)]
+        ok, _info, motivo = enviar_correo_lote_si_aplica(None, lote)
+        self.assertTrue(ok)
+        self.assertEqual(motivo, "encolado")
+        self.assertEqual(procesar_correos_pendientes()["enviados"], 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(CorreoEnvioLog.objects.filter(lote=lote, exito=True).count(), len(pagos))
+
+
 @override_settings(STORAGES=TEST_STORAGES)
 class PortalProveedorTests(CarteraBaseTestCase):
     def setUp(self):
@@ -495,6 +2469,39 @@ class PortalProveedorTests(CarteraBaseTestCase):
         response = self.client.get(reverse("portal_proveedor_dashboard"))
         self.assertEqual(response.status_code, 403)
 
+    def test_portal_scope_se_resuelve_una_vez_por_request(self):
+        self.client.force_login(self.portal_user)
+        presupuesto = {
+            reverse("portal_proveedor_dashboard"): 11,
+            reverse("portal_proveedor_facturas"): 5,
+            reverse("portal_proveedor_pagos"): 5,
+            reverse("portal_proveedor_notificaciones"): 5,
+            reverse("portal_proveedor_factura_detail", args=[self.factura.pk]): 10,
+        }
+        for url, consultas in presupuesto.items():
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as ctx:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(ctx.captured_queries), consultas)
+                self.assertEqual(
+                    sum("cartera_proveedorusuario" in q["sql"] for q in ctx.captured_queries),
+                    1,
+                )
+
+    def test_portal_scope_resuelve_permisos_sin_consultas(self):
+        ProveedorUsuario.objects.create(user=self.portal_user_sin_permiso, proveedor=self.proveedor_b)
+        request = RequestFactory().get("/")
+        request.user = self.portal_user_sin_permiso
+        with self.assertNumQueries(1):
+            alcance = portal_scope(request)
+            self.assertIs(portal_scope(request), alcance)
+            self.assertEqual(alcance.proveedor_ids, [self.proveedor_b.pk, self.proveedor.pk])
+            self.assertFalse(user_can_confirm(alcance, self.proveedor))
+            self.assertTrue(user_can_confirm(alcance, self.proveedor_b))
+            facturas = facturas_visibles(alcance)
+        self.assertEqual(set(facturas), {self.factura, self.other_factura, self.factura_b})
+
     def test_staff_internal_dashboard_still_works(self):
         self.client.force_login(self.staff)
         response = self.client.get(reverse("dashboard"))
@@ -834,6 +2841,107 @@ class PortalProveedorTests(CarteraBaseTestCase):
         notif.refresh_from_db()
         self.assertTrue(notif.leida)
 
+    def test_contador_sigue_los_cambios_directos_de_notificaciones(self):
+        def no_leidas():
+            return resumen_notificaciones(self.portal_user).no_leidas
+
+        datos = {"usuario": self.portal_user, "proveedor": self.proveedor, "tipo": NotificacionProveedor.TIPO_SISTEMA}
+        notif = NotificacionProveedor.objects.create(titulo="Directa", **datos)
+        NotificacionProveedor.objects.create(titulo="Ya leida", leida=True, **datos)
+        self.assertEqual(no_leidas(), 1)
+        self.client.force_login(self.portal_user)
+        self.assertContains(self.client.get(reverse("portal_proveedor_dashboard")), "Notificaciones <strong>1</strong>")
+
+        notif = NotificacionProveedor.objects.get(pk=notif.pk)
+        notif.leida = True
+        notif.save()
+        self.assertEqual(no_leidas(), 0)
+        notif.leida = False
+        notif.save(update_fields=["leida"])
+        self.assertEqual(no_leidas(), 1)
+        notif.titulo = "Sin cambio de estado"
+        notif.save(update_fields=["titulo"])
+        self.assertEqual(no_leidas(), 1)
+        notif.delete()
+        self.assertEqual(no_leidas(), 0)
+
+        NotificacionProveedor.objects.bulk_create(
+            [NotificacionProveedor(titulo=f"Masiva {i}", leida=i == 0, **datos) for i in range(3)]
+        )
+        self.assertEqual(no_leidas(), 2)
+        NotificacionProveedor.objects.filter(titulo__startswith="Masiva").delete()
+        self.assertEqual(no_leidas(), 0)
+        self.assertEqual(diferencias_contadores(), [])
+
+    def test_comando_recalcular_notificaciones(self):
+        NotificacionProveedor.objects.create(
+            usuario=self.portal_user, proveedor=self.proveedor, tipo=NotificacionProveedor.TIPO_SISTEMA, titulo="N"
+        )
+        ContadorNotificaciones.objects.filter(usuario=self.portal_user).update(no_leidas=5)
+        with self.assertRaises(CommandError):
+            call_command("recalcular_notificaciones", "--check", stdout=StringIO())
+        salida = StringIO()
+        call_command("recalcular_notificaciones", stdout=salida)
+        self.assertIn("1 diferencia(s) corregida(s)", salida.getvalue())
+        self.assertEqual(resumen_notificaciones(self.portal_user).no_leidas, 1)
+        call_command("recalcular_notificaciones", "--check", stdout=StringIO())
+
+    def test_bell_usa_contador_y_snapshot_cacheado(self):
+        notificar_pago_registrado(self.pago)
+        self.client.force_login(self.portal_user)
+        response = self.client.get(reverse("portal_proveedor_notificaciones"))
+        self.assertContains(response, "Notificaciones <strong>1</strong>")
+        alcance = PortalScope(self.portal_user)
+        resumen = resumen_notificaciones(alcance)
+        with self.assertNumQueries(1):
+            self.assertEqual([n["titulo"] for n in resumen.ultimas()], ["Pago registrado para factura F-001"])
+        with self.assertNumQueries(0):
+            resumen.ultimas()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("portal_proveedor_notificaciones"))
+        self.assertFalse(any("COUNT(" in q["sql"] for q in ctx.captured_queries))
+
+        notificar_confirmacion(proveedor=self.proveedor, usuario_actor=self.portal_user, factura=self.factura, pago=self.pago)
+        resumen = resumen_notificaciones(alcance)
+        self.assertEqual(resumen.no_leidas, 2)
+        self.assertEqual(resumen.ultimas()[0]["titulo"], "Pago confirmado")
+
+    def test_contador_respeta_vinculos_activos(self):
+        ProveedorUsuario.objects.create(user=self.portal_user, proveedor=self.proveedor_b)
+        notificar_pago_registrado(self.pago)
+        notificar_pago_registrado(self.pago_b)
+        self.assertEqual(resumen_notificaciones(self.portal_user).no_leidas, 2)
+        ProveedorUsuario.objects.filter(user=self.portal_user, proveedor=self.proveedor_b).update(activo=False)
+        resumen = resumen_notificaciones(self.portal_user)
+        self.assertEqual(resumen.no_leidas, 1)
+        self.assertEqual([n["proveedor_id"] for n in resumen.ultimas()], [self.proveedor.pk])
+
+    def test_marcar_todas_leidas_usa_un_update_y_una_escritura_de_auditoria(self):
+        for i in range(4):
+            crear_notificacion(usuario=self.portal_user, proveedor=self.proveedor, tipo=NotificacionProveedor.TIPO_SISTEMA, titulo=f"N{i}", pago=self.pago)
+        ajena = crear_notificacion(usuario=self.portal_user_sin_permiso, proveedor=self.proveedor, tipo=NotificacionProveedor.TIPO_SISTEMA, titulo="Ajena")
+        alcance = PortalScope(self.portal_user)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(marcar_todas_leidas(alcance), 4)
+        sql = [q["sql"] for q in ctx.captured_queries]
+        self.assertEqual(sum(q.startswith('UPDATE "cartera_notificacionproveedor"') for q in sql), 1)
+        self.assertEqual(sum(q.startswith('INSERT INTO "cartera_eventoauditoria"') for q in sql), 1)
+        self.assertFalse(NotificacionProveedor.objects.filter(usuario=self.portal_user, leida=False).exists())
+        ajena.refresh_from_db()
+        self.assertFalse(ajena.leida)
+        self.assertEqual(resumen_notificaciones(alcance).no_leidas, 0)
+        eventos = EventoAuditoria.objects.filter(tipo=EventoAuditoria.TIPO_NOTIFICACION_LEIDA, usuario=self.portal_user)
+        self.assertEqual(eventos.count(), 4)
+        self.assertTrue(all(e.pago_id == self.pago.pk for e in eventos))
+        self.assertEqual(marcar_todas_leidas(alcance), 0)
+
+    def test_vista_marcar_todas_leidas(self):
+        notificar_pago_registrado(self.pago)
+        self.client.force_login(self.portal_user)
+        response = self.client.post(reverse("portal_proveedor_notificaciones_leer_todas"))
+        self.assertRedirects(response, reverse("portal_proveedor_notificaciones"), fetch_redirect_response=False)
+        self.assertFalse(NotificacionProveedor.objects.filter(usuario=self.portal_user, leida=False).exists())
+
     def test_notification_external_url_is_not_redirected(self):
         notif = NotificacionProveedor.objects.create(
             usuario=self.portal_user,
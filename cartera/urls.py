@@ -20,13 +20,16 @@ urlpatterns = [
     path("portal-proveedor/pagos/<int:pk>/novedad/", provider_views.PortalPagoNovedadView.as_view(), name="portal_proveedor_pago_novedad"),
     path("portal-proveedor/lotes/<int:pk>/novedad/", provider_views.PortalLoteNovedadView.as_view(), name="portal_proveedor_lote_novedad"),
     path("portal-proveedor/notificaciones/", provider_views.PortalNotificacionListView.as_view(), name="portal_proveedor_notificaciones"),
+    path("portal-proveedor/notificaciones/leer-todas/", provider_views.PortalNotificacionLeerTodasView.as_view(), name="portal_proveedor_notificaciones_leer_todas"),
     path("portal-proveedor/notificaciones/<int:pk>/leer/", provider_views.PortalNotificacionLeerView.as_view(), name="portal_proveedor_notificacion_leer"),
     path("portal-proveedor/comprobantes/<int:pago_id>/", provider_views.PortalComprobanteView.as_view(), name="portal_proveedor_comprobante"),
     path("", views.DashboardView.as_view(), name="dashboard"),
     path("facturas/nueva/", views.FacturaCreateView.as_view(), name="factura_create"),
+    path("facturas/importar/", views.FacturaImportView.as_view(), name="factura_import"),
     path("facturas/pendientes/", views.facturas_pendientes_view, name="facturas_pendientes"),
     path("facturas/pagadas/", views.pagos_list_view, name="pagos_list"),
     path("facturas/todas/", views.facturas_todas_view, name="facturas_todas"),
+    path("facturas/exportar/<str:listado>/", views.facturas_export_view, name="facturas_export"),
     path("facturas/<int:pk>/", views.FacturaDetalleView.as_view(), name="factura_detalle"),
     path("facturas/<int:pk>/editar/", views.FacturaUpdateView.as_view(), name="factura_update"),
     path("facturas/<int:pk>/pagar/", views.PagoCreateView.as_view(), name="pago_create"),
@@ -2,7 +2,6 @@ import mimetypes
 import os
 
 from django.conf import settings
-from django.core.files.storage import FileSystemStorage
 from django.core.mail import EmailMultiAlternatives
 from django.core.signing import BadSignature, SignatureExpired, TimestampSigner
 from django.template.loader import render_to_string
@@ -10,6 +9,7 @@ from django.urls import reverse
 from django.utils.html import strip_tags
 
 from .models import CorreoEnvioLog, EventoAuditoria, PagoLote
+from .services.attachments import abrir_comprobante, adjunto_mime
 
 signer = TimestampSigner()
 
@@ -48,18 +48,11 @@ def _attach_fieldfile(email, ff):
     filename = os.path.basename(ff.name)
     mime, _ = mimetypes.guess_type(filename)
     mime = mime or "application/octet-stream"
-    if isinstance(getattr(ff, "storage", None), FileSystemStorage):
-        email.attach_file(ff.path, mimetype=mime)
-    else:
-        ff.open("rb")
-        try:
-            content = ff.read()
-        finally:
-            ff.close()
-        email.attach(filename, content, mime)
-
-
-def _log_envio(*, tipo, factura=None, pago=None, lote=None, enviado_a="", asunto="", exito=False, detalle="", request=None):
+    with abrir_comprobante(ff) as fh:
+        email.attach(adjunto_mime(fh, filename, mime))
+
+
+def _log_envio(*, tipo, factura=None, pago=None, lote=None, enviado_a="", asunto="", exito=False, detalle="", request=None, usuario=None):
     CorreoEnvioLog.objects.create(
         tipo=tipo,
         factura=factura,
@@ -77,6 +70,7 @@ def _log_envio(*, tipo, factura=None, pago=None, lote=None, enviado_a="", asunto
         factura=factura,
         pago=pago,
         lote=lote,
+        usuario=usuario,
         request=request,
         metadata={
             "tipo": tipo,
@@ -91,18 +85,20 @@ def _log_envio(*, tipo, factura=None, pago=None, lote=None, enviado_a="", asunto
     notificar_correo_enviado(factura=factura, pago=pago, lote=lote, request=request, exito=bool(exito))
 
 
-def enviar_recibo_pago(request, pago):
+def _base_url(request=None):
+    if request:
+        return request.build_absolute_uri("/").rstrip("/")
+    return settings.SITE_URL.rstrip("/")
+
+
+def construir_recibo_pago(pago, *, base_url=None):
+    """Arma el correo de recibo de un pago; devuelve (email, destinatario, asunto)."""
     factura = pago.factura
     proveedor = factura.proveedor
     destinatario = (proveedor.email or "").strip()
-    if not destinatario:
-        return False, "Proveedor sin email"
-    if not (pago.comprobante and pago.comprobante.name):
-        return False, "Pago sin comprobante"
 
     token = firmar_token(pago.id)
-    path_rel = reverse("pago_confirmar", args=[token])
-    confirm_url = request.build_absolute_uri(path_rel) if request else settings.SITE_URL.rstrip("/") + path_rel
+    confirm_url = (base_url or _base_url()) + reverse("pago_confirmar", args=[token])
     static_base = settings.SITE_URL.rstrip("/") + settings.STATIC_URL
     logo_url = static_base + "cartera/img/logo-email.png"
     saldo_restante = max((factura.valor_factura or 0) - (factura.total_pagado or 0), 0)
@@ -129,31 +125,18 @@ def enviar_recibo_pago(request, pago):
         to=[destinatario],
     )
     email.attach_alternative(cuerpo_html, "text/html")
-
-    try:
-        _attach_fieldfile(email, pago.comprobante)
-        email.send(fail_silently=False)
-        _log_envio(tipo="individual", factura=factura, pago=pago, enviado_a=destinatario, asunto=asunto, exito=True, detalle="Enviado", request=request)
-        return True, "Enviado"
-    except Exception as e:
-        _log_envio(tipo="individual", factura=factura, pago=pago, enviado_a=destinatario, asunto=asunto, exito=False, detalle=str(e), request=request)
-        return False, f"Error adjuntando o enviando el comprobante: {e}"
+    return email, destinatario, asunto
 
 
-def enviar_recibo_lote(request, lote: PagoLote):
+def construir_recibo_lote(lote: PagoLote, pagos, *, base_url=None):
+    """Arma el correo de recibo de un lote; devuelve (email, destinatario, asunto)."""
     proveedor = lote.proveedor
     destinatario = (proveedor.email or "").strip()
-    if not destinatario:
-        return False, "Proveedor sin email"
-    if not (lote.comprobante and lote.comprobante.name):
-        return False, "Lote sin comprobante"
 
     token = firmar_token_lote(lote.id)
-    path_rel = reverse("pago_lote_confirmar", args=[token])
-    confirm_url = request.build_absolute_uri(path_rel) if request else settings.SITE_URL.rstrip("/") + path_rel
+    confirm_url = (base_url or _base_url()) + reverse("pago_lote_confirmar", args=[token])
     static_base = settings.SITE_URL.rstrip("/") + settings.STATIC_URL
     logo_url = static_base + "cartera/img/logo-email.png"
-    pagos = list(lote.pagos.select_related("factura", "factura__punto_venta").all())
     facturas = [p.factura for p in pagos]
     total = sum((f.valor_factura or 0) for f in facturas)
     ctx = {
@@ -178,14 +161,5 @@ def enviar_recibo_lote(request, lote: PagoLote):
         to=[destinatario],
     )
     email.attach_alternative(cuerpo_html, "text/html")
+    return email, destinatario, asunto
 
-    try:
-        _attach_fieldfile(email, lote.comprobante)
-        email.send(fail_silently=False)
-        for pago in pagos:
-            _log_envio(tipo="lote", factura=pago.factura, pago=pago, lote=lote, enviado_a=destinatario, asunto=asunto, exito=True, detalle="Enviado", request=request)
-        return True, "Enviado"
-    except Exception as e:
-        for pago in pagos:
-            _log_envio(tipo="lote", factura=pago.factura, pago=pago, lote=lote, enviado_a=destinatario, asunto=asunto, exito=False, detalle=str(e), request=request)
-        return False, f"Error adjuntando o enviando el comprobante: {e}"
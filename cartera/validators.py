@@ -14,12 +14,49 @@ SAFE_COMPROBANTE_CONTENT_TYPES = {
     "image/heif",
 }
 DEFAULT_MAX_COMPROBANTE_SIZE = 10 * 1024 * 1024
+COMPROBANTE_CABECERA_BYTES = 32
+# Marcas ISO-BMFF (bytes 8 a 12, tras "ftyp") de las fotos HEIC/HEIF de celular.
+_MARCAS_HEIC = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis"}
+_MARCAS_HEIF = {b"mif1", b"msf1"}
 
 
 def max_comprobante_size():
     return int(getattr(settings, "COMPROBANTE_MAX_UPLOAD_SIZE", DEFAULT_MAX_COMPROBANTE_SIZE))
 
 
+def tipo_real_comprobante(cabecera):
+    """Tipo de contenido segun los primeros bytes del archivo, o None si no es un PDF ni una imagen permitida."""
+    cabecera = bytes(cabecera or b"")
+    if cabecera.startswith(b"%PDF-"):
+        return "application/pdf"
+    if cabecera.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if cabecera.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return "image/webp"
+    if cabecera[4:8] == b"ftyp":
+        if cabecera[8:12] in _MARCAS_HEIC:
+            return "image/heic"
+        if cabecera[8:12] in _MARCAS_HEIF:
+            return "image/heif"
+    return None
+
+
+def leer_cabecera(archivo, tamano=COMPROBANTE_CABECERA_BYTES):
+    """Primeros bytes de un archivo recien subido, dejando la posicion como estaba; None si ya esta guardado."""
+    if getattr(archivo, "_committed", False):
+        return None
+    try:
+        posicion = archivo.tell()
+        archivo.seek(0)
+        cabecera = archivo.read(tamano)
+        archivo.seek(posicion)
+    except (AttributeError, OSError, ValueError):
+        return None
+    return cabecera
+
+
 def validate_comprobante_file(uploaded_file):
     if not uploaded_file:
         return
@@ -45,3 +82,9 @@ def validate_comprobante_file(uploaded_file):
     content_type = (getattr(uploaded_file, "content_type", "") or "").split(";", 1)[0].strip().lower()
     if content_type and content_type not in SAFE_COMPROBANTE_CONTENT_TYPES:
         raise ValidationError("El tipo de archivo del comprobante no coincide con un PDF o imagen segura.")
+
+    cabecera = leer_cabecera(uploaded_file)
+    if cabecera is not None:
+        tipo_real = tipo_real_comprobante(cabecera)
+        if tipo_real is None or (extension == ".pdf") != (tipo_real == "application/pdf"):
+            raise ValidationError("El contenido del comprobante no corresponde a un PDF o imagen válida.")
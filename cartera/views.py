@@ -1,40 +1,59 @@
+import io
 import json
-from calendar import monthrange
-from datetime import date, datetime, timedelta
-from decimal import Decimal, InvalidOperation
+from datetime import date, datetime
+from decimal import Decimal
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import ValidationError
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db import transaction
-from django.db.models import Count, F, Prefetch, Q, Sum
-from django.db.models.functions import TruncMonth
-from django.http import HttpResponseRedirect
+from django.db.models import BooleanField, Count, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.http import Http404, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
-from django.utils.dateparse import parse_date
+from django.utils.dateparse import parse_date, parse_datetime
 from django.views.generic import CreateView, DetailView, TemplateView, UpdateView, View
-from rest_framework import filters, permissions, viewsets
+from rest_framework import filters, permissions, status, viewsets
+from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied as DRFPermissionDenied
 from rest_framework.exceptions import ValidationError as DRFValidationError
+from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .forms import FacturaForm, PagoComprobanteForm, PagoForm, PagoLoteForm
+from .forms import FacturaForm, FacturaImportForm, PagoComprobanteForm, PagoForm, PagoLoteForm
 from .models import CorreoEnvioLog, EventoAuditoria, Factura, PAGO_LOTE_MONOPROVEEDOR_ERROR, Pago, PagoLote, Proveedor, PuntoVenta
+from .pagination import keyset_paginate
 from .scoping import ensure_user_scope, get_user_pdv, is_global_user, scoped_facturas, scoped_pagos
-from .serializers import FacturaSerializer, PagoSerializer, ProveedorSerializer
-from .services.invoices import guardar_factura_desde_form
+from .serializers import (
+    FACTURA_API_COLUMNAS,
+    PAGO_API_COLUMNAS,
+    ContextoMasivo,
+    FacturaSerializer,
+    PagoSerializer,
+    ProveedorSerializer,
+    campos_solicitados,
+    facturas_para_api,
+    pagos_para_api,
+)
+from .services.analytics import invalidar_analitica, obtener_analitica, rango_por_defecto
+from .services.balances import saldos_visibles
+from .services.exports import ENCABEZADOS_FACTURAS, filas_facturas, stream_csv, stream_xlsx
+from .services.imports import importar_facturas
+from .services.invoices import eliminar_factura, guardar_factura_desde_form
 from .services.payments import (
     confirmar_factura,
     confirmar_lote,
     crear_pago,
+    crear_pagos_lote,
     eliminar_pago_seguro,
     enviar_correo_lote_si_aplica,
     enviar_correo_pago_si_aplica,
 )
+from .services.previews import vistas_previas
+from .services.search import buscar_facturas
 from .utils import validar_token, validar_token_lote
 from .templatetags.formatting import motivo_novedad
 
@@ -50,21 +69,6 @@ def _d(value, fallback):
         return fallback
 
 
-def _month_bounds(today: date):
-    first = date(today.year, today.month, 1)
-    last = date(today.year, today.month, monthrange(today.year, today.month)[1])
-    return first, last
-
-
-def _safe_div(num, den):
-    try:
-        if not den or den == 0:
-            return Decimal("0")
-        return (Decimal(num) / Decimal(den)) * Decimal("100")
-    except (InvalidOperation, ZeroDivisionError, TypeError):
-        return Decimal("0")
-
-
 def _es_contado_por_notas(pago):
     n = (pago.notas or "").lower()
     return "auto-generado" in n
@@ -161,48 +165,68 @@ def _base_factura_filters(request, qs, include_estado=None):
 
     if q:
         decimal_q = _parse_decimal_search(q)
-        q_filter = (
-            Q(numero_factura__icontains=q)
-            | Q(proveedor__nombre__icontains=q)
-            | Q(proveedor__nit__icontains=q)
-            | Q(punto_venta__nombre__icontains=q)
-        )
-        if decimal_q is not None:
-            q_filter |= Q(valor_factura=decimal_q) | Q(total_pagado=decimal_q)
-        qs = qs.filter(q_filter)
+        por_valor = Q(valor_factura=decimal_q) | Q(total_pagado=decimal_q) if decimal_q is not None else None
+        return buscar_facturas(qs, q, tambien=por_valor, ordenar=True).order_by("-relevancia", "-fecha_factura", "-id")
 
     return qs.order_by("-fecha_factura", "-id")
 
 
 def _paginate(request, qs, per_page=50):
-    paginator = Paginator(qs, per_page)
-    page = request.GET.get("page")
-    try:
-        items = paginator.page(page)
-    except PageNotAnInteger:
-        items = paginator.page(1)
-    except EmptyPage:
-        items = paginator.page(paginator.num_pages)
-    return items
+    # Con busqueda el orden empieza por la relevancia; la paginacion sigue el orden del queryset.
+    return keyset_paginate(request, qs, per_page, tuple(qs.query.order_by) or ("-fecha_factura", "-id"), with_count=True)
+
+
+def _annotate_factura_listing(qs):
+    """Anota cantidad de pagos, fecha del ultimo pago y si la factura aun se puede editar o pagar."""
+    pagos = Pago.objects.filter(factura=OuterRef("pk")).order_by()
+    return qs.annotate(
+        pagos_count=Coalesce(Subquery(pagos.values("factura").annotate(n=Count("pk")).values("n")[:1]), 0),
+        fecha_ultimo_pago=Subquery(pagos.order_by("-fecha_pago", "-id").values("fecha_pago")[:1]),
+    ).annotate(
+        es_editable=ExpressionWrapper(
+            Q(estado="pendiente", confirmado_pago=False, pagos_count=0),
+            output_field=BooleanField(),
+        ),
+    )
+
+
+SALDO_RESUMEN_UNSUPPORTED_FILTERS = ("q", "confirmacion", "mes", "anio", "desde", "hasta")
 
 
-def _attach_payment_dates(facturas):
-    for factura in facturas:
-        pagos = getattr(factura, "pagos_ordenados", None)
-        pago = pagos[0] if pagos else factura.pagos.order_by("-fecha_pago", "-id").first()
-        factura.fecha_pago_mostrada = pago.fecha_pago if pago else None
-    return facturas
+def _resumen_saldos(saldos):
+    return (
+        saldos.values("proveedor__id", "proveedor__nombre")
+        .annotate(facturas=Sum("facturas"), total=Sum(F("valor_total") - F("total_pagado")))
+    )
+
+
+def _resumen_desde_saldos(request, include_estado=None):
+    if any((request.GET.get(name) or "").strip() for name in SALDO_RESUMEN_UNSUPPORTED_FILTERS):
+        return None
+    prov = (request.GET.get("prov") or "").strip()
+    pdv = (request.GET.get("pdv") or "").strip()
+    estado = include_estado or (request.GET.get("estado") or "").strip()
+    saldos = saldos_visibles(punto_venta=ensure_user_scope(request.user))
+    if estado in {"pendiente", "pagada"}:
+        saldos = saldos.filter(estado=estado)
+    if prov.isdigit():
+        saldos = saldos.filter(proveedor_id=int(prov))
+    if pdv.isdigit() and is_global_user(request.user):
+        saldos = saldos.filter(punto_venta_id=int(pdv))
+    return list(_resumen_saldos(saldos).order_by("proveedor__nombre"))
 
 
 def _factura_listing_context(request, qs, title, include_estado=None, show_estado_filter=True, show_confirm_filter=False, template_tab=""):
     qs = _base_factura_filters(request, qs, include_estado=include_estado)
-    page_obj = _paginate(request, qs, per_page=50)
-    resumen_por_proveedor = (
-        qs.values("proveedor__id", "proveedor__nombre")
-        .annotate(facturas=Count("id"), total=Sum(F("valor_factura") - F("total_pagado")))
-        .order_by("proveedor__nombre")
-    )
-    total_general = qs.aggregate(t=Sum(F("valor_factura") - F("total_pagado")))["t"] or 0
+    page_obj = _paginate(request, _annotate_factura_listing(qs), per_page=50)
+    resumen_por_proveedor = _resumen_desde_saldos(request, include_estado=include_estado)
+    if resumen_por_proveedor is None:
+        resumen_por_proveedor = list(
+            qs.values("proveedor__id", "proveedor__nombre")
+            .annotate(facturas=Count("id"), total=Sum(F("valor_factura") - F("total_pagado")))
+            .order_by("proveedor__nombre")
+        )
+    total_general = sum((r["total"] or 0) for r in resumen_por_proveedor)
     proveedores = Proveedor.objects.order_by("nombre")
     pdvs = PuntoVenta.objects.order_by("nombre") if is_global_user(request.user) else []
     anios = list(scoped_facturas(request.user).dates("fecha_factura", "year", order="DESC"))
@@ -239,17 +263,14 @@ class DashboardView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        qs = scoped_facturas(self.request.user).filter(estado="pendiente")
-        ctx["total_pendiente"] = qs.aggregate(total=Sum(F("valor_factura") - F("total_pagado")))["total"] or 0
-        ctx["pendientes_count"] = qs.count()
-        resumen_qs = (
-            qs.values("proveedor__id", "proveedor__nombre")
-            .annotate(facturas=Count("id"), total=Sum(F("valor_factura") - F("total_pagado")))
-            .order_by("-total", "proveedor__nombre")
-        )
-        ctx["resumen_por_proveedor"] = resumen_qs
-        ctx["proveedores_con_saldo"] = resumen_qs.count()
-        ctx["total_resumen_proveedor"] = sum((r["total"] or 0) for r in resumen_qs)
+        saldos = saldos_visibles(punto_venta=ensure_user_scope(self.request.user)).filter(estado="pendiente")
+        resumen = list(_resumen_saldos(saldos).order_by("-total", "proveedor__nombre"))
+        total = sum((r["total"] or 0) for r in resumen)
+        ctx["total_pendiente"] = total
+        ctx["pendientes_count"] = sum(r["facturas"] for r in resumen)
+        ctx["resumen_por_proveedor"] = resumen
+        ctx["proveedores_con_saldo"] = len(resumen)
+        ctx["total_resumen_proveedor"] = total
         return ctx
 
 
@@ -269,15 +290,8 @@ def facturas_pendientes_view(request):
 
 @login_required
 def pagos_list_view(request):
-    qs = _base_factura_filters(
-        request,
-        scoped_facturas(request.user)
-        .filter(estado="pagada")
-        .prefetch_related(Prefetch("pagos", queryset=Pago.objects.order_by("-fecha_pago", "-id"), to_attr="pagos_ordenados")),
-        include_estado="pagada",
-    )
-    page_obj = _paginate(request, qs, per_page=50)
-    _attach_payment_dates(page_obj.object_list)
+    qs = _base_factura_filters(request, scoped_facturas(request.user).filter(estado="pagada"), include_estado="pagada")
+    page_obj = _paginate(request, _annotate_factura_listing(qs), per_page=50)
     proveedores = Proveedor.objects.order_by("nombre")
     pdvs = PuntoVenta.objects.order_by("nombre") if is_global_user(request.user) else []
     anios = list(scoped_facturas(request.user).dates("fecha_factura", "year", order="DESC"))
@@ -321,6 +335,33 @@ def facturas_todas_view(request):
     return render(request, "cartera/facturas_list.html", ctx)
 
 
+FACTURA_EXPORTS = {
+    "facturas_pendientes": "pendiente",
+    "pagos_list": "pagada",
+    "facturas_todas": None,
+}
+
+
+@login_required
+def facturas_export_view(request, listado):
+    if listado not in FACTURA_EXPORTS:
+        raise Http404("Listado no disponible para exportar.")
+    formato = (request.GET.get("formato") or "csv").strip().lower()
+    qs = _base_factura_filters(request, scoped_facturas(request.user), include_estado=FACTURA_EXPORTS[listado])
+    filas = filas_facturas(_annotate_factura_listing(qs))
+    nombre = f"{listado}_{timezone.localdate():%Y%m%d}"
+    if formato == "xlsx":
+        response = StreamingHttpResponse(
+            stream_xlsx(ENCABEZADOS_FACTURAS, filas),
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+        response["Content-Disposition"] = f'attachment; filename="{nombre}.xlsx"'
+    else:
+        response = StreamingHttpResponse(stream_csv(ENCABEZADOS_FACTURAS, filas), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="{nombre}.csv"'
+    return response
+
+
 class FacturaDetalleView(LoginRequiredMixin, DetailView):
     model = Factura
     template_name = "cartera/factura_detalle.html"
@@ -335,7 +376,7 @@ class FacturaDetalleView(LoginRequiredMixin, DetailView):
                 messages.error(request, "Solo se pueden eliminar facturas pendientes sin pago ni confirmación.")
                 return redirect("factura_detalle", pk=self.object.pk)
             numero = self.object.numero_factura
-            self.object.delete()
+            eliminar_factura(self.object)
             messages.success(request, f"Factura {numero} eliminada correctamente.")
             return redirect("facturas_pendientes")
         return HttpResponseRedirect(self.request.path)
@@ -344,6 +385,9 @@ class FacturaDetalleView(LoginRequiredMixin, DetailView):
         ctx = super().get_context_data(**kwargs)
         factura = self.object
         pagos = list(factura.pagos.select_related("lote").all())
+        derivados = vistas_previas(p.comprobante.name for p in pagos)
+        for p in pagos:
+            p.comprobante_derivado = derivados.get(p.comprobante.name)
         es_pago_contado = any(_es_contado_por_notas(p) for p in pagos)
         email_logs = factura.logs_correo.order_by("-creado_en")
         envios_exitosos = email_logs.filter(exito=True).count()
@@ -383,13 +427,17 @@ class FacturaUpdateView(LoginRequiredMixin, UpdateView):
 
     def form_valid(self, form):
         factura = form.save(commit=False)
-        factura = guardar_factura_desde_form(
-            factura,
-            created=False,
-            usuario=self.request.user,
-            request=self.request,
-            auto_payment_note="Pago auto-generado al marcar la factura como PAGADA en edicion (contado en PDV).",
-        )
+        try:
+            factura = guardar_factura_desde_form(
+                factura,
+                created=False,
+                usuario=self.request.user,
+                request=self.request,
+                auto_payment_note="Pago auto-generado al marcar la factura como PAGADA en edicion (contado en PDV).",
+            )
+        except ValidationError as exc:
+            form.add_error(None, exc)
+            return self.form_invalid(form)
 
         messages.success(self.request, "Factura actualizada correctamente.")
         if factura.estado == "pagada":
@@ -420,13 +468,17 @@ class FacturaCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         factura = form.save(commit=False)
-        factura = guardar_factura_desde_form(
-            factura,
-            created=True,
-            usuario=self.request.user,
-            request=self.request,
-            auto_payment_note="Pago auto-generado al crear la factura como PAGADA (contado en PDV).",
-        )
+        try:
+            factura = guardar_factura_desde_form(
+                factura,
+                created=True,
+                usuario=self.request.user,
+                request=self.request,
+                auto_payment_note="Pago auto-generado al crear la factura como PAGADA (contado en PDV).",
+            )
+        except ValidationError as exc:
+            form.add_error(None, exc)
+            return self.form_invalid(form)
 
         messages.success(self.request, "Factura creada correctamente.")
         if factura.estado == "pagada":
@@ -439,6 +491,41 @@ class FacturaCreateView(LoginRequiredMixin, CreateView):
         return ctx
 
 
+class FacturaImportView(LoginRequiredMixin, View):
+    template_name = "cartera/factura_import.html"
+    max_errores_mostrados = 200
+
+    def get(self, request):
+        ensure_user_scope(request.user)
+        return render(request, self.template_name, {"form": FacturaImportForm()})
+
+    def post(self, request):
+        ensure_user_scope(request.user)
+        form = FacturaImportForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return render(request, self.template_name, {"form": form})
+        archivo = io.TextIOWrapper(form.cleaned_data["archivo"].file, encoding="utf-8-sig", newline="")
+        try:
+            resultado = importar_facturas(
+                archivo,
+                usuario=request.user,
+                request=request,
+                confirmar_valores_altos=form.cleaned_data["confirmar_valores_altos"],
+            )
+        except (ValidationError, UnicodeDecodeError) as exc:
+            form.add_error("archivo", getattr(exc, "messages", None) or "El archivo no está en UTF-8.")
+            return render(request, self.template_name, {"form": form})
+        if resultado.creadas:
+            messages.success(request, f"{resultado.creadas} factura(s) importada(s).")
+        if resultado.errores:
+            messages.warning(request, f"{len(resultado.errores)} fila(s) con errores no se importaron.")
+        return render(request, self.template_name, {
+            "form": FacturaImportForm(),
+            "resultado": resultado,
+            "errores": resultado.errores[: self.max_errores_mostrados],
+        })
+
+
 class PagoCreateView(LoginRequiredMixin, CreateView):
     model = Pago
     form_class = PagoForm
@@ -466,18 +553,18 @@ class PagoCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         pago_form = form.save(commit=False)
-        pago = crear_pago(
-            factura=self.factura,
-            fecha_pago=pago_form.fecha_pago or timezone.localdate(),
-            valor_pagado=self.factura.valor_factura,
-            pagado_por=pago_form.pagado_por,
-            comprobante=pago_form.comprobante,
-            notas=pago_form.notas,
-            usuario=self.request.user,
-            request=self.request,
-        )
-
-        ok, info, motivo = enviar_correo_pago_si_aplica(self.request, pago)
+        with transaction.atomic():
+            pago = crear_pago(
+                factura=self.factura,
+                fecha_pago=pago_form.fecha_pago or timezone.localdate(),
+                valor_pagado=self.factura.valor_factura,
+                pagado_por=pago_form.pagado_por,
+                comprobante=pago_form.comprobante,
+                notas=pago_form.notas,
+                usuario=self.request.user,
+                request=self.request,
+            )
+            ok, info, motivo = enviar_correo_pago_si_aplica(self.request, pago)
         if motivo == "contado":
             messages.success(self.request, "Pago registrado. No se envió correo porque corresponde a pago de contado.")
             return redirect("pagos_list")
@@ -497,7 +584,7 @@ class PagoCreateView(LoginRequiredMixin, CreateView):
             return redirect("pagos_list")
 
         if ok:
-            messages.success(self.request, "Pago registrado y correo enviado al proveedor.")
+            messages.success(self.request, "Pago registrado. El correo al proveedor quedó en cola de envío.")
         else:
             messages.warning(self.request, f"Pago registrado, pero el correo no se envió: {info}")
 
@@ -529,6 +616,7 @@ class PagoAdjuntarComprobanteView(LoginRequiredMixin, UpdateView):
             messages.error(self.request, "Debes seleccionar un archivo.")
             return self.form_invalid(form)
         form.save()
+        invalidar_analitica()
         messages.success(self.request, "Comprobante adjuntado correctamente.")
         return redirect("factura_detalle", pk=self.pago.factura.pk)
 
@@ -550,7 +638,7 @@ class PagoEnviarEmailView(LoginRequiredMixin, View):
             return redirect("factura_detalle", pk=pago.factura.id)
         ok, info, _motivo = enviar_correo_pago_si_aplica(request, pago)
         if ok:
-            messages.success(request, "Comprobante enviado al proveedor.")
+            messages.success(request, "El comprobante quedó en cola de envío al proveedor.")
         else:
             messages.error(request, f"No se envió: {info}")
         return redirect("factura_detalle", pk=pago.factura.id)
@@ -658,21 +746,19 @@ class PagoLoteCreateView(LoginRequiredMixin, View):
             lote.proveedor = prov
             lote.save()
             comp_name = lote.comprobante.name if getattr(lote, "comprobante", None) else None
-            for f in facturas:
-                crear_pago(
-                    factura=f,
-                    fecha_pago=lote.fecha_pago,
-                    valor_pagado=f.valor_factura or Decimal("0"),
-                    pagado_por=lote.pagado_por,
-                    lote=lote,
-                    notas=f"Pago perteneciente al Lote #{lote.id}.",
-                    comprobante=comp_name or None,
-                    usuario=request.user,
-                    request=request,
-                )
-        ok, info, _motivo = enviar_correo_lote_si_aplica(request, lote)
+            crear_pagos_lote(
+                lote=lote,
+                facturas=facturas,
+                fecha_pago=lote.fecha_pago,
+                pagado_por=lote.pagado_por,
+                notas=f"Pago perteneciente al Lote #{lote.id}.",
+                comprobante=comp_name or None,
+                usuario=request.user,
+                request=request,
+            )
+            ok, info, _motivo = enviar_correo_lote_si_aplica(request, lote)
         if ok:
-            messages.success(request, f"Lote #{lote.id} creado y correo enviado.")
+            messages.success(request, f"Lote #{lote.id} creado. El correo quedó en cola de envío.")
         else:
             messages.warning(request, f"Lote #{lote.id} creado, pero correo NO enviado: {info}")
         return redirect("pagos_list")
@@ -726,6 +812,129 @@ class ConfirmarPagoLoteView(View):
         }, status=200)
 
 
+# Acciones de solo lectura: usan querysets recortados a lo que serializan. Las escrituras cargan el modelo completo.
+API_ACCIONES_LECTURA = {"list", "retrieve"}
+MODIFIED_SINCE_PARAM = "modified_since"
+
+
+class SincronizacionApiMixin:
+    """
+    Listados de la API para sincronizar otros sistemas: se recorren por cursor en orden (creado_en, id)
+    y con `?modified_since=` solo traen lo modificado desde esa fecha, en orden (actualizado_en, id).
+    `?fields=` reduce la respuesta y las columnas consultadas.
+    """
+
+    columnas_api = {}
+
+    def optimizar_para_api(self, queryset, campos, extra):
+        raise NotImplementedError
+
+    def modificado_desde(self):
+        crudo = (self.request.query_params.get(MODIFIED_SINCE_PARAM) or "").strip()
+        if not crudo:
+            return None
+        # Un "+" sin codificar en el offset llega como espacio.
+        crudo = crudo.replace(" ", "+")
+        try:
+            momento = parse_datetime(crudo)
+            if momento is None:
+                fecha = parse_date(crudo)
+                momento = datetime.combine(fecha, datetime.min.time()) if fecha else None
+        except ValueError:
+            momento = None
+        if momento is None:
+            raise DRFValidationError({MODIFIED_SINCE_PARAM: ["Fecha invalida; usa ISO 8601, por ejemplo 2026-01-31T05:00:00Z."]})
+        if timezone.is_naive(momento):
+            momento = timezone.make_aware(momento)
+        return momento
+
+    def preparar_para_api(self, qs):
+        if self.action not in API_ACCIONES_LECTURA:
+            return qs
+        campos = campos_solicitados(self.request, self.columnas_api)
+        qs = self.optimizar_para_api(qs, campos, extra=(*self.ordering_fields, "creado_en", "actualizado_en"))
+        if self.action == "list":
+            desde = self.modificado_desde()
+            if desde is not None:
+                qs = qs.filter(actualizado_en__gte=desde).order_by("actualizado_en", "id")
+            else:
+                qs = qs.order_by("creado_en", "id")
+        return qs
+
+
+class BusquedaFacturasFilter(filters.SearchFilter):
+    """`?search=` de facturas sobre el indice de busqueda: filtra y, sin `?ordering=`, ordena por relevancia."""
+
+    def filter_queryset(self, request, queryset, view):
+        terminos = self.get_search_terms(request)
+        if not terminos:
+            return queryset
+        return buscar_facturas(queryset, " ".join(terminos), ordenar=True).order_by("-relevancia", "-id")
+
+
+API_BULK_MAX_ITEMS = 500
+
+
+class CargaMasivaApiMixin:
+    """
+    `POST bulk/` crea y `PATCH bulk/` actualiza (cada objeto con su "id") una lista de hasta
+    API_BULK_MAX_ITEMS objetos. Cada item se valida con el serializer de la vista, con las consultas
+    por item resueltas una vez para el lote; los validos se guardan juntos en una transaccion y la
+    respuesta trae un resultado por item, en el orden recibido.
+    """
+
+    def contexto_masivo(self, items, instancias):
+        raise NotImplementedError
+
+    @action(detail=False, methods=["post", "patch"], url_path="bulk")
+    def bulk(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise DRFValidationError({"non_field_errors": ["Envia una lista JSON con al menos un objeto."]})
+        if len(items) > API_BULK_MAX_ITEMS:
+            raise DRFValidationError({"non_field_errors": [f"Maximo {API_BULK_MAX_ITEMS} objetos por solicitud."]})
+        parcial = request.method == "PATCH"
+        instancias = {}
+        if parcial:
+            ids = [item.get("id") if isinstance(item, dict) else None for item in items]
+            instancias = self.get_queryset().in_bulk([pk for pk in ids if isinstance(pk, int) and not isinstance(pk, bool)])
+        contexto = {**self.get_serializer_context(), "masivo": self.contexto_masivo(items, instancias)}
+
+        resultados = []
+        validados = []
+        for indice, item in enumerate(items):
+            resultado = {"index": indice}
+            resultados.append(resultado)
+            if not isinstance(item, dict):
+                resultado.update(status="error", errors={"non_field_errors": ["Se esperaba un objeto."]})
+                continue
+            instancia = instancias.get(item.get("id")) if parcial else None
+            if parcial and instancia is None:
+                resultado.update(status="error", errors={"id": ["Objeto no encontrado."]})
+                continue
+            serializer = self.get_serializer(instancia, data=item, partial=parcial, context=contexto)
+            if serializer.is_valid():
+                validados.append((resultado, serializer))
+            else:
+                resultado.update(status="error", errors=serializer.errors)
+        if not validados:
+            return Response({"results": resultados}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            guardados = self.get_serializer_class().guardar_masivo([s for _r, s in validados], request=request)
+        # La respuesta se lee como en los listados: una consulta con las columnas que serializa.
+        lectura = self.optimizar_para_api(
+            self.get_queryset().filter(pk__in=[obj.pk for obj in guardados]), None, ()
+        ).in_bulk()
+        for (resultado, _serializer), obj in zip(validados, guardados):
+            resultado.update(
+                status="updated" if parcial else "created",
+                id=obj.pk,
+                data=self.get_serializer(lectura[obj.pk]).data,
+            )
+        return Response({"results": resultados}, status=status.HTTP_200_OK if parcial else status.HTTP_201_CREATED)
+
+
 class ProveedorViewSet(viewsets.ModelViewSet):
     queryset = Proveedor.objects.all().order_by("nombre", "id")
     serializer_class = ProveedorSerializer
@@ -745,31 +954,40 @@ class ProveedorViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         self._ensure_write_allowed()
         serializer.save()
+        invalidar_analitica()
 
     def perform_destroy(self, instance):
         self._ensure_write_allowed()
         instance.delete()
+        invalidar_analitica()
 
 
-class FacturaViewSet(viewsets.ModelViewSet):
+class FacturaViewSet(CargaMasivaApiMixin, SincronizacionApiMixin, viewsets.ModelViewSet):
     serializer_class = FacturaSerializer
+    columnas_api = FACTURA_API_COLUMNAS
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, BusquedaFacturasFilter, filters.OrderingFilter]
     filterset_fields = ["estado", "proveedor", "punto_venta", "fecha_factura"]
-    search_fields = ["numero_factura", "proveedor__nombre", "punto_venta__nombre"]
     ordering_fields = ["fecha_factura", "valor_factura", "creado_en"]
 
     def get_queryset(self):
-        return scoped_facturas(self.request.user)
+        return self.preparar_para_api(scoped_facturas(self.request.user))
+
+    def optimizar_para_api(self, queryset, campos, extra):
+        return facturas_para_api(queryset, campos, extra)
+
+    def contexto_masivo(self, items, instancias):
+        return ContextoMasivo.para_facturas(items, instancias)
 
     def perform_destroy(self, instance):
         if instance.estado != "pendiente" or instance.pagos.exists() or instance.confirmado_pago:
             raise DRFValidationError("Solo se pueden eliminar facturas pendientes sin pago ni confirmación.")
-        instance.delete()
+        eliminar_factura(instance)
 
 
-class PagoViewSet(viewsets.ModelViewSet):
+class PagoViewSet(CargaMasivaApiMixin, SincronizacionApiMixin, viewsets.ModelViewSet):
     serializer_class = PagoSerializer
+    columnas_api = PAGO_API_COLUMNAS
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ["fecha_pago", "pagado_por", "factura", "factura__proveedor"]
@@ -777,7 +995,13 @@ class PagoViewSet(viewsets.ModelViewSet):
     ordering_fields = ["fecha_pago", "valor_pagado", "creado_en"]
 
     def get_queryset(self):
-        return scoped_pagos(self.request.user)
+        return self.preparar_para_api(scoped_pagos(self.request.user))
+
+    def optimizar_para_api(self, queryset, campos, extra):
+        return pagos_para_api(queryset, campos, extra)
+
+    def contexto_masivo(self, items, instancias):
+        return ContextoMasivo.para_pagos(items, instancias)
 
     @transaction.atomic
     def perform_destroy(self, instance):
@@ -792,117 +1016,18 @@ def analytics_dashboard(request):
     today = date.today()
     pv_scope = None if is_global_user(request.user) else ensure_user_scope(request.user)
     rango = (request.GET.get("rango") or "").strip() or "mes_actual"
-    if rango == "mes_actual":
-        d1_def, d2_def = _month_bounds(today)
-    elif rango == "mes_anterior":
-        y = today.year if today.month > 1 else today.year - 1
-        m = today.month - 1 if today.month > 1 else 12
-        d1_def = date(y, m, 1)
-        d2_def = date(y, m, monthrange(y, m)[1])
-    elif rango == "ult_30":
-        d2_def = today
-        d1_def = today - timedelta(days=29)
-    elif rango == "este_anio":
-        d1_def, d2_def = date(today.year, 1, 1), today
-    elif rango == "anio_pasado":
-        d1_def, d2_def = date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
-    else:
-        d1_def, d2_def = _month_bounds(today)
+    d1_def, d2_def = rango_por_defecto(rango, today)
     if (request.GET.get("rango") or "") == "personalizado":
         d1 = _d(request.GET.get("d1"), d1_def)
         d2 = _d(request.GET.get("d2"), d2_def)
     else:
         d1, d2 = d1_def, d2_def
 
-    qs_base = Factura.objects.select_related("proveedor", "punto_venta").all()
     pdv = request.GET.get("pdv")
     prov = request.GET.get("prov")
     if pv_scope:
-        qs_base = qs_base.filter(punto_venta=pv_scope)
         pdv = str(pv_scope.id)
-    elif pdv and str(pdv).isdigit():
-        qs_base = qs_base.filter(punto_venta_id=int(pdv))
-    if prov and str(prov).isdigit():
-        qs_base = qs_base.filter(proveedor_id=int(prov))
-    qs_periodo = qs_base.filter(fecha_factura__range=[d1, d2])
-
-    agg = qs_periodo.aggregate(total=Sum("valor_factura"), cnt=Count("id"))
-    total_compras = agg["total"] or Decimal("0")
-    total_facturas = agg["cnt"] or 0
-    pagos_qs = Pago.objects.filter(factura__in=qs_periodo)
-    pagado = pagos_qs.aggregate(t=Sum("valor_pagado"))["t"] or Decimal("0")
-    pagos_para_dias = pagos_qs.select_related("factura").only("fecha_pago", "factura__fecha_factura")
-    dias_lista = []
-
-    for pago in pagos_para_dias:
-        if pago.fecha_pago and pago.factura and pago.factura.fecha_factura:
-            try:
-                dias_lista.append((pago.fecha_pago - pago.factura.fecha_factura).days)
-            except Exception:
-                pass
-
-    dias_prom = round(sum(dias_lista) / len(dias_lista), 1) if dias_lista else 0.0
-    pend_qs = Factura.objects.filter(estado="pendiente")
-    if pv_scope:
-        pend_qs = pend_qs.filter(punto_venta=pv_scope)
-    elif pdv and str(pdv).isdigit():
-        pend_qs = pend_qs.filter(punto_venta_id=int(pdv))
-    if prov and str(prov).isdigit():
-        pend_qs = pend_qs.filter(proveedor_id=int(prov))
-    valor_pendiente = pend_qs.aggregate(t=Sum(F("valor_factura") - F("total_pagado")))["t"] or Decimal("0")
-    num_pendientes = pend_qs.count()
-    hoy_dt = timezone.localdate()
-    if num_pendientes:
-        edades = [(hoy_dt - f.fecha_factura).days for f in pend_qs.only("fecha_factura")]
-        antig_prom_pend = round(sum(edades) / len(edades), 1)
-        ticket_prom_pend = (valor_pendiente / num_pendientes) if num_pendientes else 0
-    else:
-        antig_prom_pend = 0.0
-        ticket_prom_pend = 0.0
-    pct_pagado = _safe_div(pagado, total_compras)
-    total_pagos = pagos_qs.count() or 0
-    pagos_contado = pagos_qs.filter(notas__icontains="auto-generado").count()
-    pct_pagos_contado = _safe_div(pagos_contado, total_pagos)
-    fact_con_pago = qs_periodo.filter(pagos__isnull=False).distinct().count() or 0
-    fact_confirmadas = qs_periodo.filter(confirmado_pago=True).distinct().count() or 0
-    tasa_confirmacion = _safe_div(fact_confirmadas, fact_con_pago)
-    pagos_con_comp = pagos_qs.exclude(Q(comprobante__isnull=True) | Q(comprobante__exact="")).count()
-    cobertura_comprobantes = _safe_div(pagos_con_comp, total_pagos)
-    top_prov_agg = list(qs_periodo.values("proveedor__id", "proveedor__nombre").annotate(total=Sum("valor_factura")).order_by("-total")[:3])
-    top_total = sum((r["total"] or 0) for r in top_prov_agg) or Decimal("0")
-    share_top1 = _safe_div(top_prov_agg[0]["total"] if top_prov_agg else 0, total_compras)
-    share_top3 = _safe_div(top_total, total_compras)
-    if rango == "mes_actual":
-        y = today.year if today.month > 1 else today.year - 1
-        m = today.month - 1 if today.month > 1 else 12
-        prev_d1 = date(y, m, 1)
-        prev_d2 = date(y, m, monthrange(y, m)[1])
-        prev_qs = Factura.objects.select_related("proveedor", "punto_venta")
-        if pv_scope:
-            prev_qs = prev_qs.filter(punto_venta=pv_scope)
-        elif pdv and str(pdv).isdigit():
-            prev_qs = prev_qs.filter(punto_venta_id=int(pdv))
-        if prov and str(prov).isdigit():
-            prev_qs = prev_qs.filter(proveedor_id=int(prov))
-        prev_qs = prev_qs.filter(fecha_factura__range=[prev_d1, prev_d2])
-        prev_total = prev_qs.aggregate(t=Sum("valor_factura"))["t"] or Decimal("0")
-        delta_mes_ant = _safe_div(total_compras - prev_total, prev_total)
-        delta_monto = total_compras - prev_total
-    else:
-        delta_mes_ant = None
-        delta_monto = Decimal("0")
-    start_7 = timezone.now() - timedelta(days=7)
-    nuevas_7d = qs_base.filter(creado_en__gte=start_7).count()
-    top_prov = [{"id": r["proveedor__id"], "nombre": r["proveedor__nombre"], "total": r["total"]} for r in qs_periodo.values("proveedor__id", "proveedor__nombre").annotate(total=Sum("valor_factura")).order_by("-total")[:10]]
-    por_pdv = [{"id": r["punto_venta__id"], "nombre": r["punto_venta__nombre"], "total": r["total"]} for r in qs_periodo.values("punto_venta__id", "punto_venta__nombre").annotate(total=Sum("valor_factura")).order_by("-total")]
-    by_month_qs = qs_periodo.annotate(m=TruncMonth("fecha_factura")).values("m").annotate(total=Sum("valor_factura")).order_by("m")
-    by_month = []
-    for r in by_month_qs:
-        m = r["m"]
-        if isinstance(m, datetime):
-            m = m.date()
-        by_month.append({"m": m.isoformat(), "total": r["total"]})
-    top_facturas = list(qs_periodo.order_by("-valor_factura").values("id", "numero_factura", "fecha_factura", "proveedor__nombre", "punto_venta__nombre", "valor_factura")[:12])
+    analitica = obtener_analitica(d1=d1, d2=d2, rango=rango, pv_scope=pv_scope, pdv=pdv, prov=prov, today=today)
     pdvs = PuntoVenta.objects.order_by("nombre").values("id", "nombre") if is_global_user(request.user) else [{"id": pv_scope.id, "nombre": pv_scope.nombre}] if pv_scope else []
     provs = Proveedor.objects.order_by("nombre").values("id", "nombre")
     return render(request, "cartera/analytics_dashboard.html", {
@@ -917,30 +1042,9 @@ def analytics_dashboard(request):
         "pdvs": list(pdvs),
         "provs": list(provs),
 
-        "kpi_total": round(total_compras, 0),
-        "kpi_facturas": total_facturas,
-        "kpi_pagado": round(pagado, 0),
-        "kpi_dias": round(dias_prom, 1),
-        "kpi_valor_pendiente": round(valor_pendiente, 0),
-        "kpi_num_pendientes": num_pendientes,
-        "kpi_pct_pagado": round(pct_pagado, 1),
-        "kpi_pct_contado": round(pct_pagos_contado, 1),
-        "kpi_tasa_conf": round(tasa_confirmacion, 1),
-        "kpi_cob_comp": round(cobertura_comprobantes, 1),
-        "kpi_share_top1": round(share_top1, 1),
-        "kpi_share_top3": round(share_top3, 1),
-        "kpi_delta_mes_ant": round(delta_mes_ant, 1) if delta_mes_ant is not None else None,
-        "kpi_delta_monto": round(delta_monto, 0),
-        "kpi_nuevas_7d": nuevas_7d,
-        "kpi_antig_pend": antig_prom_pend,
-        "kpi_ticket_pend": round(ticket_prom_pend, 0),
-
-        "top_prov": top_prov,
-        "por_pdv": por_pdv,
-        "by_month": by_month,
-        "top_facturas": top_facturas,
-
-        "top_prov_json": json.dumps(top_prov, default=str),
-        "por_pdv_json": json.dumps(por_pdv, default=str),
-        "by_month_json": json.dumps(by_month, default=str),
+        **analitica,
+
+        "top_prov_json": json.dumps(analitica["top_prov"], default=str),
+        "por_pdv_json": json.dumps(analitica["por_pdv"], default=str),
+        "by_month_json": json.dumps(analitica["by_month"], default=str),
     })
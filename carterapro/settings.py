@@ -1,6 +1,7 @@
 from pathlib import Path
 import os
 import sys
+import tempfile
 
 import dj_database_url
 from django.core.exceptions import ImproperlyConfigured
@@ -87,9 +88,14 @@ EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "cartera@fogonylena.net")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
 EMAIL_FROM_NAME = os.getenv("EMAIL_FROM_NAME", "Cartera Fogón & Leña")
 DEFAULT_FROM_EMAIL = f"{EMAIL_FROM_NAME} <{EMAIL_HOST_USER}>"
+EMAIL_OUTBOX_MAX_INTENTOS = int(os.getenv("EMAIL_OUTBOX_MAX_INTENTOS", "5"))
+EMAIL_OUTBOX_BACKOFF_SEGUNDOS = int(os.getenv("EMAIL_OUTBOX_BACKOFF_SEGUNDOS", "60"))
 
 USE_S3_MEDIA = env_bool("USE_S3_MEDIA", False)
 COMPROBANTE_MAX_UPLOAD_SIZE = int(os.getenv("COMPROBANTE_MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))
+# Cache en disco de comprobantes descargados del storage para adjuntarlos a correos.
+COMPROBANTE_CACHE_DIR = os.getenv("COMPROBANTE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "cartera-comprobantes"))
+COMPROBANTE_CACHE_MAX_BYTES = int(os.getenv("COMPROBANTE_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
 
 INSTALLED_APPS = [
     "django.contrib.admin",
@@ -167,6 +173,31 @@ else:
     else:
         DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3"}}
 
+# locmem es por proceso: en produccion, con varios workers, la invalidacion de la analitica debe
+# llegar a todos, asi que el valor por defecto es la tabla de cache (build.sh corre createcachetable).
+CACHE_BACKEND = "locmem" if APP_ENV == "test" else os.getenv(
+    "CACHE_BACKEND", "db" if APP_ENV == "production" else "locmem"
+).strip().lower()
+if CACHE_BACKEND == "file":
+    CACHES = {"default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("CACHE_LOCATION", str(BASE_DIR / ".cache")),
+    }}
+elif CACHE_BACKEND in {"db", "database"}:
+    CACHES = {"default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": os.getenv("CACHE_LOCATION", "cartera_cache"),
+    }}
+elif CACHE_BACKEND == "locmem":
+    CACHES = {"default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "cartera",
+    }}
+else:
+    raise ImproperlyConfigured("CACHE_BACKEND debe ser locmem, file o db.")
+ANALYTICS_CACHE_TIMEOUT = int(os.getenv("ANALYTICS_CACHE_TIMEOUT", "300"))
+AUDITORIA_DIFERIDA = env_bool("AUDITORIA_DIFERIDA", APP_ENV != "test")
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME": "django.contrib.auth.password_validation.MinimumLengthValidator"},
@@ -198,6 +229,8 @@ if USE_S3_MEDIA:
     AWS_S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL")
     AWS_QUERYSTRING_AUTH = True
     AWS_QUERYSTRING_EXPIRE = int(os.getenv("AWS_QUERYSTRING_EXPIRE", "3600"))
+    # Las descargas mayores a esto se guardan en un temporal en disco y no en memoria.
+    AWS_S3_MAX_MEMORY_SIZE = int(os.getenv("AWS_S3_MAX_MEMORY_SIZE", str(1024 * 1024)))
     if REQUIRE_PRODUCTION_SETTINGS and not AWS_STORAGE_BUCKET_NAME:
         raise ImproperlyConfigured("AWS_STORAGE_BUCKET_NAME es obligatoria cuando USE_S3_MEDIA=true.")
     STORAGES["default"] = {"BACKEND": "carterapro.storage_backends.MediaStorage"}
@@ -217,7 +250,7 @@ REST_FRAMEWORK = {
         "rest_framework.filters.OrderingFilter",
         "rest_framework.filters.SearchFilter",
     ],
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    "DEFAULT_PAGINATION_CLASS": "cartera.pagination.ApiCursorPagination",
     "PAGE_SIZE": 100,
 }
 
@@ -1,11 +1,42 @@
 # carterapro/storage_backends.py
+import threading
+import time
+from collections import OrderedDict
+
 from storages.backends.s3boto3 import S3Boto3Storage
 
 class MediaStorage(S3Boto3Storage):
     """
     Almacena MEDIA en s3://<bucket>/media/ de forma privada.
     Django generará URLs firmadas temporalmente para acceder a los archivos.
+    Cada URL firmada se reutiliza por nombre durante las primeras tres cuartas partes de su vigencia
+    (AWS_QUERYSTRING_EXPIRE): los listados no vuelven a firmar cada comprobante y el navegador
+    puede cachear el archivo mientras la URL no cambia.
     """
     default_acl = None
     location = "media"
     file_overwrite = False
+    url_cache_ratio = 0.75
+    url_cache_size = 2048
+
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        self._urls = OrderedDict()
+        self._urls_lock = threading.Lock()
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        if parameters or expire is not None or http_method or not self.querystring_auth:
+            return super().url(name, parameters, expire, http_method)
+        ahora = time.monotonic()
+        with self._urls_lock:
+            guardada = self._urls.get(name)
+            if guardada and guardada[1] > ahora:
+                self._urls.move_to_end(name)
+                return guardada[0]
+        url = super().url(name)
+        with self._urls_lock:
+            self._urls[name] = (url, ahora + self.querystring_expire * self.url_cache_ratio)
+            self._urls.move_to_end(name)
+            while len(self._urls) > self.url_cache_size:
+                self._urls.popitem(last=False)
+        return url